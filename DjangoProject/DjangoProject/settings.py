@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
 import os
+import sys
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -53,6 +54,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "api.middleware.ServerTimingMiddleware",  # 需置于最前，总耗时覆盖其余中间件
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",  # 支持静态/媒体文件 Range 请求
     "corsheaders.middleware.CorsMiddleware",
@@ -62,8 +64,20 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "api.middleware.ReadPathWriteGuardMiddleware",  # 需置于末尾，只包裹视图
 ]
 
+# 是否在运行测试（manage.py test）
+TESTING = len(sys.argv) > 1 and sys.argv[1] == "test"
+
+# 读路径写保护：GET/HEAD/OPTIONS 请求中出现写 SQL 时 off 不检查 / log 记录 / raise 拒绝
+READ_PATH_WRITE_GUARD = os.environ.get("READ_PATH_WRITE_GUARD", "raise" if TESTING else "off")
+
+# 请求计时：输出 Server-Timing 响应头（SQL 次数/耗时、序列化、渲染、视图、总耗时），关闭时几乎零开销
+SERVER_TIMING = os.environ.get("SERVER_TIMING", "0") == "1"
+# 同时为每个请求写一行 JSON 日志（logger: api.timing）
+SERVER_TIMING_LOG = os.environ.get("SERVER_TIMING_LOG", "0") == "1"
+
 ROOT_URLCONF = "DjangoProject.urls"
 
 TEMPLATES = [
@@ -97,6 +111,75 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "moments-default",
+        "OPTIONS": {
+            "MAX_ENTRIES": 10000,  # 超出后按 LRU 淘汰
+        },
+    }
+}
+
+# 社交关系图（好友/关注/粉丝 ID 集合）缓存秒数
+SOCIAL_GRAPH_CACHE_TIMEOUT = 300
+
+# 首页时间线：单条动态最多写入的接收者数量（好友优先），新建关系时回填的动态条数
+TIMELINE_FANOUT_CAP = 5000
+TIMELINE_BACKFILL_POSTS = 20
+
+# 热门动态分片计数器：分片数（0 关闭），计数达到阈值后改写分片，由 fold_counter_shards 定期折叠
+POST_COUNTER_SHARDS = 0
+POST_COUNTER_HOT_THRESHOLD = 1000
+
+# 计数写入模式：sync 同步原子更新 / buffered 进程内写后缓冲，按间隔或事件数批量写回
+POST_COUNTER_WRITE_MODE = "sync"
+POST_COUNTER_FLUSH_INTERVAL_MS = 1000
+POST_COUNTER_FLUSH_MAX_EVENTS = 500
+
+# 通知投递：outbox 写入发件箱由 notification_worker 异步投递 / sync 在请求内立即写入（测试默认）
+NOTIFICATION_DELIVERY = os.environ.get("NOTIFICATION_DELIVERY", "sync" if TESTING else "outbox")
+
+# 通知聚合：同一动态的点赞/评论在该秒数内合并为一条（0 关闭），聚合通知保留的最近触发者数
+NOTIFICATION_COALESCE_WINDOW = 3600
+NOTIFICATION_RECENT_ACTORS = 3
+
+# 全文搜索（SQLite FTS5，中文按二元组切分）：是否启用、结果摘要长度
+SEARCH_FTS = os.environ.get("SEARCH_FTS", "1") == "1"
+SEARCH_SNIPPET_LENGTH = 80
+# 搜索结果缓存：有序结果 ID 的缓存秒数与每条查询缓存的 ID 上限（动态增删改时整体失效）
+SEARCH_CACHE_TIMEOUT = 60
+SEARCH_CACHE_MAX_IDS = 1000
+# 搜索建议（进程内前缀索引）：是否在后台线程中构建 / 定期重建（测试中关闭，由用例显式构建）、
+# 重建间隔秒数（吸收其他进程的写入）、搜索词至少被搜索多少次才作为建议
+SEARCH_SUGGEST_BACKGROUND = os.environ.get("SEARCH_SUGGEST_BACKGROUND", "0" if TESTING else "1") == "1"
+SEARCH_SUGGEST_REBUILD_INTERVAL = 600
+SEARCH_SUGGEST_MIN_KEYWORD_COUNT = 2
+# 热门标签（时间衰减）：得分半衰期（小时）、小时桶覆盖的小时数、日桶覆盖的天数、排行缓存秒数
+TRENDING_TAGS_HALF_LIFE_HOURS = 24
+TRENDING_TAGS_HOURLY_HOURS = 48
+TRENDING_TAGS_WINDOW_DAYS = 14
+TRENDING_TAGS_CACHE_TIMEOUT = 300
+
+# 通知实时推送（SSE）：每进程共享的轮询间隔（秒）、心跳间隔（秒）、客户端重连间隔（毫秒）、
+# 重连补发上限、单个连接的最长时间（秒，到期后客户端带 Last-Event-ID 自动重连）
+NOTIFICATION_STREAM_POLL_INTERVAL = 1.0
+NOTIFICATION_STREAM_HEARTBEAT = 15
+NOTIFICATION_STREAM_RETRY_MS = 3000
+NOTIFICATION_STREAM_MAX_REPLAY = 50
+NOTIFICATION_STREAM_MAX_AGE = 300
+
+# 通知保留策略（manage.py compact_notifications）：已读通知保留天数、每个用户最多保留条数；
+# 批量删除的分块大小与块间暂停秒数（删除全部通知也按此分块）
+NOTIFICATION_RETENTION_DAYS = 90
+NOTIFICATION_MAX_PER_USER = 1000
+NOTIFICATION_DELETE_CHUNK = 500
+NOTIFICATION_DELETE_PAUSE = 0.05
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -139,6 +222,22 @@ STATIC_URL = "static/"
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# 上传大小上限（字节，表单上传与分块上传共用）、单个分块上限、未完成的分块上传会话的过期秒数、每人进行中的会话数上限
+UPLOAD_MAX_IMAGE_SIZE = 20 * 1024 * 1024
+UPLOAD_MAX_VIDEO_SIZE = 500 * 1024 * 1024
+UPLOAD_MAX_AVATAR_SIZE = 5 * 1024 * 1024
+UPLOAD_CHUNK_MAX_SIZE = 8 * 1024 * 1024
+UPLOAD_SESSION_TTL = 24 * 3600
+UPLOAD_MAX_ACTIVE_SESSIONS = 10
+
+# 图片衍生图（需要 Pillow）：是否启用（测试默认关闭，不启动进程池）、生成的宽度、JPEG / WebP 质量、
+# 进程池大小、排队上限（超出的留待 generate_image_derivatives 补处理）
+IMAGE_DERIVATIVES = os.environ.get("IMAGE_DERIVATIVES", "0" if TESTING else "1") == "1"
+IMAGE_DERIVATIVE_WIDTHS = (160, 480, 1080)
+IMAGE_DERIVATIVE_QUALITY = 80
+IMAGE_DERIVATIVE_WORKERS = 2
+IMAGE_DERIVATIVE_MAX_PENDING = 32
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
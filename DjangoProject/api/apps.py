@@ -1,5 +1,22 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class ApiConfig(AppConfig):
     name = "api"
+
+    def ready(self):
+        # 注册信号：关系图缓存失效需先于时间线同步执行
+        from . import social  # noqa: F401
+        from . import timeline  # noqa: F401
+        from . import counters  # noqa: F401
+        from . import tags  # noqa: F401
+        from .search import index  # noqa: F401
+        from .search import results  # noqa: F401
+        from .search import suggest  # noqa: F401
+        from .search import trending  # noqa: F401
+
+        # 开启请求计时时才替换 DRF 序列化/渲染入口
+        if getattr(settings, "SERVER_TIMING", False):
+            from . import timing
+            timing.install()
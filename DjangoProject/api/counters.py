@@ -0,0 +1,310 @@
+"""
+动态计数器（点赞数 / 评论数）
+
+- 普通动态：在数据库内原子自增，只更新计数列（UPDATE ... SET likes_count = likes_count + 1），
+  不再读-改-写整行，也不会覆盖 text/media
+- 热门动态（POST_COUNTER_SHARDS > 0 且计数达到 POST_COUNTER_HOT_THRESHOLD）：
+  增量随机写入 PostCounterShard 的某个分片，避免并发点赞争抢同一行；
+  读取时把分片求和合并到 Post 上的计数，fold_counter_shards 定期折叠回 Post
+- 写后缓冲（POST_COUNTER_WRITE_MODE = 'buffered'）：点赞/评论只在进程内记录增量，
+  后台线程每 POST_COUNTER_FLUSH_INTERVAL_MS 毫秒或累计 POST_COUNTER_FLUSH_MAX_EVENTS 个事件时，
+  按动态聚合后用一条 UPDATE 批量写回；读取时合并尚未写回的增量
+"""
+import atexit
+import logging
+import random
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction, close_old_connections
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Post, Like, Comment, PostCounterShard
+
+logger = logging.getLogger(__name__)
+
+SHARD_COUNT = getattr(settings, 'POST_COUNTER_SHARDS', 0)
+HOT_THRESHOLD = getattr(settings, 'POST_COUNTER_HOT_THRESHOLD', 1000)
+WRITE_MODE = getattr(settings, 'POST_COUNTER_WRITE_MODE', 'sync')
+
+FIELDS = ('likes_count', 'comments_count')
+
+
+class CounterBuffer:
+    """进程内的计数增量缓冲（写后刷新）"""
+
+    def __init__(self, interval_ms=1000, max_events=500, autostart=True):
+        self.interval = interval_ms / 1000
+        self.max_events = max_events
+        self.autostart = autostart
+        # _lock 保护待写增量；_flush_lock 让刷新与一致性读取互斥，
+        # 读取方不会看到"增量已取出但尚未提交到数据库"的中间状态
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pending = {}
+        self._events = 0
+        self._oldest_at = None
+        self.last_flush_at = None
+        self.last_flush_ms = 0.0
+        self.flushed_events = 0
+
+    def add(self, post_id, field, delta):
+        with self._lock:
+            deltas = self._pending.setdefault(post_id, dict.fromkeys(FIELDS, 0))
+            deltas[field] += delta
+            self._events += 1
+            if self._oldest_at is None:
+                self._oldest_at = time.monotonic()
+            full = self._events >= self.max_events
+        self._ensure_thread()
+        if full:
+            self._wakeup.set()
+
+    def pending(self, post_ids):
+        """post_id -> 尚未写回的增量"""
+        with self._lock:
+            return {pid: dict(self._pending[pid]) for pid in post_ids if pid in self._pending}
+
+    def flush(self):
+        """把聚合后的增量用一条 UPDATE 写回，返回写回的事件数"""
+        with self._flush_lock:
+            with self._lock:
+                batch, events = self._pending, self._events
+                self._pending, self._events, self._oldest_at = {}, 0, None
+            if not batch:
+                return 0
+            started = time.monotonic()
+            try:
+                Post.objects.filter(pk__in=batch).update(**{
+                    field: Greatest(F(field) + Case(
+                        *[When(pk=pid, then=Value(d[field])) for pid, d in batch.items() if d[field]],
+                        default=Value(0),
+                        output_field=IntegerField(),
+                    ), Value(0))
+                    for field in FIELDS
+                })
+            except Exception:
+                # 写回失败时把增量放回缓冲，等待下次重试
+                logger.exception('计数缓冲写回失败，%s 个事件将重试', events)
+                with self._lock:
+                    for pid, deltas in batch.items():
+                        merged = self._pending.setdefault(pid, dict.fromkeys(FIELDS, 0))
+                        for field in FIELDS:
+                            merged[field] += deltas[field]
+                    self._events += events
+                    if self._oldest_at is None:
+                        self._oldest_at = started
+                raise
+            self.last_flush_at = time.time()
+            self.last_flush_ms = (time.monotonic() - started) * 1000
+            self.flushed_events += events
+            return events
+
+    def consistent_read(self, func):
+        """在不与刷新交错的情况下执行读取（func 内应同时读取数据库与增量）"""
+        with self._flush_lock:
+            return func()
+
+    def stats(self):
+        """队列深度与写回延迟，用于监控"""
+        with self._lock:
+            depth = self._events
+            posts = len(self._pending)
+            oldest = self._oldest_at
+        return {
+            'mode': WRITE_MODE,
+            'queue_depth': depth,
+            'pending_posts': posts,
+            'flush_lag_ms': round((time.monotonic() - oldest) * 1000, 1) if oldest is not None else 0,
+            'last_flush_at': self.last_flush_at,
+            'last_flush_ms': round(self.last_flush_ms, 1),
+            'flushed_events': self.flushed_events,
+        }
+
+    def _ensure_thread(self):
+        if not self.autostart or (self._thread is not None and self._thread.is_alive()):
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name='post-counter-flusher', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                pass  # 已记录日志，增量保留到下次
+            finally:
+                close_old_connections()
+
+
+buffer = CounterBuffer(
+    interval_ms=getattr(settings, 'POST_COUNTER_FLUSH_INTERVAL_MS', 1000),
+    max_events=getattr(settings, 'POST_COUNTER_FLUSH_MAX_EVENTS', 500),
+)
+
+
+@atexit.register
+def _flush_on_exit():
+    if WRITE_MODE == 'buffered':
+        try:
+            buffer.flush()
+        except Exception:
+            pass
+
+
+def _is_hot(post, field):
+    """用已加载的 post 判断是否热门（允许略微过期，只用于选择写入路径）"""
+    return bool(SHARD_COUNT) and post is not None and getattr(post, field) >= HOT_THRESHOLD
+
+
+def _increment_post(post_id, field, delta):
+    if delta >= 0:
+        expr = F(field) + delta
+    else:
+        expr = Greatest(F(field) + delta, Value(0))
+    Post.objects.filter(pk=post_id).update(**{field: expr})
+
+
+def _increment_shard(post_id, field, delta):
+    shard = random.randrange(SHARD_COUNT)
+    updated = PostCounterShard.objects.filter(post_id=post_id, shard=shard).update(**{field: F(field) + delta})
+    if not updated:
+        # 分片行不存在时创建（并发创建冲突则忽略后重试更新）
+        PostCounterShard.objects.bulk_create(
+            [PostCounterShard(post_id=post_id, shard=shard)], ignore_conflicts=True
+        )
+        PostCounterShard.objects.filter(post_id=post_id, shard=shard).update(**{field: F(field) + delta})
+
+
+def increment(post_id, field, delta, post=None):
+    """原子地调整某条动态的计数；post 为调用方已加载的对象，仅用于判断冷热"""
+    if WRITE_MODE == 'buffered':
+        # 事务提交后才记入缓冲，回滚的点赞/评论不会产生增量
+        transaction.on_commit(lambda: buffer.add(post_id, field, delta))
+    elif _is_hot(post, field):
+        _increment_shard(post_id, field, delta)
+    else:
+        _increment_post(post_id, field, delta)
+
+
+def get_deltas(post_ids):
+    """尚未写回 Post 的计数增量：post_id -> {field: delta}（含写后缓冲与分片；未启用分片时不查询）"""
+    result = defaultdict(lambda: dict.fromkeys(FIELDS, 0))
+    if WRITE_MODE == 'buffered':
+        for post_id, deltas in buffer.pending(post_ids).items():
+            result[post_id].update(deltas)
+    if not SHARD_COUNT or not post_ids:
+        return result
+    rows = (PostCounterShard.objects.filter(post_id__in=post_ids)
+            .values('post_id')
+            .annotate(likes=Sum('likes_count'), comments=Sum('comments_count')))
+    for row in rows:
+        result[row['post_id']]['likes_count'] += row['likes'] or 0
+        result[row['post_id']]['comments_count'] += row['comments'] or 0
+    return result
+
+
+def visible_deltas(loaded):
+    """
+    loaded: post_id -> 已加载到 Post 上的计数 {field: value}，返回相对它们的增量。
+    写后缓冲模式下，行可能在刷新前加载、增量却在刷新后读取（增量已清空），直接相加会少算；
+    因此在刷新锁内重读计数列与增量（多一次查询），返回"最新计数 - 已加载值"，保证展示的计数不回退
+    """
+    if WRITE_MODE != 'buffered':
+        return get_deltas(list(loaded))
+    result = defaultdict(lambda: dict.fromkeys(FIELDS, 0))
+    for post_id, counts in current_counts_many(list(loaded)).items():
+        result[post_id] = {field: counts[field] - loaded[post_id][field] for field in FIELDS}
+    return result
+
+
+def merged_count(post, field, deltas=None):
+    """Post 上的计数加上未折叠的增量"""
+    if deltas is None:
+        deltas = visible_deltas({post.id: {f: getattr(post, f) for f in FIELDS}})
+    return max(0, getattr(post, field) + deltas[post.id][field])
+
+
+def current_counts_many(post_ids):
+    """从数据库读取最新计数（只取计数列）并合并增量：post_id -> {field: value}"""
+    def read():
+        rows = {row['id']: row for row in Post.objects.filter(pk__in=post_ids).values('id', *FIELDS)}
+        if not rows:
+            return {}
+        deltas = get_deltas(list(rows))
+        return {
+            post_id: {field: max(0, row[field] + deltas[post_id][field]) for field in FIELDS}
+            for post_id, row in rows.items()
+        }
+
+    if WRITE_MODE == 'buffered':
+        return buffer.consistent_read(read)
+    return read()
+
+
+def current_counts(post_id):
+    return current_counts_many([post_id]).get(post_id) or dict.fromkeys(FIELDS, 0)
+
+
+def fold_shards(batch_size=500):
+    """把分片增量折叠回 Post；按快照值相减，折叠期间的新增量不会丢失。返回处理的动态数"""
+    post_ids = list(
+        PostCounterShard.objects.values_list('post_id', flat=True).distinct()[:batch_size]
+    )
+    for post_id in post_ids:
+        with transaction.atomic():
+            shards = list(PostCounterShard.objects.filter(post_id=post_id))
+            totals = {field: sum(getattr(s, field) for s in shards) for field in FIELDS}
+            Post.objects.filter(pk=post_id).update(**{
+                field: Greatest(F(field) + totals[field], Value(0)) for field in FIELDS
+            })
+            for s in shards:
+                PostCounterShard.objects.filter(pk=s.pk).update(**{
+                    field: F(field) - getattr(s, field) for field in FIELDS
+                })
+            PostCounterShard.objects.filter(post_id=post_id, likes_count=0, comments_count=0).delete()
+    return len(post_ids)
+
+
+def _cached_post(instance):
+    """Like/Comment 上已缓存的 post（不额外查询）"""
+    field = instance._meta.get_field('post')
+    return field.get_cached_value(instance) if field.is_cached(instance) else None
+
+
+@receiver(post_save, sender=Like)
+def update_likes_count(sender, instance, created, **kwargs):
+    """点赞后更新动态的点赞数"""
+    if created:
+        increment(instance.post_id, 'likes_count', 1, _cached_post(instance))
+
+
+@receiver(post_save, sender=Comment)
+def update_comments_count(sender, instance, created, **kwargs):
+    """评论后更新动态的评论数"""
+    if created:
+        increment(instance.post_id, 'comments_count', 1, _cached_post(instance))
+
+
+@receiver(post_delete, sender=Like)
+def update_likes_count_delete(sender, instance, **kwargs):
+    """取消点赞后更新动态的点赞数"""
+    increment(instance.post_id, 'likes_count', -1, _cached_post(instance))
+
+
+@receiver(post_delete, sender=Comment)
+def update_comments_count_delete(sender, instance, **kwargs):
+    """删除评论后更新动态的评论数"""
+    increment(instance.post_id, 'comments_count', -1, _cached_post(instance))
@@ -0,0 +1,221 @@
+"""
+图片衍生图流水线
+
+上传图片（动态配图、头像）保存后登记一条 ImageDerivative（pending），并提交到进程内共享的进程池，
+在子进程中生成 IMAGE_DERIVATIVE_WIDTHS 各宽度的 JPEG 与 WebP（去除 EXIF，见 api/imaging.py），
+完成回调在父进程中把结果写回数据库。请求线程只做登记与提交，不等待处理：
+- 进程池大小为 IMAGE_DERIVATIVE_WORKERS；排队超过 IMAGE_DERIVATIVE_MAX_PENDING 个时不再提交，
+  记录保持 pending，由 manage.py generate_image_derivatives 补处理（进程重启丢失的任务同样如此）
+- 衍生图写在 MEDIA_ROOT/derived/<原图路径去掉扩展名>/ 下（子进程直接写文件，要求本地文件存储）
+- IMAGE_DERIVATIVES 关闭（或 Pillow 不可用）时不登记，序列化器不查询、直接返回原图
+
+序列化时按原图 URL 批量取回衍生图（一页一次查询），未生成时各宽度回退为原图地址。
+"""
+import atexit
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from urllib.parse import unquote, urlparse
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import close_old_connections
+
+from . import imaging
+from .models import ImageDerivative
+
+logger = logging.getLogger(__name__)
+
+ENABLED = getattr(settings, 'IMAGE_DERIVATIVES', True)
+WIDTHS = tuple(getattr(settings, 'IMAGE_DERIVATIVE_WIDTHS', (160, 480, 1080)))
+QUALITY = getattr(settings, 'IMAGE_DERIVATIVE_QUALITY', 80)
+WORKERS = getattr(settings, 'IMAGE_DERIVATIVE_WORKERS', 2)
+MAX_PENDING = getattr(settings, 'IMAGE_DERIVATIVE_MAX_PENDING', 32)
+
+DERIVED_DIR = 'derived'
+# 生成衍生图的原图目录（其余媒体如视频、视频封面不处理）
+SOURCE_DIRS = ('uploads/images/', 'avatars/')
+
+
+def available():
+    """Pillow 是否可用"""
+    try:
+        import PIL  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def local_storage():
+    """默认存储是否为本地文件存储（子进程直接读写文件、上传完成时改名转存都依赖它）"""
+    try:
+        default_storage.path('')
+    except NotImplementedError:
+        return False
+    return True
+
+
+def is_source(name):
+    return bool(name) and name.startswith(SOURCE_DIRS)
+
+
+def target_dir(name):
+    """原图存储路径 -> 衍生图目录（存储路径）"""
+    return '/'.join((DERIVED_DIR, os.path.splitext(name)[0]))
+
+
+# --------------- 进程池 ---------------
+
+class Pipeline:
+    """有界的进程池：最多 max_pending 个任务在排队或处理中；executor_factory 用于替换进程池（测试）"""
+
+    def __init__(self, workers, max_pending, executor_factory=None):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.executor_factory = executor_factory or self._process_pool
+        self.executor = None
+        self.pending = 0
+        self.lock = threading.Lock()
+
+    def _process_pool(self):
+        # spawn：不从多线程的服务进程 fork，子进程只导入 api.imaging
+        return ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+
+    def _executor(self):
+        if self.executor is None:
+            self.executor = self.executor_factory()
+        return self.executor
+
+    def submit(self, name):
+        """提交一张原图，队列已满时返回 False（记录保持 pending，等待补处理）"""
+        with self.lock:
+            if self.pending >= self.max_pending:
+                return False
+            self.pending += 1
+            try:
+                future = self._submit(name)
+            except BrokenProcessPool:
+                # 子进程异常退出后进程池不可再用：换一个新的重试一次
+                self.executor = None
+                try:
+                    future = self._submit(name)
+                except Exception:
+                    self.pending -= 1
+                    raise
+            except Exception:
+                self.pending -= 1
+                raise
+        future.add_done_callback(lambda f: self._done(name, f))
+        return True
+
+    def _submit(self, name):
+        return self._executor().submit(
+            imaging.render, default_storage.path(name), default_storage.path(target_dir(name)), WIDTHS, QUALITY,
+        )
+
+    def _done(self, name, future):
+        with self.lock:
+            self.pending -= 1
+        try:
+            try:
+                result = future.result()
+            except Exception:
+                logger.exception('衍生图生成失败：%s', name)
+                fail(name)
+            else:
+                apply(name, result)
+        except Exception:
+            logger.exception('衍生图结果写回失败：%s', name)
+        finally:
+            close_old_connections()
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+
+pipeline = Pipeline(WORKERS, MAX_PENDING)
+atexit.register(pipeline.shutdown)
+
+
+# --------------- 登记与结果 ---------------
+
+def schedule(name):
+    """上传保存后调用：登记并提交后台处理，返回记录（未启用或不处理该目录时为 None）"""
+    if not ENABLED or not is_source(name) or not available() or not local_storage():
+        return None
+    record, _ = ImageDerivative.objects.get_or_create(path=name)
+    if record.status == ImageDerivative.PENDING:
+        pipeline.submit(name)
+    return record
+
+
+def apply(name, result):
+    """把 imaging.render 的结果写回记录"""
+    directory = target_dir(name)
+    variants = {
+        str(width): {'jpeg': f'{directory}/{jpeg}', 'webp': f'{directory}/{webp}'}
+        for width, (jpeg, webp) in result['variants'].items()
+    }
+    ImageDerivative.objects.filter(path=name).update(
+        status=ImageDerivative.READY, width=result['width'], height=result['height'], variants=variants,
+    )
+
+
+def fail(name):
+    ImageDerivative.objects.filter(path=name).update(status=ImageDerivative.FAILED)
+
+
+def process(record):
+    """在当前进程中同步处理一条记录（补处理命令使用），返回是否成功"""
+    try:
+        result = imaging.render(default_storage.path(record.path), default_storage.path(target_dir(record.path)),
+                                WIDTHS, QUALITY)
+    except Exception:
+        logger.exception('衍生图生成失败：%s', record.path)
+        fail(record.path)
+        return False
+    apply(record.path, result)
+    return True
+
+
+# --------------- 序列化 ---------------
+
+def media_name(url):
+    """媒体 URL（绝对或相对）-> 存储路径，不在 MEDIA_URL 下时为 None"""
+    path = unquote(urlparse(url or '').path)
+    if not path.startswith(settings.MEDIA_URL):
+        return None
+    return path[len(settings.MEDIA_URL):]
+
+
+def load(urls):
+    """原图存储路径 -> ImageDerivative（未启用或本页没有可能有衍生图的媒体时不查询）"""
+    if not ENABLED or not available():
+        return {}
+    names = {name for name in map(media_name, urls) if is_source(name)}
+    if not names:
+        return {}
+    return {record.path: record for record in ImageDerivative.objects.filter(path__in=names)}
+
+
+def describe(url, record, request=None):
+    """
+    单个媒体的衍生图地址：{'original', 'ready', 'src': {宽度: JPEG}, 'webp': {宽度: WebP}}；
+    未生成（处理中、失败或不是图片）时 src 各宽度回退为原图，webp 为空
+    """
+    build = request.build_absolute_uri if request is not None else (lambda location: location)
+    if record is None or record.status != ImageDerivative.READY:
+        return {'original': url, 'ready': False, 'src': {str(w): url for w in WIDTHS}, 'webp': {}}
+    src, webp = {}, {}
+    for width in WIDTHS:
+        # 原图比目标宽度小时取不超过它的最大一份（即原尺寸）
+        fitting = [int(w) for w in record.variants if int(w) <= width] or [min(map(int, record.variants))]
+        variant = record.variants[str(max(fitting))]
+        src[str(width)] = build(default_storage.url(variant['jpeg']))
+        webp[str(width)] = build(default_storage.url(variant['webp']))
+    return {'original': url, 'ready': True, 'src': src, 'webp': webp}
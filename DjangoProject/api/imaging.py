@@ -0,0 +1,46 @@
+"""
+图片衍生图的生成（在进程池的子进程中运行，只依赖 Pillow，不导入 Django）
+
+按 EXIF 方向摆正后输出若干宽度的 JPEG 与 WebP；保存时不写回 EXIF / ICC 等元数据（去除拍摄位置等信息）。
+只缩小不放大：小于原图宽度的目标宽度各一份，另加一份原尺寸（去除元数据后的副本）。
+"""
+import os
+
+JPEG_BACKGROUND = (255, 255, 255)  # 透明图转 JPEG 时的底色
+
+
+def _flatten(image):
+    """JPEG 不支持透明通道与调色板：合成到白底并转为 RGB"""
+    if image.mode in ('RGB', 'L'):
+        return image
+    from PIL import Image
+    rgba = image.convert('RGBA')
+    background = Image.new('RGB', rgba.size, JPEG_BACKGROUND)
+    background.paste(rgba, mask=rgba.getchannel('A'))
+    return background
+
+
+def render(source, target_dir, widths, quality=80):
+    """
+    生成衍生图，返回 {'width', 'height', 'variants': {宽度: (JPEG 文件名, WebP 文件名)}}，
+    文件名相对 target_dir
+    """
+    from PIL import Image, ImageOps
+
+    os.makedirs(target_dir, exist_ok=True)
+    with Image.open(source) as original:
+        image = ImageOps.exif_transpose(original)
+        width, height = image.size
+        if image.mode not in ('RGB', 'RGBA', 'L'):
+            image = image.convert('RGBA' if 'A' in image.getbands() or 'transparency' in image.info else 'RGB')
+        variants = {}
+        for target in sorted({w for w in widths if w < width} | {width}):
+            resized = image if target == width else image.resize(
+                (target, max(1, round(height * target / width))), Image.LANCZOS,
+            )
+            jpeg, webp = f'{target}.jpg', f'{target}.webp'
+            _flatten(resized).save(os.path.join(target_dir, jpeg), 'JPEG', quality=quality,
+                                   optimize=True, progressive=True)
+            resized.save(os.path.join(target_dir, webp), 'WEBP', quality=quality, method=4)
+            variants[target] = (jpeg, webp)
+    return {'width': width, 'height': height, 'variants': variants}
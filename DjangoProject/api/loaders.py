@@ -0,0 +1,207 @@
+"""
+序列化批量加载（DataLoader 风格）
+
+列表序列化前先收集整页对象的主键，再用固定次数的查询一次性取回
+点赞状态、标签、最新评论、用户资料和通用外键目标，避免逐行查询（N+1）。
+各 *ListSerializer 在 to_representation 时构建批量数据并放入序列化上下文，
+字段方法通过 get_batch() 取用；单个对象序列化时仍回退为逐行查询。
+"""
+from collections import defaultdict
+from functools import cached_property
+
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import F, Manager, prefetch_related_objects
+from django.db.models.functions import RowNumber
+from django.db.models.expressions import Window
+from rest_framework import serializers
+
+from . import counters, derivatives
+from .models import Post, Like, Comment, Tag
+
+POST_BATCH_KEY = 'post_batch'
+NOTIFICATION_ACTORS_KEY = 'notification_actors'
+COMMENT_PREVIEW_SIZE = 3
+
+
+class PostBatch:
+    """一页动态的批量数据，各项在首次访问时才查询"""
+
+    def __init__(self, posts, user=None):
+        self.post_ids = {post.id for post in posts}
+        self.loaded_counts = {post.id: {f: getattr(post, f) for f in counters.FIELDS} for post in posts}
+        self.media_urls = [url for post in posts for url in (post.media or [])]
+        self.user = user
+
+    def covers(self, post):
+        return post.id in self.post_ids
+
+    @cached_property
+    def liked_post_ids(self):
+        """当前用户在本页点赞过的动态 ID（1 次查询）"""
+        if not self.user or not self.user.is_authenticated or not self.post_ids:
+            return frozenset()
+        return frozenset(
+            Like.objects.filter(user=self.user, post_id__in=self.post_ids).values_list('post_id', flat=True)
+        )
+
+    @cached_property
+    def tag_names(self):
+        """post_id -> 标签名列表（1 次查询）"""
+        result = defaultdict(list)
+        rows = (Tag.posts.through.objects
+                .filter(post_id__in=self.post_ids)
+                .order_by('tag_id')
+                .values_list('post_id', 'tag__name'))
+        for post_id, name in rows:
+            result[post_id].append(name)
+        return result
+
+    @cached_property
+    def comment_previews(self):
+        """post_id -> 最新的几条评论（1 次窗口查询 + 评论者资料预取）"""
+        result = defaultdict(list)
+        if not self.post_ids:
+            return result
+        comments = list(
+            Comment.objects.filter(post_id__in=self.post_ids)
+            .annotate(row_number=Window(
+                expression=RowNumber(),
+                partition_by=[F('post_id')],
+                order_by=[F('created_at').desc(), F('id').desc()],
+            ))
+            .filter(row_number__lte=COMMENT_PREVIEW_SIZE)
+            .select_related('user__profile')
+            .order_by('post_id', 'row_number')
+        )
+        for comment in comments:
+            result[comment.post_id].append(comment)
+        return result
+
+    @cached_property
+    def image_derivatives(self):
+        """原图存储路径 -> ImageDerivative（本页没有上传图片时不查询）"""
+        return derivatives.load(self.media_urls)
+
+    @cached_property
+    def counter_deltas(self):
+        """post_id -> 未折叠的计数增量（未启用分片计数 / 写后缓冲时不查询）"""
+        return counters.visible_deltas(self.loaded_counts)
+
+
+def get_batch(serializer, key, obj):
+    """取出覆盖 obj 的批量数据，不存在时返回 None（调用方回退逐行查询）"""
+    batch = serializer.context.get(key)
+    if batch is not None and batch.covers(obj):
+        return batch
+    return None
+
+
+def counter_value(serializer, obj, field):
+    """动态的点赞/评论数（合并分片计数器中尚未折叠的增量）"""
+    batch = get_batch(serializer, POST_BATCH_KEY, obj)
+    deltas = batch.counter_deltas if batch is not None else None
+    return counters.merged_count(obj, field, deltas)
+
+
+def media_variants(serializer, obj):
+    """动态各媒体的衍生图地址（缩略图 / WebP），未生成时回退为原图"""
+    batch = get_batch(serializer, POST_BATCH_KEY, obj)
+    records = batch.image_derivatives if batch is not None else derivatives.load(obj.media or [])
+    request = serializer.context.get('request')
+    return [
+        derivatives.describe(url, records.get(derivatives.media_name(url)), request)
+        for url in obj.media or []
+    ]
+
+
+def prefetch_generic(objs, field_name, querysets=None):
+    """
+    批量解析通用外键：按 content_type 分组，每种类型一次 IN 查询，结果写入字段缓存。
+    querysets 可为某些模型指定查询集（如只取需要的列）；目标已删除时缓存 None，访问时不再查询。
+    """
+    if not objs:
+        return
+    field = objs[0]._meta.get_field(field_name)
+    ct_attname = objs[0]._meta.get_field(field.ct_field).get_attname()
+    querysets = querysets or {}
+
+    grouped = defaultdict(set)
+    for obj in objs:
+        ct_id = getattr(obj, ct_attname)
+        if ct_id is not None and not field.is_cached(obj):
+            grouped[ct_id].add(getattr(obj, field.fk_field))
+
+    targets = {}
+    for ct_id, pks in grouped.items():
+        model = ContentType.objects.get_for_id(ct_id).model_class()
+        if model is None:  # 模型已删除
+            continue
+        qs = querysets.get(model, model._base_manager.all())
+        for target in qs.filter(pk__in=pks):
+            targets[ct_id, target.pk] = target
+
+    for obj in objs:
+        ct_id = getattr(obj, ct_attname)
+        if ct_id is not None and not field.is_cached(obj):
+            field.set_cached_value(obj, targets.get((ct_id, getattr(obj, field.fk_field))))
+
+
+def _as_list(data):
+    if isinstance(data, Manager):
+        data = data.all()
+    return list(data)
+
+
+class PrefetchListSerializer(serializers.ListSerializer):
+    """序列化前对整页对象批量预取关联（子类声明 prefetch 路径）"""
+    prefetch = ()
+
+    def to_representation(self, data):
+        items = _as_list(data)
+        if items and self.prefetch:
+            # 已通过 select_related/prefetch 缓存的关联不会重复查询
+            prefetch_related_objects(items, *self.prefetch)
+        return super().to_representation(items)
+
+
+class UserListSerializer(PrefetchListSerializer):
+    prefetch = ('profile',)
+
+
+class CommentListSerializer(PrefetchListSerializer):
+    prefetch = ('user__profile',)
+
+
+class PostListSerializer(PrefetchListSerializer):
+    """动态列表：预取作者资料，并为整页构建 PostBatch"""
+    prefetch = ('user__profile',)
+
+    def to_representation(self, data):
+        items = _as_list(data)
+        request = self.context.get('request')
+        self.context[POST_BATCH_KEY] = PostBatch(items, getattr(request, 'user', None))
+        return super().to_representation(items)
+
+
+def load_users(user_ids):
+    """user_id -> User（含资料），1 次查询"""
+    if not user_ids:
+        return {}
+    return {user.id: user for user in User.objects.filter(id__in=user_ids).select_related('profile')}
+
+
+class NotificationListSerializer(PrefetchListSerializer):
+    """
+    通知列表：预取触发者资料，按 content_type 批量解析通知目标（动态只取 id/text），
+    并一次取回整页聚合通知的最近触发者
+    """
+    prefetch = ('actor__profile',)
+
+    def to_representation(self, data):
+        items = _as_list(data)
+        prefetch_generic(items, 'content_object', querysets={Post: Post.objects.only('id', 'text')})
+        self.context[NOTIFICATION_ACTORS_KEY] = load_users(
+            {uid for item in items for uid in (item.recent_actor_ids or [item.actor_id])}
+        )
+        return super().to_representation(items)
@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api import counters
+
+
+class Command(BaseCommand):
+    help = '把热门动态分片计数器中的增量折叠回 Post（可循环运行）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='每轮最多处理的动态数')
+        parser.add_argument('--interval', type=float, default=0, help='循环间隔秒数，0 表示只运行一次')
+
+    def handle(self, *args, **options):
+        while True:
+            folded = counters.fold_shards(batch_size=options['batch_size'])
+            self.stdout.write(f'已折叠 {folded} 条动态的分片计数')
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api import derivatives
+from api.models import ImageDerivative
+
+
+class Command(BaseCommand):
+    help = '同步生成尚未处理的图片衍生图（进程池排队已满或进程重启时遗留的 pending 记录）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retry-failed', action='store_true', help='同时重试处理失败的记录')
+
+    def handle(self, *args, **options):
+        if not derivatives.available():
+            raise CommandError('未安装 Pillow，无法生成衍生图')
+        statuses = [ImageDerivative.PENDING]
+        if options['retry_failed']:
+            statuses.append(ImageDerivative.FAILED)
+        done = failed = 0
+        for record in ImageDerivative.objects.filter(status__in=statuses).order_by('id').iterator():
+            if derivatives.process(record):
+                done += 1
+            else:
+                failed += 1
+        self.stdout.write(f'已生成 {done} 张，失败 {failed} 张')
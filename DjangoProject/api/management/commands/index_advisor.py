@@ -0,0 +1,96 @@
+import re
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+
+from api import social
+from api.models import Post, Comment, Friendship, Follow, TimelineEntry
+from api.search.models import SearchHistory
+from notifications.models import Notification
+
+PAGE = 21  # 视图分页多取一行判断是否有下一页
+
+# SQLite: "SCAN api_post"（无 USING 即全表扫描）；PostgreSQL: "Seq Scan on api_post"
+FULL_SCAN = re.compile(r'\bSCAN (?!CONSTANT ROW)(\S+)(?!.*\bUSING\b)|Seq Scan on (\S+)')
+# SQLite: "USE TEMP B-TREE FOR ORDER BY"；PostgreSQL: "Sort"
+TEMP_SORT = re.compile(r'USE TEMP B-TREE|^\W*Sort\b')
+
+
+def hot_querysets(user):
+    """与各视图构造方式一致的热路径查询：名称 -> QuerySet"""
+    post = Post.objects.filter(user=user).order_by('-created_at').first() or Post.objects.first()
+    friend_ids = social.get_friend_ids(user.id)
+    return {
+        'timeline': TimelineEntry.objects.filter(owner=user).select_related('post__user__profile')
+                    .order_by('-created_at', '-id')[:PAGE],
+        'my_posts': Post.objects.filter(user=user).select_related('user__profile')
+                    .order_by('-created_at', '-id')[:PAGE],
+        'post_comments': Comment.objects.filter(post=post).select_related('user__profile')
+                         .order_by('-created_at')[:PAGE],
+        'notifications': Notification.objects.filter(user=user).select_related('actor__profile')
+                         .order_by('-created_at', '-id')[:PAGE],
+        'notifications_unread': Notification.objects.filter(user=user, is_read=False).values('id'),
+        'friend_requests': Friendship.objects.filter(to_user=user, status='pending').order_by('-created_at'),
+        'friends': Friendship.objects.filter(
+                       Q(status='accepted', from_user=user) | Q(status='accepted', to_user=user)
+                   ).select_related('from_user__profile', 'to_user__profile'),
+        'following': Follow.objects.filter(follower=user).select_related('following__profile'),
+        'followers': Follow.objects.filter(following=user).select_related('follower__profile'),
+        'search_history': SearchHistory.objects.filter(user=user)[:10],
+        # 关键词由全文索引给出候选 ID，数据库只按主键过滤可见性
+        'search': Post.objects.filter(id__in=[post.id] if post else []).filter(
+            Q(user=user) | Q(visibility='public') | (Q(visibility='friends') & Q(user_id__in=friend_ids))
+        ).values_list('id', flat=True),
+        'admin_posts': Post.objects.select_related('user__profile').order_by('-created_at', '-id')[:PAGE],
+    }
+
+
+def diagnose(plan):
+    """从执行计划中找出全表扫描的表与临时排序"""
+    scans, sorts = [], False
+    for line in plan.splitlines():
+        match = FULL_SCAN.search(line)
+        if match:
+            scans.append(match.group(1) or match.group(2))
+        if TEMP_SORT.search(line):
+            sorts = True
+    return scans, sorts
+
+
+class Command(BaseCommand):
+    help = '对视图实际构造的热路径查询执行 EXPLAIN（QUERY PLAN），标出全表扫描与临时 B-tree 排序'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='以该用户（ID 或用户名）的视角构造查询，默认取第一个用户')
+        parser.add_argument('--verbose-plan', action='store_true', help='输出完整执行计划')
+        parser.add_argument('--fail', action='store_true', help='存在问题时以非零状态退出（用于 CI）')
+
+    def handle(self, *args, **options):
+        user = self.get_user(options['user'])
+        problems = 0
+        for name, qs in hot_querysets(user).items():
+            plan = qs.explain()
+            scans, sorts = diagnose(plan)
+            issues = [f'全表扫描 {table}' for table in scans]
+            if sorts:
+                issues.append('临时 B-tree 排序')
+            if issues:
+                problems += 1
+                self.stdout.write(self.style.WARNING(f'[WARN] {name}: {"；".join(issues)}'))
+            else:
+                self.stdout.write(self.style.SUCCESS(f'[ OK ] {name}'))
+            if issues or options['verbose_plan']:
+                for line in plan.splitlines():
+                    self.stdout.write(f'         {line}')
+        if problems and options['fail']:
+            raise CommandError(f'{problems} 条查询需要优化')
+
+    def get_user(self, value):
+        qs = User.objects.order_by('id')
+        if value:
+            qs = qs.filter(Q(username=value) | Q(pk=int(value)) if value.isdigit() else Q(username=value))
+        user = qs.first()
+        if user is None:
+            raise CommandError('找不到用户，请先创建数据（例如 manage.py seed_moments）')
+        return user
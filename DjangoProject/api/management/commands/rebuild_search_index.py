@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.search import index, results
+
+
+class Command(BaseCommand):
+    help = '重建动态与用户的全文索引（SQLite FTS5），用于批量导入数据后或索引与数据不一致时'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=index.BATCH, help='每批索引的行数')
+
+    def handle(self, *args, **options):
+        if not index.enabled():
+            raise CommandError('全文索引未启用（需要 SQLite 且 SEARCH_FTS=1）')
+        index.create_tables()
+        posts, users = index.rebuild(chunk_size=options['chunk_size'])
+        results.bump()  # 丢弃按旧索引缓存的搜索结果
+        self.stdout.write(f'已索引 {posts} 条动态、{users} 个用户')
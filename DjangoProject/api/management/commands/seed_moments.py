@@ -0,0 +1,390 @@
+import random
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from api import timeline
+from api.models import Profile, Post, Like, Comment, Tag, Friendship, Follow, TimelineEntry
+from api.search import index as search_index, trending
+from api.search.models import SearchHistory
+from notifications import counters as notification_counters, services
+from notifications.models import Notification
+from publish.apps import COMMON_TAGS
+
+# scale = 1 时的平均规模
+POSTS_PER_USER = 10
+FOLLOWS_PER_USER = 20
+FRIEND_REQUESTS_PER_USER = 5
+LIKES_PER_POST = 5
+COMMENTS_PER_POST = 2
+SEARCHES_PER_USER = 3
+EXTRA_TAGS = 50
+
+WORDS = [
+    '周末', '露营', '咖啡', '日落', '海边', '爬山', '火锅', '猫咪', '加班', '考试',
+    '电影', '演唱会', '骑行', '早餐', '雨天', '图书馆', '健身', '旅行', '拍照', '夜跑',
+    '新歌', '下午茶', '公园', '朋友', '生日', '烘焙', '散步', '星空', '地铁', '晚霞',
+]
+COMMENTS = ['好看！', '太棒了', '羡慕', '哈哈哈', '在哪里？', '下次一起', '赞', '冲冲冲', '好想去', '绝了']
+VISIBILITIES = (('public', 70), ('friends', 25), ('private', 5))
+POST_TYPES = (('text', 40), ('image', 50), ('video', 10))
+FRIEND_STATUSES = (('accepted', 80), ('pending', 15), ('rejected', 5))
+
+FOLLOW_COLUMNS = ('follower', 'following', 'created_at')
+FRIENDSHIP_COLUMNS = ('from_user', 'to_user', 'status', 'created_at', 'updated_at')
+LIKE_COLUMNS = ('user', 'post', 'created_at')
+COMMENT_COLUMNS = ('user', 'post', 'content', 'created_at')
+NOTIFICATION_COLUMNS = (
+    'user', 'type', 'actor', 'content_type', 'object_id', 'message', 'is_read', 'created_at',
+    'actor_count', 'recent_actor_ids', 'updated_at',
+)
+TIMELINE_COLUMNS = ('owner', 'post', 'author', 'visibility', 'created_at')
+SEARCH_HISTORY_COLUMNS = ('user', 'keyword', 'tag', 'date', 'created_at')
+
+
+@contextmanager
+def explicit_timestamps(*models):
+    """临时关闭 auto_now / auto_now_add，让 bulk_create 写入生成的历史时间"""
+    fields = [
+        f for model in models for f in model._meta.concrete_fields
+        if getattr(f, 'auto_now', False) or getattr(f, 'auto_now_add', False)
+    ]
+    saved = [(f, f.auto_now, f.auto_now_add) for f in fields]
+    for f in fields:
+        f.auto_now = f.auto_now_add = False
+    try:
+        yield
+    finally:
+        for f, auto_now, auto_now_add in saved:
+            f.auto_now, f.auto_now_add = auto_now, auto_now_add
+
+
+def power_law_weights(n, alpha, rng):
+    """n 个元素的累计权重，第 k 名的权重 ∝ 1/k^alpha，名次随机打乱"""
+    ranks = list(range(1, n + 1))
+    rng.shuffle(ranks)
+    return list(accumulate(1 / rank ** alpha for rank in ranks))
+
+
+class Command(BaseCommand):
+    help = (
+        '生成可按规模扩展的模拟数据：用户/资料、动态（文本/图片/视频）、标签、点赞、评论、'
+        '好友、关注、（聚合后的）通知、搜索历史。粉丝数呈幂律分布，活动时间偏向近期；'
+        '分块批量写入且不触发信号，点赞/评论计数在内存中算好后随动态一起写入。'
+        '--users 100000 --scale 1 约生成 100 万条动态'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000, help='用户数')
+        parser.add_argument('--scale', type=float, default=1.0, help='活动量倍数（动态、关注、点赞、评论等）')
+        parser.add_argument('--days', type=int, default=365, help='数据覆盖的天数')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='每批写入的行数')
+        parser.add_argument('--prefix', default='seed', help='生成的用户名前缀')
+        parser.add_argument('--seed', type=int, default=None, help='随机种子，便于复现')
+        parser.add_argument('--timeline', action='store_true', help='同时写入首页时间线（写扩散，行数较多）')
+
+    def handle(self, *args, **options):
+        n_users = options['users']
+        if n_users < 2:
+            raise CommandError('--users 至少为 2')
+        if options['scale'] <= 0:
+            raise CommandError('--scale 必须大于 0')
+        if User.objects.filter(username__startswith=f"{options['prefix']}_").exists():
+            raise CommandError(f"已存在前缀为 {options['prefix']}_ 的用户，请换一个 --prefix")
+
+        self.rng = random.Random(options['seed'])
+        self.scale = options['scale']
+        self.chunk = options['chunk_size']
+        self.now = timezone.now()
+        self.span = timedelta(days=options['days'])
+        self.with_timeline = options['timeline']
+        self.started = time.monotonic()
+        # datetime -> 数据库格式（插入大表时逐值调用，先取出避免重复查找）
+        self.ts = connection.ops.adapt_datetimefield_value
+        recent_actors = Notification._meta.get_field('recent_actor_ids')
+        self.json = lambda value: recent_actors.get_db_prep_save(value, connection)
+
+        with explicit_timestamps(Post, Tag):
+            self.create_users(n_users, options['prefix'])
+            self.create_tags()
+            self.create_follows()
+            self.create_friendships()
+            self.create_posts()
+            self.create_search_history()
+        self.log('完成')
+
+    # ---------------- 工具 ----------------
+
+    def log(self, message):
+        self.stdout.write(f'[{time.monotonic() - self.started:7.1f}s] {message}')
+
+    def insert(self, model, columns, rows):
+        """
+        分块批量插入已按列排好的元组。
+        大表（关注、点赞、评论、通知、时间线等）不构造模型实例、不经 ORM 编译，
+        比 bulk_create 快一个数量级；不会触发任何信号。
+        """
+        if not rows:
+            return
+        quote = connection.ops.quote_name
+        table = quote(model._meta.db_table)
+        names = ', '.join(quote(model._meta.get_field(c).column) for c in columns)
+        sql = f'INSERT INTO {table} ({names}) VALUES ({", ".join(["%s"] * len(columns))})'
+        with transaction.atomic(), connection.cursor() as cursor:
+            for start in range(0, len(rows), self.chunk):
+                cursor.executemany(sql, rows[start:start + self.chunk])
+
+    def count(self, mean):
+        """均值为 mean 的非负整数（指数分布，长尾）"""
+        return int(self.rng.expovariate(1 / mean)) if mean > 0 else 0
+
+    def heavy_count(self, mean):
+        """均值为 mean 的重尾整数（Pareto α=1.5），少数动态获得大量互动"""
+        return int((self.rng.paretovariate(1.5) - 1) * mean / 2)
+
+    def pick(self, choices):
+        values, weights = zip(*choices)
+        return self.rng.choices(values, weights)[0]
+
+    def recent(self, since):
+        """since 之后的时间点，越接近现在越密集"""
+        since = max(since, self.now - self.span)
+        return self.now - (self.now - since) * self.rng.random() ** 2.5
+
+    def distinct_users(self, k, exclude, cum_weights=None):
+        """抽取最多 k 个不同用户（下标），排除 exclude；给出 cum_weights 时按权重抽取"""
+        k = min(k, self.n_users - 1)
+        if k > self.n_users // 2:
+            # 接近全量时直接无放回抽样，避免反复去重
+            picked = set(self.rng.sample(range(self.n_users), k + 1))
+            picked.discard(exclude)
+            return set(list(picked)[:k])
+        picked = set()
+        while len(picked) < k:
+            if cum_weights is not None:
+                batch = self.rng.choices(range(self.n_users), cum_weights=cum_weights, k=k - len(picked))
+            else:
+                batch = [self.rng.randrange(self.n_users) for _ in range(k - len(picked))]
+            picked.update(batch)
+            picked.discard(exclude)
+        return picked
+
+    # ---------------- 生成 ----------------
+
+    def create_users(self, n_users, prefix):
+        password = make_password('password')
+        self.n_users = n_users
+        self.user_ids, self.usernames, self.joined = [], [], []
+        for start in range(0, n_users, self.chunk):
+            users = []
+            for i in range(start, min(start + self.chunk, n_users)):
+                joined = self.now - self.span * self.rng.random()
+                users.append(User(username=f'{prefix}_{i}', password=password, date_joined=joined))
+            with transaction.atomic():
+                User.objects.bulk_create(users)
+                Profile.objects.bulk_create([
+                    Profile(user_id=u.id, signature=self.rng.choice(WORDS)) for u in users
+                ])
+                if search_index.enabled():
+                    search_index.index_users(users)
+            self.user_ids.extend(u.id for u in users)
+            self.usernames.extend(u.username for u in users)
+            self.joined.extend(u.date_joined for u in users)
+        # 受欢迎程度（被关注）与活跃度（发动态）各自服从幂律
+        self.popularity = power_law_weights(n_users, 1.0, self.rng)
+        self.activity = power_law_weights(n_users, 0.8, self.rng)
+        self.log(f'用户 {n_users}')
+
+    def create_tags(self):
+        names = list(COMMON_TAGS) + [f'话题{i}' for i in range(int(EXTRA_TAGS * self.scale))]
+        Tag.objects.bulk_create([Tag(name=name, created_at=self.now) for name in names], ignore_conflicts=True)
+        self.tag_ids = list(Tag.objects.filter(name__in=names).values_list('id', flat=True))
+        self.tag_weights = power_law_weights(len(self.tag_ids), 1.2, self.rng)
+        self.tag_names = dict(Tag.objects.filter(id__in=self.tag_ids).values_list('id', 'name'))
+        self.log(f'标签 {len(self.tag_ids)}')
+
+    def create_follows(self):
+        # 只有写时间线时才需要在内存中保留关系图
+        self.following = [set() for _ in range(self.n_users)] if self.with_timeline else None
+        rows, total = [], 0
+        for i in range(self.n_users):
+            targets = self.distinct_users(self.count(FOLLOWS_PER_USER * self.scale), i, self.popularity)
+            for j in targets:
+                created = self.recent(max(self.joined[i], self.joined[j]))
+                rows.append((self.user_ids[i], self.user_ids[j], self.ts(created)))
+            if self.following is not None:
+                self.following[i] = targets
+            if len(rows) >= self.chunk:
+                total += len(rows)
+                self.insert(Follow, FOLLOW_COLUMNS, rows)
+                rows = []
+        total += len(rows)
+        self.insert(Follow, FOLLOW_COLUMNS, rows)
+        self.log(f'关注 {total}')
+
+    def create_friendships(self):
+        self.friends = [set() for _ in range(self.n_users)] if self.with_timeline else None
+        pairs, rows, total = set(), [], 0
+        for i in range(self.n_users):
+            for j in self.distinct_users(self.count(FRIEND_REQUESTS_PER_USER * self.scale), i):
+                if (i, j) in pairs or (j, i) in pairs:
+                    continue
+                pairs.add((i, j))
+                status = self.pick(FRIEND_STATUSES)
+                created = self.recent(max(self.joined[i], self.joined[j]))
+                created = self.ts(created)
+                rows.append((self.user_ids[i], self.user_ids[j], status, created, created))
+                if self.friends is not None and status == 'accepted':
+                    self.friends[i].add(j)
+                    self.friends[j].add(i)
+            if len(rows) >= self.chunk:
+                total += len(rows)
+                self.insert(Friendship, FRIENDSHIP_COLUMNS, rows)
+                rows = []
+        total += len(rows)
+        self.insert(Friendship, FRIENDSHIP_COLUMNS, rows)
+        if self.friends is not None:
+            # 互相关注也视为好友（与 api.social 一致）；粉丝表由关注表反推
+            self.followers = [set() for _ in range(self.n_users)]
+            for i, targets in enumerate(self.following):
+                for j in targets:
+                    self.followers[j].add(i)
+                    if i in self.following[j]:
+                        self.friends[i].add(j)
+        self.log(f'好友申请 {total}')
+
+    def create_posts(self):
+        total_posts = int(self.n_users * POSTS_PER_USER * self.scale)
+        self.post_content_type_id = ContentType.objects.get_for_model(Post).id
+        totals = dict.fromkeys(('posts', 'likes', 'comments', 'notifications', 'timeline'), 0)
+        for start in range(0, total_posts, self.chunk):
+            size = min(self.chunk, total_posts - start)
+            authors = self.rng.choices(range(self.n_users), cum_weights=self.activity, k=size)
+            for key, value in self.create_post_chunk(start, authors).items():
+                totals[key] += value
+            self.log(f'动态 {start + size}/{total_posts}')
+        self.log('、'.join(f'{key} {value}' for key, value in totals.items()))
+        # 通知直接插入、未经信号，计数行按通知表统一重算
+        notification_counters.rebuild(self.user_ids)
+
+    def create_post_chunk(self, start, authors):
+        posts, engagement = [], []
+        for offset, author in enumerate(authors):
+            n = start + offset
+            post_type = self.pick(POST_TYPES)
+            if post_type == 'image':
+                media = [f'/media/uploads/images/seed/{n}_{k}.jpg' for k in range(self.rng.randint(1, 9))]
+            elif post_type == 'video':
+                media = [f'/media/uploads/videos/seed/{n}.mp4', f'/media/uploads/images/seed/{n}_poster.jpg']
+            else:
+                media = []
+            likers = self.distinct_users(self.heavy_count(LIKES_PER_POST * self.scale), author)
+            commenters = [self.rng.randrange(self.n_users) for _ in range(self.heavy_count(COMMENTS_PER_POST * self.scale))]
+            posts.append(Post(
+                user_id=self.user_ids[author],
+                text=' '.join(self.rng.sample(WORDS, self.rng.randint(2, 6))),
+                type=post_type,
+                media=media,
+                visibility=self.pick(VISIBILITIES),
+                created_at=self.recent(self.joined[author]),
+                # 计数直接按生成的点赞/评论算好，无需事后回填
+                likes_count=len(likers),
+                comments_count=len(commenters),
+            ))
+            engagement.append((author, likers, commenters))
+
+        with transaction.atomic():
+            Post.objects.bulk_create(posts, batch_size=self.chunk)
+            tag_links, likes, comments, notifications, entries = [], [], [], [], []
+            for post, (author, likers, commenters) in zip(posts, engagement):
+                k = self.rng.choice((0, 1, 1, 2, 3))
+                for tag_id in set(self.rng.choices(self.tag_ids, cum_weights=self.tag_weights, k=k)):
+                    tag_links.append((tag_id, post.id))
+                like_events = [(self.recent(post.created_at), i) for i in likers]
+                comment_events = [(self.recent(post.created_at), i) for i in commenters]
+                likes.extend((self.user_ids[i], post.id, self.ts(created)) for created, i in like_events)
+                comments.extend(
+                    (self.user_ids[i], post.id, self.rng.choice(COMMENTS), self.ts(created))
+                    for created, i in comment_events
+                )
+                notifications.extend(self.notifications(post, author, 'like', like_events))
+                notifications.extend(self.notifications(post, author, 'comment', comment_events))
+                if self.with_timeline:
+                    entries.extend(self.timeline_entries(post, author))
+            self.insert(Tag.posts.through, ('tag', 'post'), tag_links)
+            self.insert(Like, LIKE_COLUMNS, likes)
+            self.insert(Comment, COMMENT_COLUMNS, comments)
+            self.insert(Notification, NOTIFICATION_COLUMNS, notifications)
+            self.insert(TimelineEntry, TIMELINE_COLUMNS, entries)
+            # bulk_create 不触发信号，全文索引与热门标签分桶按本批动态补建
+            if search_index.enabled():
+                search_index.index_posts([post.id for post in posts])
+            post_times = {post.id: post.created_at for post in posts}
+            trending.record([(tag_id, post_times[post_id]) for tag_id, post_id in tag_links])
+        return {
+            'posts': len(posts), 'likes': len(likes), 'comments': len(comments),
+            'notifications': len(notifications), 'timeline': len(entries),
+        }
+
+    def notifications(self, post, author, kind, events):
+        """按 notifications.services 的聚合规则，把 (时间, 用户下标) 事件合并为通知行"""
+        window = timedelta(seconds=services.COALESCE_WINDOW)
+        groups = []
+        for created, i in sorted(events):
+            if i == author:  # 不通知自己
+                continue
+            group = groups[-1] if groups else None
+            if group is None or not window or created - group['at'] > window:
+                groups.append({'at': created, 'count': 1, 'recent': [i]})
+                continue
+            if i not in group['recent']:
+                group['count'] += 1
+            group['recent'] = ([i] + [u for u in group['recent'] if u != i])[:services.RECENT_ACTORS]
+            group['at'] = created
+        return [
+            (
+                post.user_id, kind, self.user_ids[g['recent'][0]], self.post_content_type_id, post.id,
+                services.build_message(self.usernames[g['recent'][0]], g['count'], kind), False,
+                self.ts(g['at']), g['count'], self.json([self.user_ids[i] for i in g['recent']]), self.ts(g['at']),
+            )
+            for g in groups
+        ]
+
+    def timeline_entries(self, post, author):
+        """与 api.timeline.get_recipient_ids 相同的接收者规则"""
+        recipients = []
+        if post.visibility != 'private':
+            friends = self.friends[author]
+            recipients = sorted(friends)
+            if post.visibility == 'public':
+                recipients.extend(sorted(self.followers[author] - friends))
+        created = self.ts(post.created_at)
+        owners = [author] + recipients[:timeline.FANOUT_CAP]
+        return [(self.user_ids[i], post.id, post.user_id, post.visibility, created) for i in owners]
+
+    def create_search_history(self):
+        keywords = WORDS + list(self.tag_names.values())
+        rows, total = [], 0
+        for i in range(self.n_users):
+            for _ in range(self.count(SEARCHES_PER_USER * self.scale)):
+                created = self.recent(self.joined[i])
+                rows.append((
+                    self.user_ids[i], self.rng.choice(keywords),
+                    self.rng.choice(COMMON_TAGS) if self.rng.random() < 0.3 else '',
+                    connection.ops.adapt_datefield_value(created.date()), self.ts(created),
+                ))
+            if len(rows) >= self.chunk:
+                total += len(rows)
+                self.insert(SearchHistory, SEARCH_HISTORY_COLUMNS, rows)
+                rows = []
+        total += len(rows)
+        self.insert(SearchHistory, SEARCH_HISTORY_COLUMNS, rows)
+        self.log(f'搜索历史 {total}')
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from api.search import trending
+
+
+class Command(BaseCommand):
+    help = '清理热门标签的过期分桶；--rebuild 按现有标签关联重建（批量导入数据后使用）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true', help='清空并按现有标签关联重建保留期内的分桶')
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            self.stdout.write(f'已重建 {trending.rebuild()} 个分桶')
+        else:
+            self.stdout.write(f'已清理 {trending.prune()} 个过期分桶')
+        names = trending.refresh()
+        self.stdout.write('当前热门标签：' + ('、'.join(names[:10]) or '无'))
@@ -0,0 +1,87 @@
+"""
+项目中间件
+"""
+import json
+import logging
+
+from django.conf import settings
+from django.db import connection
+
+from . import timing
+
+logger = logging.getLogger(__name__)
+timing_logger = logging.getLogger('api.timing')
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+WRITE_PREFIXES = ('INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+
+class ReadPathWriteError(RuntimeError):
+    """安全方法（GET/HEAD/OPTIONS）的请求中执行了写 SQL"""
+
+
+class ReadPathWriteGuardMiddleware:
+    """
+    读路径写保护：处理安全方法请求期间拦截 INSERT/UPDATE/DELETE。
+
+    READ_PATH_WRITE_GUARD 取值：
+    - 'off'：不检查（默认，几乎零开销）
+    - 'log'：记录告警日志后照常执行
+    - 'raise'：抛出 ReadPathWriteError 拒绝执行（测试环境默认开启）
+    应放在 MIDDLEWARE 末尾，只包裹视图本身，不影响 session 等中间件的写入。
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        mode = getattr(settings, 'READ_PATH_WRITE_GUARD', 'off')
+        if mode == 'off' or request.method not in SAFE_METHODS:
+            return self.get_response(request)
+
+        def guard(execute, sql, params, many, context):
+            if sql.lstrip()[:7].upper().startswith(WRITE_PREFIXES):
+                message = f'{request.method} {request.path} 执行了写操作: {sql[:200]}'
+                if mode == 'raise':
+                    raise ReadPathWriteError(message)
+                logger.warning(message)
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(guard):
+            return self.get_response(request)
+
+
+class ServerTimingMiddleware:
+    """
+    请求计时：统计 SQL 次数与耗时、序列化、渲染、视图与总耗时，写入 Server-Timing 响应头。
+
+    SERVER_TIMING 关闭时直接透传；SERVER_TIMING_LOG 开启时另以 JSON 写一行日志（logger api.timing），
+    包含 URL 名称，便于按接口聚合。应放在 MIDDLEWARE 最前，使总耗时覆盖其余中间件。
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not getattr(settings, 'SERVER_TIMING', False):
+            return self.get_response(request)
+
+        request_timing, token = timing.start()
+        try:
+            with connection.execute_wrapper(request_timing.record_query):
+                response = self.get_response(request)
+        finally:
+            timing.stop(token)
+        request_timing.finish()
+
+        response['Server-Timing'] = request_timing.header()
+        if getattr(settings, 'SERVER_TIMING_LOG', False):
+            match = getattr(request, 'resolver_match', None)
+            timing_logger.info(json.dumps({
+                'url_name': match.view_name if match else None,
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                **request_timing.as_dict(),
+            }, ensure_ascii=False))
+        return response
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.30 on 2026-10-18 17:32
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('api', '0007_post_feed_post_id_delete_rating'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimelineEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('visibility', models.CharField(default='public', max_length=10)),
+                ('created_at', models.DateTimeField()),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to=settings.AUTH_USER_MODEL)),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to='api.post')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['owner', '-created_at', '-id'], name='api_timeline_owner_time_idx'), models.Index(fields=['owner', 'author'], name='api_timeline_owner_author_idx')],
+                'unique_together': {('owner', 'post')},
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+from django.db import migrations
+
+COMMON_TAGS = ['户外', '日常', '美食', '旅行', '运动', '摄影', '读书', '音乐', '电影', '宠物', '工作', '学习']
+
+
+def backfill(apps, schema_editor):
+    """为缺少资料的旧用户补建 Profile，并预先创建常用标签"""
+    User = apps.get_model('auth', 'User')
+    Profile = apps.get_model('api', 'Profile')
+    Tag = apps.get_model('api', 'Tag')
+    missing = User.objects.filter(profile__isnull=True).values_list('id', flat=True)
+    Profile.objects.bulk_create(
+        [Profile(user_id=user_id) for user_id in missing],
+        batch_size=500,
+        ignore_conflicts=True,
+    )
+    Tag.objects.bulk_create([Tag(name=name) for name in COMMON_TAGS], ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_timelineentry'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
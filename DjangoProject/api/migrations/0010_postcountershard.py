@@ -0,0 +1,27 @@
+# Generated by Django 4.2.30 on 2026-10-18 17:36
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_backfill_profiles_common_tags'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostCounterShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard', models.PositiveSmallIntegerField()),
+                ('likes_count', models.IntegerField(default=0)),
+                ('comments_count', models.IntegerField(default=0)),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='counter_shards', to='api.post')),
+            ],
+            options={
+                'unique_together': {('post', 'shard')},
+            },
+        ),
+    ]
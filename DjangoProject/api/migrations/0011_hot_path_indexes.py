@@ -0,0 +1,45 @@
+# Generated by Django 4.2.30 on 2026-10-18 17:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_postcountershard'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', '-created_at', '-id'], name='api_comment_post_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='follow',
+            index=models.Index(fields=['following', '-created_at'], name='api_follow_following_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='friendship',
+            index=models.Index(fields=['status', 'from_user'], name='api_friend_status_from_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='friendship',
+            index=models.Index(fields=['status', 'to_user', '-created_at'], name='api_friend_status_to_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='api_post_user_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['visibility', '-created_at', '-id'], name='api_post_vis_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['-created_at', '-id'], name='api_post_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='searchhistory',
+            index=models.Index(fields=['user', '-created_at'], name='api_search_user_time_idx'),
+        ),
+    ]
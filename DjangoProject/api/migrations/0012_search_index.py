@@ -0,0 +1,86 @@
+import re
+from collections import defaultdict
+
+from django.db import migrations
+
+# 表结构与分词规则固定在迁移中（与当时的 api/search/index.py 一致），之后修改 index.py 不影响本迁移
+POST_TABLE = 'api_post_fts'
+USER_TABLE = 'api_user_fts'
+CHUNK_SIZE = 500
+
+_CJK = '぀-ヿ㐀-䶿一-鿿가-힯豈-﫿'
+_SEGMENTS = re.compile(rf'[{_CJK}]+|(?:(?![{_CJK}])[^\W_])+')
+
+
+def tokenize(text):
+    """中文单字 + 二元组，其他为小写词"""
+    tokens = []
+    for segment in _SEGMENTS.findall((text or '').lower()):
+        if re.match(f'[{_CJK}]', segment):
+            tokens.extend(segment)
+            tokens.extend(segment[i:i + 2] for i in range(len(segment) - 1))
+        else:
+            tokens.append(segment)
+    return ' '.join(tokens)
+
+
+def chunks(queryset):
+    """按主键分块取出 values 行，每次只在内存中保留一块"""
+    last_pk = 0
+    while True:
+        rows = list(queryset.filter(pk__gt=last_pk).order_by('pk')[:CHUNK_SIZE])
+        if not rows:
+            return
+        yield rows
+        last_pk = rows[-1]['id']
+
+
+def create_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite':
+        return
+    Post = apps.get_model('api', 'Post')
+    Tag = apps.get_model('api', 'Tag')
+    User = apps.get_model('auth', 'User')
+    with connection.cursor() as cursor:
+        cursor.execute(f'CREATE VIRTUAL TABLE IF NOT EXISTS {POST_TABLE} USING fts5(text, tags, username)')
+        cursor.execute(f'CREATE VIRTUAL TABLE IF NOT EXISTS {USER_TABLE} USING fts5(username)')
+
+        # 按现有数据构建（使用历史模型，按主键分块）
+        for posts in chunks(Post.objects.using(connection.alias).values('id', 'text', 'user__username')):
+            tags = defaultdict(list)
+            links = (Tag.posts.through.objects.using(connection.alias)
+                     .filter(post_id__in=[post['id'] for post in posts])
+                     .order_by('id').values_list('post_id', 'tag__name'))
+            for post_id, name in links:
+                tags[post_id].append(name)
+            cursor.executemany(
+                f'INSERT INTO {POST_TABLE} (rowid, text, tags, username) VALUES (%s, %s, %s, %s)',
+                [(post['id'], tokenize(post['text']), tokenize(' '.join(tags[post['id']])),
+                  tokenize(post['user__username'])) for post in posts],
+            )
+        for users in chunks(User.objects.using(connection.alias).values('id', 'username')):
+            cursor.executemany(
+                f'INSERT INTO {USER_TABLE} (rowid, username) VALUES (%s, %s)',
+                [(user['id'], tokenize(user['username'])) for user in users],
+            )
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f'DROP TABLE IF EXISTS {POST_TABLE}')
+        cursor.execute(f'DROP TABLE IF EXISTS {USER_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_hot_path_indexes'),
+    ]
+
+    operations = [
+        # 全文索引（SQLite FTS5 虚拟表），建表后按现有数据构建
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.30 on 2026-10-18 18:25
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_buckets(apps, schema_editor):
+    """按现有标签关联补建保留期内的分桶（使用历史模型）"""
+    from api.search import trending
+    Tag = apps.get_model('api', 'Tag')
+    TagUsageBucket = apps.get_model('api', 'TagUsageBucket')
+    _, window_start = trending.cutoffs()
+    links = Tag.posts.through.objects.filter(post__created_at__gte=window_start)
+    counts = trending.buckets(links.values_list('tag_id', 'post__created_at').iterator(chunk_size=trending.BATCH))
+    TagUsageBucket.objects.bulk_create([
+        TagUsageBucket(tag_id=tag_id, granularity=granularity, start=start, count=n)
+        for (tag_id, granularity, start), n in counts.items()
+    ], batch_size=trending.BATCH)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TagUsageBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granularity', models.CharField(choices=[('hour', '小时'), ('day', '天')], max_length=4)),
+                ('start', models.DateTimeField()),
+                ('count', models.IntegerField(default=0)),
+                ('tag', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='usage_buckets', to='api.tag')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['granularity', 'start'], name='api_tagusage_gran_start_idx')],
+                'unique_together': {('tag', 'granularity', 'start')},
+            },
+        ),
+        migrations.RunPython(backfill_buckets, migrations.RunPython.noop),
+    ]
@@ -32,6 +32,16 @@ class Post(models.Model):
     likes_count = models.IntegerField(default=0)
     comments_count = models.IntegerField(default=0)
 
+    class Meta:
+        indexes = [
+            # 我的动态 / 个人主页：按作者取最新
+            models.Index(fields=['user', '-created_at', '-id'], name='api_post_user_time_idx'),
+            # 发现页 / 搜索：按可见性取最新
+            models.Index(fields=['visibility', '-created_at', '-id'], name='api_post_vis_time_idx'),
+            # 管理后台 / 搜索：全站按时间倒序
+            models.Index(fields=['-created_at', '-id'], name='api_post_time_idx'),
+        ]
+
     def __str__(self):
         return f'Post({self.id}) by {self.user.username}'
 
@@ -56,6 +66,11 @@ class Comment(models.Model):
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['post', '-created_at', '-id'], name='api_comment_post_time_idx'),
+        ]
+
     def __str__(self):
         return f'Comment by {self.user.username} on Post({self.post.id})'
 
@@ -86,6 +101,12 @@ class Friendship(models.Model):
 
     class Meta:
         unique_together = ('from_user', 'to_user')
+        indexes = [
+            # 好友列表：status='accepted' 且 from_user / to_user 为本人（OR 两侧各走一个索引）
+            models.Index(fields=['status', 'from_user'], name='api_friend_status_from_idx'),
+            # 待处理申请：按接收者取最新
+            models.Index(fields=['status', 'to_user', '-created_at'], name='api_friend_status_to_idx'),
+        ]
 
     def __str__(self):
         return f"{self.from_user.username} -> {self.to_user.username} ({self.status})"
@@ -99,48 +120,110 @@ class Follow(models.Model):
 
     class Meta:
         unique_together = ('follower', 'following')
+        indexes = [
+            # 粉丝列表（关注列表由唯一约束的 follower 前缀覆盖）
+            models.Index(fields=['following', '-created_at'], name='api_follow_following_idx'),
+        ]
 
     def __str__(self):
         return f"{self.follower.username} -> {self.following.username}"
 
 
-@receiver(post_save, sender=User)
-def create_user_profile(sender, instance, created, **kwargs):
-    if created:
-        Profile.objects.create(user=instance)
+class TimelineEntry(models.Model):
+    """首页时间线（写扩散）：动态发布时为每个可见的接收者写入一行"""
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='timeline_entries')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='timeline_entries')
+    # 冗余作者与可见性，解除好友/取关时无需连表即可撤回
+    author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    visibility = models.CharField(max_length=10, default='public')
+    # 与 post.created_at 一致，用于按时间倒序的范围扫描
+    created_at = models.DateTimeField()
 
+    class Meta:
+        unique_together = ('owner', 'post')
+        indexes = [
+            models.Index(fields=['owner', '-created_at', '-id'], name='api_timeline_owner_time_idx'),
+            models.Index(fields=['owner', 'author'], name='api_timeline_owner_author_idx'),
+        ]
 
-@receiver(post_save, sender=User)
-def save_user_profile(sender, instance, **kwargs):
-    if hasattr(instance, 'profile'):
-        instance.profile.save()
+    def __str__(self):
+        return f'TimelineEntry(Post({self.post_id}) -> {self.owner_id})'
 
 
-@receiver(post_save, sender=Like)
-def update_likes_count(sender, instance, created, **kwargs):
-    """点赞后更新动态的点赞数"""
-    if created:
-        instance.post.likes_count += 1
-        instance.post.save()
+class PostCounterShard(models.Model):
+    """热门动态的分片计数器：并发点赞分散到多行，读取时求和，定期折叠回 Post"""
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='counter_shards')
+    shard = models.PositiveSmallIntegerField()
+    # 增量可为负（取消点赞），折叠时与 Post 上的计数合并
+    likes_count = models.IntegerField(default=0)
+    comments_count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('post', 'shard')
 
+    def __str__(self):
+        return f'PostCounterShard(Post({self.post_id}) #{self.shard})'
 
-@receiver(post_save, sender=Comment)
-def update_comments_count(sender, instance, created, **kwargs):
-    """评论后更新动态的评论数"""
-    if created:
-        instance.post.comments_count += 1
-        instance.post.save()
 
+class TagUsageBucket(models.Model):
+    """标签使用量的时间分桶（按动态发布时间计），用于计算时间衰减的热门标签，见 api/search/trending.py"""
+    HOUR, DAY = 'hour', 'day'
+    GRANULARITY_CHOICES = (
+        (HOUR, '小时'),
+        (DAY, '天'),
+    )
 
-@receiver(models.signals.post_delete, sender=Like)
-def update_likes_count_delete(sender, instance, **kwargs):
-    """取消点赞后更新动态的点赞数"""
-    instance.post.likes_count = max(0, instance.post.likes_count - 1)
-    instance.post.save()
+    tag = models.ForeignKey(Tag, on_delete=models.CASCADE, related_name='usage_buckets')
+    granularity = models.CharField(max_length=4, choices=GRANULARITY_CHOICES)
+    start = models.DateTimeField()  # 桶的起始时刻（UTC 整点 / 零点）
+    count = models.IntegerField(default=0)
 
+    class Meta:
+        unique_together = ('tag', 'granularity', 'start')
+        indexes = [
+            # 计算排行与清理过期分桶：按粒度取时间窗口
+            models.Index(fields=['granularity', 'start'], name='api_tagusage_gran_start_idx'),
+        ]
 
-@receiver(models.signals.post_delete, sender=Comment)
-def update_comments_count_delete(sender, instance, **kwargs):
-    """删除评论后更新动态的评论数"""
-    instance.post.comments_count = max(0, instance.post.comments_count - 1)
-    instance.post.save()
+    def __str__(self):
+        return f'TagUsageBucket(Tag({self.tag_id}) {self.granularity} {self.start:%Y-%m-%d %H:00})'
+
+
+class ImageDerivative(models.Model):
+    """上传图片（动态配图、头像）的衍生图：多种宽度的 JPEG / WebP，由后台进程池生成，见 api/derivatives.py"""
+    PENDING, READY, FAILED = 'pending', 'ready', 'failed'
+    STATUS_CHOICES = (
+        (PENDING, '处理中'),
+        (READY, '已生成'),
+        (FAILED, '失败'),
+    )
+
+    path = models.CharField(max_length=255, unique=True)  # 原图在存储中的路径
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    width = models.PositiveIntegerField(null=True, blank=True)
+    height = models.PositiveIntegerField(null=True, blank=True)
+    # {"宽度": {"jpeg": 存储路径, "webp": 存储路径}}
+    variants = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # 补处理未完成的衍生图
+            models.Index(fields=['status', 'updated_at'], name='api_imgderiv_status_idx'),
+        ]
+
+    def __str__(self):
+        return f'ImageDerivative({self.path}) {self.status}'
+
+
+@receiver(post_save, sender=User)
+def create_user_profile(sender, instance, created, **kwargs):
+    if created:
+        Profile.objects.create(user=instance)
+
+
+@receiver(post_save, sender=User)
+def save_user_profile(sender, instance, **kwargs):
+    if hasattr(instance, 'profile'):
+        instance.profile.save()
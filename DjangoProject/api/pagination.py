@@ -0,0 +1,135 @@
+"""
+分页工具
+
+- StandardResultsSetPagination：页码分页（page / pageSize），各应用共用
+- CreatedAtCursorPagination：按 (created_at, id) 倒序的键集（游标）分页，
+  深翻页不再随 OFFSET 线性变慢，新数据插入时也不会出现重复/漏读；
+  总数默认不统计，传 withTotal=1 时才额外执行 COUNT
+"""
+import base64
+import binascii
+from datetime import datetime
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+CURSOR_QUERY_PARAM = 'cursor'
+
+
+class StandardResultsSetPagination(PageNumberPagination):
+    page_size = 10
+    page_size_query_param = 'pageSize'
+    max_page_size = 100
+
+    def get_total(self):
+        """复用分页器已执行的 COUNT，避免视图里再统计一次"""
+        return self.page.paginator.count
+
+    def get_next_cursor(self):
+        return None
+
+
+class CreatedAtCursorPagination(BasePagination):
+    """(created_at, id) 键集分页，游标对客户端不透明"""
+    cursor_query_param = CURSOR_QUERY_PARAM
+    page_size_query_param = 'pageSize'
+    total_query_param = 'withTotal'
+    page_size = 10
+    max_page_size = 100
+    invalid_cursor_message = '无效的游标'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_queryset = queryset
+        self.page_size = self.get_page_size(request)
+        position = self.decode_cursor(request)
+
+        queryset = queryset.order_by('-created_at', '-id')
+        if position is not None:
+            created_at, pk = position
+            queryset = queryset.filter(
+                Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk)
+            )
+        # 多取一条判断是否还有下一页，代替 COUNT
+        rows = list(queryset[:self.page_size + 1])
+        self.has_next = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        self.next_position = (rows[-1].created_at, rows[-1].pk) if self.has_next else None
+        return rows
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+        if size <= 0:
+            return self.page_size
+        return min(size, self.max_page_size)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            raw = base64.urlsafe_b64decode(encoded.encode('ascii')).decode('ascii')
+            created_at, pk = raw.rsplit('|', 1)
+            return datetime.fromisoformat(created_at), int(pk)
+        except (binascii.Error, UnicodeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, position):
+        created_at, pk = position
+        raw = f'{created_at.isoformat()}|{pk}'
+        return base64.urlsafe_b64encode(raw.encode('ascii')).decode('ascii')
+
+    def include_total(self):
+        return self.request.query_params.get(self.total_query_param) in ('1', 'true', 'True')
+
+    def get_total(self):
+        """仅在客户端显式要求时统计总数"""
+        if not self.include_total():
+            return None
+        if not hasattr(self, '_total'):
+            self._total = self.base_queryset.order_by().count()
+        return self._total
+
+    def get_next_cursor(self):
+        if self.next_position is None:
+            return None
+        return self.encode_cursor(self.next_position)
+
+    def get_next_link(self):
+        cursor = self.get_next_cursor()
+        if cursor is None:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, cursor)
+
+    def get_previous_link(self):
+        return None
+
+    def get_paginated_response(self, data):
+        payload = {
+            'next': self.get_next_link(),
+            'previous': None,
+            'next_cursor': self.get_next_cursor(),
+            'results': data,
+        }
+        total = self.get_total()
+        if total is not None:
+            payload['count'] = total
+        return Response(payload)
+
+
+def use_cursor(request):
+    """请求带 cursor 参数（首页可传空值）即启用游标分页"""
+    return CURSOR_QUERY_PARAM in request.query_params
+
+
+def get_paginator(request):
+    """按请求参数选择页码分页或游标分页"""
+    if use_cursor(request):
+        return CreatedAtCursorPagination()
+    return StandardResultsSetPagination()
@@ -0,0 +1,317 @@
+"""
+全文索引（SQLite FTS5）
+
+两张 FTS5 虚拟表，rowid 即主键：
+- api_post_fts(text, tags, username)：动态正文、标签名、作者用户名
+- api_user_fts(username)：用户名
+中文没有空格分词，写入前在 Python 中切分：连续的中日韩字符生成单字 + 相邻二元组（bigram），
+其余按字母数字连续段成词；FTS5 只按空格切分已经切好的词元。
+查询时中文串取二元组（单字取单字）、其他词按前缀匹配，全部词元 AND，按 BM25 排序。
+可见性、标签、日期等过滤条件（QuerySet）作为关联子查询与 MATCH 在同一条 SQL 中执行，
+分页（LIMIT / OFFSET）与总数（COUNT）都基于过滤后的匹配结果，不预先截断候选。
+
+保存/删除动态、修改标签、修改用户名时由信号同步索引；批量导入（bulk_create、seed_moments）
+后执行 manage.py rebuild_search_index 重建。非 SQLite 数据库或 SEARCH_FTS 关闭时，
+搜索退回原来的 icontains 匹配。
+"""
+import html
+import re
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection
+from django.db.models.expressions import RawSQL
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from api.models import Post, Tag
+
+FTS_ENABLED = getattr(settings, 'SEARCH_FTS', True)
+SNIPPET_LENGTH = getattr(settings, 'SEARCH_SNIPPET_LENGTH', 80)
+SNIPPET_CONTEXT = 20  # 摘要中首个命中之前保留的字符数
+
+POST_TABLE = 'api_post_fts'
+USER_TABLE = 'api_user_fts'
+# BM25 列权重：正文、标签、用户名
+POST_WEIGHTS = (1.0, 2.0, 1.5)
+BATCH = 500
+
+# 假名、中日韩统一表意文字（含扩展 A、兼容）、谚文
+_CJK = '぀-ヿ㐀-䶿一-鿿가-힯豈-﫿'
+_SEGMENTS = re.compile(rf'[{_CJK}]+|(?:(?![{_CJK}])[^\W_])+')
+
+
+def enabled():
+    return FTS_ENABLED and connection.vendor == 'sqlite'
+
+
+def tokenize(text):
+    """文档词元：中文单字 + 二元组，其他为小写词"""
+    tokens = []
+    for segment in _SEGMENTS.findall((text or '').lower()):
+        if _is_cjk(segment):
+            tokens.extend(segment)
+            tokens.extend(segment[i:i + 2] for i in range(len(segment) - 1))
+        else:
+            tokens.append(segment)
+    return ' '.join(tokens)
+
+
+def query_terms(keyword):
+    """查询词元 [(词元, 是否前缀匹配)]：中文取二元组（单字取单字），其他词前缀匹配"""
+    terms = []
+    for segment in _SEGMENTS.findall((keyword or '').lower()):
+        if not _is_cjk(segment):
+            terms.append((segment, True))
+        elif len(segment) == 1:
+            terms.append((segment, False))
+        else:
+            terms.extend((segment[i:i + 2], False) for i in range(len(segment) - 1))
+    return list(dict.fromkeys(terms))
+
+
+def match_expression(keyword):
+    """FTS5 MATCH 表达式（各词元 AND），没有可检索的词元时为 None"""
+    terms = query_terms(keyword)
+    if not terms:
+        return None
+    return ' '.join(f'"{term}"' + ('*' if prefix else '') for term, prefix in terms)
+
+
+def _is_cjk(segment):
+    return bool(re.match(f'[{_CJK}]', segment))
+
+
+# --------------- 查询 ---------------
+
+def _post_where(match, posts):
+    """MATCH 条件，posts（动态 QuerySet）不为 None 时附加按 rowid 关联的 EXISTS 子查询"""
+    sql, params = f'{POST_TABLE} MATCH %s', [match]
+    if posts is not None:
+        inner = posts.filter(pk=RawSQL(f'{POST_TABLE}.rowid', ())).order_by().values('pk')
+        inner_sql, inner_params = inner.query.sql_with_params()
+        sql += f' AND EXISTS ({inner_sql})'
+        params += list(inner_params)
+    return sql, params
+
+
+def search_posts(keyword, posts=None, limit=None, offset=0):
+    """按 BM25 排序的匹配动态 ID；posts 为附加的过滤条件（与 MATCH 同一条 SQL 执行）"""
+    match = match_expression(keyword)
+    if match is None:
+        return []
+    where, params = _post_where(match, posts)
+    weights = ', '.join(str(w) for w in POST_WEIGHTS)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT rowid FROM {POST_TABLE} WHERE {where} '
+            f'ORDER BY bm25({POST_TABLE}, {weights}) LIMIT %s OFFSET %s',
+            params + [-1 if limit is None else limit, offset],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def count_posts(keyword, posts=None):
+    """过滤后的匹配动态数"""
+    match = match_expression(keyword)
+    if match is None:
+        return 0
+    where, params = _post_where(match, posts)
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT COUNT(*) FROM {POST_TABLE} WHERE {where}', params)
+        return cursor.fetchone()[0]
+
+
+def post_match(keyword):
+    """用于 id__in 的 MATCH 子查询（按时间排序、键集分页时与其余过滤条件组合成一条 SQL）"""
+    return RawSQL(f'SELECT rowid FROM {POST_TABLE} WHERE {POST_TABLE} MATCH %s', (match_expression(keyword),))
+
+
+def search_users(keyword, limit=10):
+    """按 BM25 排序的匹配用户 ID"""
+    match = match_expression(keyword)
+    if match is None:
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT rowid FROM {USER_TABLE} WHERE {USER_TABLE} MATCH %s ORDER BY rank LIMIT %s',
+            [match, limit],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def highlight(text, terms, length=None):
+    """截取首个命中附近的摘要，命中处用 <mark> 标出（其余内容 HTML 转义）"""
+    text = text or ''
+    length = length or SNIPPET_LENGTH
+    lowered = text.lower()
+    if len(lowered) != len(text):
+        lowered = text
+    spans = []
+    for term, _ in terms:
+        start = lowered.find(term)
+        while start != -1:
+            spans.append((start, start + len(term)))
+            start = lowered.find(term, start + 1)
+    merged = []
+    for start, end in sorted(spans):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+
+    begin = max(0, merged[0][0] - SNIPPET_CONTEXT) if merged else 0
+    finish = min(len(text), begin + length)
+    parts, cursor = [], begin
+    for start, end in merged:
+        if end <= begin or start >= finish:
+            continue
+        start, end = max(start, begin), min(end, finish)
+        parts.append(html.escape(text[cursor:start]))
+        parts.append(f'<mark>{html.escape(text[start:end])}</mark>')
+        cursor = end
+    parts.append(html.escape(text[cursor:finish]))
+    return ('…' if begin else '') + ''.join(parts) + ('…' if finish < len(text) else '')
+
+
+# --------------- 写入 ---------------
+
+def create_tables(schema_connection=None):
+    with (schema_connection or connection).cursor() as cursor:
+        cursor.execute(f'CREATE VIRTUAL TABLE IF NOT EXISTS {POST_TABLE} USING fts5(text, tags, username)')
+        cursor.execute(f'CREATE VIRTUAL TABLE IF NOT EXISTS {USER_TABLE} USING fts5(username)')
+
+
+def drop_tables(schema_connection=None):
+    with (schema_connection or connection).cursor() as cursor:
+        cursor.execute(f'DROP TABLE IF EXISTS {POST_TABLE}')
+        cursor.execute(f'DROP TABLE IF EXISTS {USER_TABLE}')
+
+
+def _replace(table, columns, rows):
+    """按 rowid 替换索引行；rows 为 (rowid, *列值)"""
+    if not rows:
+        return
+    placeholders = ', '.join(['%s'] * (len(columns) + 1))
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), BATCH):
+            batch = rows[start:start + BATCH]
+            ids = [row[0] for row in batch]
+            cursor.execute(f'DELETE FROM {table} WHERE rowid IN ({", ".join(["%s"] * len(ids))})', ids)
+            cursor.executemany(
+                f'INSERT INTO {table} (rowid, {", ".join(columns)}) VALUES ({placeholders})', batch,
+            )
+
+
+def _delete(table, ids):
+    ids = list(ids)
+    with connection.cursor() as cursor:
+        for start in range(0, len(ids), BATCH):
+            batch = ids[start:start + BATCH]
+            cursor.execute(f'DELETE FROM {table} WHERE rowid IN ({", ".join(["%s"] * len(batch))})', batch)
+
+
+def _post_row(post, tag_names):
+    return post.id, tokenize(post.text), tokenize(' '.join(tag_names)), tokenize(post.user.username)
+
+
+def index_posts(post_ids):
+    """重新索引指定动态（不存在的从索引中删除）"""
+    post_ids = set(post_ids)
+    posts = Post.objects.filter(id__in=post_ids).select_related('user').prefetch_related('tags')
+    rows = [_post_row(post, [tag.name for tag in post.tags.all()]) for post in posts]
+    _replace(POST_TABLE, ('text', 'tags', 'username'), rows)
+    _delete(POST_TABLE, post_ids - {row[0] for row in rows})
+
+
+def index_users(users):
+    _replace(USER_TABLE, ('username',), [(user.id, tokenize(user.username)) for user in users])
+
+
+def _chunked_ids(queryset, chunk_size):
+    last_pk = 0
+    while True:
+        ids = list(queryset.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:chunk_size])
+        if not ids:
+            return
+        yield ids
+        last_pk = ids[-1]
+
+
+def rebuild(chunk_size=BATCH):
+    """清空并按主键分块重建全部索引，返回 (动态数, 用户数)"""
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {POST_TABLE}')
+        cursor.execute(f'DELETE FROM {USER_TABLE}')
+    posts = users = 0
+    for ids in _chunked_ids(Post.objects.all(), chunk_size):
+        index_posts(ids)
+        posts += len(ids)
+    for ids in _chunked_ids(User.objects.all(), chunk_size):
+        index_users(User.objects.filter(pk__in=ids).only('id', 'username'))
+        users += len(ids)
+    return posts, users
+
+
+# --------------- 同步信号 ---------------
+
+@receiver(post_save, sender=Post)
+def index_saved_post(sender, instance, created, **kwargs):
+    if enabled():
+        # 新建的动态还没有标签，标签随后由 m2m_changed 补上
+        tag_names = [] if created else list(instance.tags.values_list('name', flat=True))
+        _replace(POST_TABLE, ('text', 'tags', 'username'), [_post_row(instance, tag_names)])
+
+
+@receiver(post_delete, sender=Post)
+def unindex_deleted_post(sender, instance, **kwargs):
+    if enabled():
+        _delete(POST_TABLE, [instance.pk])
+
+
+@receiver(m2m_changed, sender=Tag.posts.through)
+def reindex_post_tags(sender, instance, action, reverse, pk_set, **kwargs):
+    """post.tags.add(...) 时 instance 为动态；tag.posts.add(...) 时 pk_set 为动态 ID"""
+    if not enabled():
+        return
+    if action == 'pre_clear' and not reverse:
+        instance._search_cleared_post_ids = list(instance.posts.values_list('id', flat=True))
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        if reverse:
+            index_posts([instance.pk])
+        elif action == 'post_clear':
+            index_posts(getattr(instance, '_search_cleared_post_ids', []))
+        else:
+            index_posts(pk_set)
+
+
+@receiver(pre_delete, sender=Tag)
+def remember_tagged_posts(sender, instance, **kwargs):
+    if enabled():
+        instance._search_cleared_post_ids = list(instance.posts.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Tag)
+def reindex_untagged_posts(sender, instance, **kwargs):
+    if enabled():
+        index_posts(getattr(instance, '_search_cleared_post_ids', []))
+
+
+@receiver(post_save, sender=User)
+def index_saved_user(sender, instance, created, update_fields=None, **kwargs):
+    if not enabled() or (update_fields and 'username' not in update_fields):
+        return  # 登录时只更新 last_login，不必重建
+    index_users([instance])
+    if not created:
+        # 用户名可能已修改：同步其动态的作者列
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'UPDATE {POST_TABLE} SET username = %s WHERE rowid IN (SELECT id FROM api_post WHERE user_id = %s)',
+                [tokenize(instance.username), instance.pk],
+            )
+
+
+@receiver(post_delete, sender=User)
+def unindex_deleted_user(sender, instance, **kwargs):
+    if enabled():
+        _delete(USER_TABLE, [instance.pk])
@@ -15,4 +15,7 @@ class SearchHistory(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='api_search_user_time_idx'),
+        ]
 ####################  搜索部分结束  ######################
\ No newline at end of file
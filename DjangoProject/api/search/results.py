@@ -0,0 +1,106 @@
+"""
+搜索结果缓存
+
+热门搜索对成千上万的用户重复同样的过滤、计数与用户名匹配。页码分页的搜索结果按
+（归一化后的查询条件, 受众）缓存有序的动态 ID 列表与匹配的用户 ID，命中时只按 ID 取回当前页：
+- 查询条件：关键词（小写、合并空白）、标签、去重排序后的多标签、合法的日期 / 日期范围；
+  缓存的是完整 ID 列表，页码与页大小不参与 key
+- 受众：匿名用户共用一份；登录用户可见自己的动态和好友的“好友可见”动态，
+  key 含用户 ID 与好友集合的摘要，好友关系变化后自然换 key
+动态的新建、修改、删除与标签变化递增全局代数（generation）使全部结果失效，
+其余情况（如其他进程中的写入）由 SEARCH_CACHE_TIMEOUT 兜底。
+"""
+import hashlib
+import json
+import time
+from datetime import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from api.models import Post, Tag
+
+CACHE_TIMEOUT = getattr(settings, 'SEARCH_CACHE_TIMEOUT', 60)
+MAX_IDS = getattr(settings, 'SEARCH_CACHE_MAX_IDS', 1000)
+GENERATION_KEY = 'search_results:generation'
+
+
+def _date(value):
+    """合法的 YYYY-MM-DD 原样返回，否则为空（与原先忽略非法日期一致）"""
+    try:
+        return datetime.strptime(value.strip(), '%Y-%m-%d').date().isoformat()
+    except ValueError:
+        return ''
+
+
+def normalize(params):
+    """请求参数 -> 归一化的查询条件"""
+    tags = {t.strip() for t in params.get('tags', '').split(',') if t.strip()}
+    return {
+        'keyword': ' '.join(params.get('keyword', '').split()).lower(),
+        'tag': params.get('tag', '').strip(),
+        'tags': sorted(tags),
+        'date': _date(params.get('date', '')),
+        'date_from': _date(params.get('date_from', '')),
+        'date_to': _date(params.get('date_to', '')),
+    }
+
+
+def audience(user, friend_ids):
+    """匿名用户为 anon；登录用户为 user:<id>:<好友集合摘要>"""
+    if user is None:
+        return 'anon'
+    digest = hashlib.md5(','.join(map(str, sorted(friend_ids))).encode()).hexdigest()[:12]
+    return f'user:{user.id}:{digest}'
+
+
+def generation():
+    value = cache.get(GENERATION_KEY)
+    if value is None:
+        # 缺失（首次或被淘汰）时取当前毫秒数，保证不会与淘汰前的代数重复
+        cache.add(GENERATION_KEY, int(time.time() * 1000), None)
+        value = cache.get(GENERATION_KEY)
+    return value
+
+
+def bump():
+    """使所有已缓存的搜索结果失效"""
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.add(GENERATION_KEY, int(time.time() * 1000), None)
+
+
+def cache_key(query, audience_key):
+    digest = hashlib.md5(json.dumps([query, audience_key], sort_keys=True).encode()).hexdigest()
+    return f'search_results:{generation()}:{digest}'
+
+
+def get(query, audience_key):
+    """{'ids': 有序动态 ID（最多 MAX_IDS 个）, 'total': 总数, 'user_ids': 匹配的用户 ID}，未命中为 None"""
+    return cache.get(cache_key(query, audience_key))
+
+
+def put(query, audience_key, result):
+    cache.set(cache_key(query, audience_key), result, CACHE_TIMEOUT)
+
+
+def _invalidate():
+    bump()
+    # 事务提交后再失效一次，避免并发读在提交前回填旧结果
+    transaction.on_commit(bump)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_on_post_change(sender, **kwargs):
+    _invalidate()
+
+
+@receiver(m2m_changed, sender=Tag.posts.through)
+def invalidate_on_tag_change(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        _invalidate()
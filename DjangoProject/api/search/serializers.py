@@ -4,10 +4,15 @@ from django.contrib.auth import get_user_model
 from api.models import Post
 from .models import SearchHistory
 from api.serializers import UserSerializer
+from api.loaders import POST_BATCH_KEY, get_batch, counter_value, media_variants, PostListSerializer
 from django.utils import timezone
+from . import index
 
 User = get_user_model()
 
+# 序列化上下文：搜索词元，存在时为每条结果生成高亮摘要
+SEARCH_TERMS_KEY = 'search_terms'
+
 # --------------- 1.Post  ---------------
 class PostSerializer(serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
@@ -16,21 +21,38 @@ class PostSerializer(serializers.ModelSerializer):
     time = serializers.SerializerMethodField(read_only=True)
     tags = serializers.SerializerMethodField(read_only=True)
     text = serializers.CharField(read_only=True)
+    likes_count = serializers.SerializerMethodField(read_only=True)
+    comments_count = serializers.SerializerMethodField(read_only=True)
+    snippet = serializers.SerializerMethodField(read_only=True)
+    media_variants = serializers.SerializerMethodField(read_only=True)
 
     class Meta:
         model = Post
         fields = [
-            'id', 'user', 'avatar', 'text', 'type', 'media', 'visibility', 'created_at',
-            'likes_count', 'comments_count', 'is_liked', 'time', 'tags'
+            'id', 'user', 'avatar', 'text', 'type', 'media', 'media_variants', 'visibility', 'created_at',
+            'likes_count', 'comments_count', 'is_liked', 'time', 'tags', 'snippet'
         ]
         read_only_fields = [
             'id', 'user', 'avatar', 'text', 'likes_count', 'comments_count',
-            'is_liked', 'time', 'tags', 'visibility', 'created_at'
+            'is_liked', 'time', 'tags', 'visibility', 'created_at', 'snippet', 'media_variants'
         ]
+        list_serializer_class = PostListSerializer
+
+    def get_likes_count(self, obj):
+        return counter_value(self, obj, 'likes_count')
+
+    def get_comments_count(self, obj):
+        return counter_value(self, obj, 'comments_count')
+
+    def get_media_variants(self, obj):
+        return media_variants(self, obj)
 
     def get_is_liked(self, obj):
         user = self.context.get('request').user
         if user.is_authenticated:
+            batch = get_batch(self, POST_BATCH_KEY, obj)
+            if batch is not None:
+                return obj.id in batch.liked_post_ids
             return obj.likes.filter(user=user).exists()
 
     def get_time(self, obj):
@@ -46,8 +68,18 @@ class PostSerializer(serializers.ModelSerializer):
             return obj.created_at.strftime("%m-%d %H:%M")
 
     def get_tags(self, obj):
+        batch = get_batch(self, POST_BATCH_KEY, obj)
+        if batch is not None:
+            return batch.tag_names.get(obj.id, [])
         return [tag.name for tag in obj.tags.all()]
 
+    def get_snippet(self, obj):
+        # 命中处以 <mark> 标出的正文摘要，未按关键词搜索时为 None
+        terms = self.context.get(SEARCH_TERMS_KEY)
+        if not terms:
+            return None
+        return index.highlight(obj.text, terms)
+
     def get_avatar(self, obj):
         profile = getattr(obj.user, 'profile', None)
         if profile and profile.avatar:
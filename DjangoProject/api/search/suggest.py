@@ -0,0 +1,304 @@
+"""
+搜索建议：进程内前缀索引
+
+把用户名、标签名与热门搜索词放进一个按小写文本排序的数组，前缀查询用二分定位区间，
+再按热度取前若干个，不访问数据库：
+- 用户名：粉丝数
+- 标签：使用该标签的动态数
+- 搜索词：搜索历史中的次数（至少 SEARCH_SUGGEST_MIN_KEYWORD_COUNT 次才作为建议，避免暴露个别用户的搜索）
+1～2 个字符的短前缀区间很大，构建时预先算好各短前缀热度最高的 TOP_K 项；
+热度升高时原地合并，降低或删除时丢弃该前缀的列表，下次查询重算。
+
+索引在后台线程中构建（每个进程首次查询时启动，构建期间返回空列表），整体替换；
+之后由信号在事务提交后增量更新，并每 SEARCH_SUGGEST_REBUILD_INTERVAL 秒在后台重建一次，
+以吸收其他进程的写入（以及删除动态时级联删除标签关联、不发 m2m 信号造成的标签热度偏差）。
+请求线程从不访问数据库；同一时间最多一个重建。
+"""
+import bisect
+import heapq
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import close_old_connections, transaction
+from django.db.models import Count
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from api.models import Follow, Tag
+from .models import SearchHistory
+
+logger = logging.getLogger(__name__)
+
+REBUILD_INTERVAL = getattr(settings, 'SEARCH_SUGGEST_REBUILD_INTERVAL', 600)
+MIN_KEYWORD_COUNT = getattr(settings, 'SEARCH_SUGGEST_MIN_KEYWORD_COUNT', 2)
+BACKGROUND = getattr(settings, 'SEARCH_SUGGEST_BACKGROUND', True)
+MEMO_SIZE = 4096  # 缓存的前缀查询结果数，索引变化时清空
+SHORT_PREFIX = 2  # 不超过该长度的前缀使用预先计算的 top-k
+TOP_K = 30  # 每个短前缀保留的项数（同一文本最多 3 项，足够去重后返回 10 个）
+
+USER, TAG, KEYWORD = 'user', 'tag', 'keyword'
+
+
+def _eligible(kind, score):
+    return kind != KEYWORD or score >= MIN_KEYWORD_COUNT
+
+
+def _short_prefixes(lowered):
+    return [lowered[:i] for i in range(1, min(SHORT_PREFIX, len(lowered)) + 1)]
+
+
+class PrefixIndex:
+    """(小写文本, 类型, 原文) 的有序数组 + 热度表 + 短前缀的 top-k"""
+
+    def __init__(self):
+        self.keys = []
+        self.scores = {}  # (类型, 原文) -> 热度
+        self.names = {}  # (类型, 主键) -> 原文，用于改名与删除
+        self.top = {}  # 短前缀 -> 按 (-热度, 排序键) 升序的前 TOP_K 项
+        self.memo = {}
+        self.lock = threading.RLock()
+        self.built_at = None
+
+    # --------------- 查询 ---------------
+
+    def suggest(self, prefix, limit=10):
+        prefix = prefix.strip().lower()
+        if not prefix:
+            return []
+        with self.lock:
+            memo_key = (prefix, limit)
+            result = self.memo.get(memo_key)
+            if result is None:
+                result = self._suggest(prefix, limit)
+                if len(self.memo) >= MEMO_SIZE:
+                    self.memo.clear()
+                self.memo[memo_key] = result
+            return result
+
+    def _suggest(self, prefix, limit):
+        if len(prefix) <= SHORT_PREFIX and limit * 3 <= TOP_K:
+            ranked = self.top.get(prefix)
+            if ranked is None:
+                ranked = self.top[prefix] = self._ranked(prefix, TOP_K)
+        else:
+            ranked = self._ranked(prefix, limit * 3)
+        suggestions = []
+        # 同一文本可能同时是用户名、标签和搜索词（最多 3 项），只保留一次
+        for _, (_, _, text) in ranked:
+            if text not in suggestions:
+                suggestions.append(text)
+                if len(suggestions) == limit:
+                    break
+        return suggestions
+
+    def _ranked(self, prefix, count):
+        """前缀区间内热度最高的 count 项：[(-热度, 排序键)]，热度相同时按字母序"""
+        lo = bisect.bisect_left(self.keys, (prefix,))
+        hi = bisect.bisect_left(self.keys, (prefix + '\U0010ffff',))
+        entries = (
+            (-self.scores[key[1:]], key) for key in self.keys[lo:hi] if _eligible(key[1], self.scores[key[1:]])
+        )
+        return heapq.nsmallest(count, entries)
+
+    # --------------- 更新 ---------------
+
+    def add(self, kind, text, delta=0, pk=None):
+        """加入或调整一项的热度（不存在时以 delta 为初始热度）"""
+        if not text:
+            return
+        with self.lock:
+            key = (kind, text)
+            old = self.scores.get(key)
+            if old is None:
+                bisect.insort(self.keys, (text.lower(), kind, text))
+            new = self.scores[key] = max((old or 0) + delta, 0)
+            if pk is not None:
+                self.names[kind, pk] = text
+            self._touch(kind, text, old, new)
+            self.memo.clear()
+
+    def remove(self, kind, text=None, pk=None):
+        with self.lock:
+            if pk is not None:
+                text = self.names.pop((kind, pk), text)
+            if text is None or (kind, text) not in self.scores:
+                return
+            old = self.scores.pop((kind, text))
+            entry = (text.lower(), kind, text)
+            i = bisect.bisect_left(self.keys, entry)
+            if i < len(self.keys) and self.keys[i] == entry:
+                del self.keys[i]
+            self._touch(kind, text, old, None)
+            self.memo.clear()
+
+    def _touch(self, kind, text, old, new):
+        """维护短前缀的 top-k：热度升高（或新加入）时原地合并；降低或删除且在列表中时丢弃，查询时重算"""
+        key = (text.lower(), kind, text)
+        previous = (-old, key) if old is not None else None
+        for prefix in _short_prefixes(key[0]):
+            ranked = self.top.get(prefix)
+            if ranked is None:
+                continue
+            present = previous is not None and previous in ranked
+            if new is not None and _eligible(kind, new) and (old is None or new >= old):
+                if present:
+                    ranked.remove(previous)
+                bisect.insort(ranked, (-new, key))
+                del ranked[TOP_K:]
+            elif present:
+                del self.top[prefix]
+
+    def rename(self, kind, pk, text):
+        """按主键改名，保留热度"""
+        with self.lock:
+            old = self.names.get((kind, pk))
+            if old == text:
+                return
+            score = self.scores.get((kind, old), 0) if old is not None else 0
+            self.remove(kind, pk=pk)
+            self.add(kind, text, score, pk)
+
+    def score_by_pk(self, kind, pk, delta):
+        with self.lock:
+            text = self.names.get((kind, pk))
+            if text is not None:
+                self.add(kind, text, delta)
+
+    def load(self, entries, names):
+        """整体替换：entries 为 {(类型, 原文): 热度}；在锁外排序并计算短前缀 top-k，持锁时间只是一次赋值"""
+        keys = sorted((text.lower(), kind, text) for kind, text in entries)
+        candidates = defaultdict(list)
+        for key in keys:
+            score = entries[key[1:]]
+            if _eligible(key[1], score):
+                for prefix in _short_prefixes(key[0]):
+                    candidates[prefix].append((-score, key))
+        top = {prefix: heapq.nsmallest(TOP_K, ranked) for prefix, ranked in candidates.items()}
+        with self.lock:
+            self.keys, self.scores, self.names, self.top = keys, dict(entries), dict(names), top
+            self.memo.clear()
+            self.built_at = time.monotonic()
+
+
+index = PrefixIndex()
+_build_lock = threading.Lock()
+_start_lock = threading.Lock()
+_refresher = None
+
+
+def rebuild():
+    """从数据库构建全部建议项（4 次查询）并整体替换；已有构建在进行时直接返回 False"""
+    if not _build_lock.acquire(blocking=False):
+        return False
+    try:
+        entries, names = {}, {}
+        followers = dict(Follow.objects.values_list('following_id').annotate(n=Count('id')).order_by())
+        for pk, username in User.objects.values_list('id', 'username'):
+            entries[USER, username] = followers.get(pk, 0)
+            names[USER, pk] = username
+        for pk, name, posts in Tag.objects.annotate(n=Count('posts')).values_list('id', 'name', 'n'):
+            entries[TAG, name] = posts
+            names[TAG, pk] = name
+        for keyword, count in SearchHistory.objects.values_list('keyword').annotate(n=Count('id')).order_by():
+            entries[KEYWORD, keyword] = count
+        index.load(entries, names)
+    finally:
+        _build_lock.release()
+    return True
+
+
+def _refresh_forever():
+    while True:
+        try:
+            rebuild()
+        except Exception:
+            logger.exception('搜索建议索引构建失败')
+        finally:
+            close_old_connections()
+        time.sleep(REBUILD_INTERVAL)
+
+
+def start():
+    """启动本进程的后台构建线程（立即构建，之后每 REBUILD_INTERVAL 秒重建）"""
+    global _refresher
+    if _refresher is not None and _refresher.is_alive():
+        return
+    with _start_lock:
+        if _refresher is None or not _refresher.is_alive():
+            _refresher = threading.Thread(target=_refresh_forever, name='search-suggest-builder', daemon=True)
+            _refresher.start()
+
+
+def suggest(prefix, limit=10):
+    """前缀建议：按热度排序的文本列表（只读进程内索引）"""
+    if BACKGROUND:
+        start()
+    return index.suggest(prefix, limit)
+
+
+# --------------- 增量更新（事务提交后，且仅在本进程已构建索引时） ---------------
+
+def _apply(func, *args, **kwargs):
+    if index.built_at is not None:
+        transaction.on_commit(lambda: func(*args, **kwargs))
+
+
+@receiver(post_save, sender=User)
+def suggest_user_saved(sender, instance, created, update_fields=None, **kwargs):
+    if update_fields and 'username' not in update_fields:
+        return
+    _apply(index.rename, USER, instance.pk, instance.username)
+
+
+@receiver(post_delete, sender=User)
+def suggest_user_deleted(sender, instance, **kwargs):
+    _apply(index.remove, USER, pk=instance.pk)
+
+
+@receiver(post_save, sender=Follow)
+def suggest_follow_added(sender, instance, created, **kwargs):
+    if created:
+        _apply(index.score_by_pk, USER, instance.following_id, 1)
+
+
+@receiver(post_delete, sender=Follow)
+def suggest_follow_removed(sender, instance, **kwargs):
+    _apply(index.score_by_pk, USER, instance.following_id, -1)
+
+
+@receiver(post_save, sender=Tag)
+def suggest_tag_saved(sender, instance, **kwargs):
+    _apply(index.rename, TAG, instance.pk, instance.name)
+
+
+@receiver(post_delete, sender=Tag)
+def suggest_tag_deleted(sender, instance, **kwargs):
+    _apply(index.remove, TAG, pk=instance.pk)
+
+
+@receiver(m2m_changed, sender=Tag.posts.through)
+def suggest_tag_usage(sender, instance, action, reverse, pk_set, **kwargs):
+    """post.tags.add(...) 时 pk_set 为标签；tag.posts.add(...) 时 instance 为标签"""
+    if action not in ('post_add', 'post_remove') or not pk_set:
+        return
+    delta = 1 if action == 'post_add' else -1
+    if reverse:
+        for tag_id in pk_set:
+            _apply(index.score_by_pk, TAG, tag_id, delta)
+    else:
+        _apply(index.score_by_pk, TAG, instance.pk, delta * len(pk_set))
+
+
+@receiver(post_save, sender=SearchHistory)
+def suggest_keyword_searched(sender, instance, created, **kwargs):
+    if created:
+        _apply(index.add, KEYWORD, instance.keyword, 1)
+
+
+@receiver(post_delete, sender=SearchHistory)
+def suggest_keyword_cleared(sender, instance, **kwargs):
+    _apply(index.add, KEYWORD, instance.keyword, -1)
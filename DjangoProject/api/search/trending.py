@@ -0,0 +1,180 @@
+"""
+热门标签：时间分桶 + 指数衰减
+
+每次给动态打标签 / 去掉标签时，按动态的发布时间把 ±1 记入 TagUsageBucket 的小时桶与日桶：
+- 小时桶保留最近 TRENDING_TAGS_HOURLY_HOURS 小时（向前取整到零点），计分时用于近期
+- 日桶保留 TRENDING_TAGS_WINDOW_DAYS 天，计分时用于小时桶覆盖范围之前的部分
+标签得分 = Σ 桶内次数 × 0.5 ^ (桶中点距今的小时数 / TRENDING_TAGS_HALF_LIFE_HOURS)。
+
+接口只读缓存中预先算好的前 LIMIT 个标签名（TRENDING_TAGS_CACHE_TIMEOUT 秒后重新计算一次，
+只读窗口内的分桶，不扫描动态表）。过期分桶由 manage.py trending_tags 定期清理；
+bulk 导入（不触发信号）后用 trending_tags --rebuild 按现有标签关联重建。
+"""
+from collections import Counter, defaultdict
+from datetime import timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F, Q, Value
+from django.db.models.functions import Greatest
+from django.db.models.signals import m2m_changed, post_delete, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from api.models import Post, Tag, TagUsageBucket
+
+HALF_LIFE = getattr(settings, 'TRENDING_TAGS_HALF_LIFE_HOURS', 24)
+HOURLY_HOURS = getattr(settings, 'TRENDING_TAGS_HOURLY_HOURS', 48)
+WINDOW_DAYS = getattr(settings, 'TRENDING_TAGS_WINDOW_DAYS', 14)
+CACHE_TIMEOUT = getattr(settings, 'TRENDING_TAGS_CACHE_TIMEOUT', 300)
+
+LIMIT = 20
+CACHE_KEY = 'trending_tags:ranking'
+BATCH = 500
+
+HOUR, DAY = TagUsageBucket.HOUR, TagUsageBucket.DAY
+WIDTH = {HOUR: timedelta(hours=1), DAY: timedelta(days=1)}
+
+
+def floor(moment, granularity):
+    """UTC 整点 / 零点"""
+    moment = moment.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0) if granularity == DAY else moment
+
+
+def cutoffs(now=None):
+    """(小时桶起点, 日桶起点)：小时桶覆盖 [小时桶起点, now]，日桶覆盖 [日桶起点, 小时桶起点)"""
+    now = now or timezone.now()
+    return floor(now - timedelta(hours=HOURLY_HOURS), DAY), floor(now, DAY) - timedelta(days=WINDOW_DAYS)
+
+
+def buckets(usages, now=None):
+    """[(tag_id, 发布时间)] -> Counter{(tag_id, 粒度, 起点): 次数}，只含保留期内的桶"""
+    hourly_since, window_start = cutoffs(now)
+    counts = Counter()
+    for tag_id, moment in usages:
+        hour = floor(moment, HOUR)
+        if hour >= hourly_since:
+            counts[tag_id, HOUR, hour] += 1
+        day = floor(moment, DAY)
+        if day >= window_start:
+            counts[tag_id, DAY, day] += 1
+    return counts
+
+
+def record(usages, sign=1):
+    """把一批标签使用（sign=1）或撤销（sign=-1）记入分桶"""
+    counts = buckets(usages)
+    if not counts:
+        return
+    if sign > 0:
+        # 先补齐不存在的桶，再统一原子自增（并发创建冲突时忽略）
+        TagUsageBucket.objects.bulk_create([
+            TagUsageBucket(tag_id=tag_id, granularity=granularity, start=start)
+            for tag_id, granularity, start in counts
+        ], batch_size=BATCH, ignore_conflicts=True)
+    # 同一时刻、同样增量的桶合并为一条 UPDATE（单条动态的标签只需两条：小时桶、日桶）
+    groups = defaultdict(list)
+    for (tag_id, granularity, start), n in counts.items():
+        groups[granularity, start, n].append(tag_id)
+    for (granularity, start, n), tag_ids in groups.items():
+        TagUsageBucket.objects.filter(tag_id__in=tag_ids, granularity=granularity, start=start).update(
+            count=Greatest(F('count') + sign * n, Value(0)),
+        )
+
+
+def scores(now=None):
+    """tag_id -> 衰减后的得分（只读窗口内的分桶）"""
+    now = now or timezone.now()
+    hourly_since, window_start = cutoffs(now)
+    rows = TagUsageBucket.objects.filter(
+        Q(granularity=HOUR, start__gte=hourly_since)
+        | Q(granularity=DAY, start__gte=window_start, start__lt=hourly_since),
+        count__gt=0,
+    ).values_list('tag_id', 'granularity', 'start', 'count')
+    result = defaultdict(float)
+    for tag_id, granularity, start, count in rows:
+        age = max((now - start - WIDTH[granularity] / 2).total_seconds() / 3600, 0)
+        result[tag_id] += count * 0.5 ** (age / HALF_LIFE)
+    return result
+
+
+def ranking(limit=LIMIT, now=None):
+    """得分最高的标签名（得分相同时按名称）"""
+    top = sorted(scores(now).items(), key=lambda item: -item[1])[:limit]
+    if not top:
+        return []
+    names = dict(Tag.objects.filter(id__in=[tag_id for tag_id, _ in top]).values_list('id', 'name'))
+    ranked = sorted(((score, names[tag_id]) for tag_id, score in top if tag_id in names), key=lambda r: (-r[0], r[1]))
+    return [name for _, name in ranked]
+
+
+def refresh():
+    """重新计算并缓存排行"""
+    names = ranking()
+    cache.set(CACHE_KEY, names, CACHE_TIMEOUT)
+    return names
+
+
+def hot_tags():
+    names = cache.get(CACHE_KEY)
+    if names is None:
+        names = refresh()
+    return names
+
+
+def prune(now=None):
+    """删除保留期之前的分桶，返回删除的行数"""
+    hourly_since, window_start = cutoffs(now)
+    deleted, _ = TagUsageBucket.objects.filter(
+        Q(granularity=HOUR, start__lt=hourly_since) | Q(granularity=DAY, start__lt=window_start)
+    ).delete()
+    return deleted
+
+
+def rebuild():
+    """按现有标签关联重建保留期内的全部分桶，返回写入的桶数"""
+    _, window_start = cutoffs()
+    links = Tag.posts.through.objects.filter(post__created_at__gte=window_start)
+    counts = buckets(links.values_list('tag_id', 'post__created_at').iterator(chunk_size=BATCH))
+    TagUsageBucket.objects.all().delete()
+    TagUsageBucket.objects.bulk_create([
+        TagUsageBucket(tag_id=tag_id, granularity=granularity, start=start, count=n)
+        for (tag_id, granularity, start), n in counts.items()
+    ], batch_size=BATCH)
+    return len(counts)
+
+
+# --------------- 同步信号 ---------------
+
+@receiver(m2m_changed, sender=Tag.posts.through)
+def count_tag_usage(sender, instance, action, reverse, pk_set, **kwargs):
+    """post.tags.add(...) 时 instance 为动态、pk_set 为标签；tag.posts.add(...) 时 instance 为标签、pk_set 为动态"""
+    if action == 'pre_clear':
+        # clear() 的 post_clear 不带 pk_set，先记下将被解除的关联
+        if reverse:
+            instance._trending_cleared = [(tag_id, instance.created_at)
+                                          for tag_id in instance.tags.values_list('id', flat=True)]
+        else:
+            instance._trending_cleared = [(instance.pk, created_at)
+                                          for created_at in instance.posts.values_list('created_at', flat=True)]
+    elif action == 'post_clear':
+        record(getattr(instance, '_trending_cleared', []), sign=-1)
+    elif action in ('post_add', 'post_remove') and pk_set:
+        sign = 1 if action == 'post_add' else -1
+        if reverse:
+            record([(tag_id, instance.created_at) for tag_id in pk_set], sign)
+        else:
+            posts = Post.objects.filter(pk__in=pk_set).values_list('created_at', flat=True)
+            record([(instance.pk, created_at) for created_at in posts], sign)
+
+
+@receiver(pre_delete, sender=Post)
+def remember_post_tags(sender, instance, **kwargs):
+    # 删除动态时级联删除标签关联，不发 m2m 信号
+    instance._trending_tag_ids = list(instance.tags.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Post)
+def uncount_deleted_post(sender, instance, **kwargs):
+    record([(tag_id, instance.created_at) for tag_id in getattr(instance, '_trending_tag_ids', [])], sign=-1)
@@ -3,10 +3,13 @@
 from rest_framework import generics, status
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
-from django.db.models import Q, Count
-from api.models import Post, Friendship, Follow
+from django.db.models import Q
+from api.models import Post
+from api import social
+from api.pagination import CreatedAtCursorPagination, use_cursor
+from . import index, results, suggest, trending
 from .models import SearchHistory
-from .serializers import PostSerializer, SearchHistorySerializer
+from .serializers import PostSerializer, SearchHistorySerializer, SEARCH_TERMS_KEY
 from api.serializers import UserSerializer
 from datetime import datetime
 # 需要用到 User
@@ -16,68 +19,104 @@ User = get_user_model()
 # --------------- 1.搜索接口  ---------------
 class SearchView(generics.GenericAPIView):
     """
-    GET /api/search ?keyword=&tag=&date=&page=&pageSize=
+    GET /api/search ?keyword=&tag=&date=&page=&pageSize=&cursor=
     支持关键词、标签（单/多）和日期的组合筛选，按可见性过滤
+    关键词走全文索引：页码分页按 BM25 相关度排序，游标分页按时间排序；结果带命中高亮的 snippet
+    页码分页的有序结果 ID 按（查询条件, 受众）缓存，见 search/results.py
     """
     serializer_class = PostSerializer
 
     def get(self, request):
-        kw   = request.GET.get('keyword','').strip()
-        tag  = request.GET.get('tag','').strip()
-        tags = request.GET.get('tags','').strip()
-        date = request.GET.get('date','')          # YYYY-MM-DD
-        date_from = request.GET.get('date_from','').strip()
-        date_to   = request.GET.get('date_to','').strip()
+        query = results.normalize(request.GET)
+        kw = query['keyword']
         page = int(request.GET.get('page',1))
         pz   = int(request.GET.get('pageSize',10))
 
-        qs = Post.objects.all()
-        # 关键词
-        if kw:
+        user = request.user if request.user.is_authenticated else None
+        friend_ids = social.get_friend_ids(user.id) if user else frozenset()
+
+        next_cursor = None
+        if use_cursor(request):
+            # 游标分页：按 (created_at, id) 键集翻页，总数按需统计（关键词的 MATCH 在同一条 SQL 中）
+            qs, _ = self.filter_posts(query, user, friend_ids)
+            paginator = CreatedAtCursorPagination()
+            posts = paginator.paginate_queryset(qs, request)
+            total = paginator.get_total()
+            next_cursor = paginator.get_next_cursor()
+            user_ids = self.match_users(kw, ranked=index.enabled() and bool(index.query_terms(kw)))
+        else:
+            # 页码分页：缓存有序的动态 ID 列表，命中时只取回当前页
+            audience = results.audience(user, friend_ids)
+            result = results.get(query, audience)
+            if result is None:
+                qs, filtered = self.filter_posts(query, user, friend_ids)
+                result = self.collect(qs, filtered, kw)
+                results.put(query, audience, result)
+            start = (page-1)*pz
+            total = result['total']
+            user_ids = result['user_ids']
+            if start + pz <= len(result['ids']) or len(result['ids']) == total:
+                page_ids = result['ids'][start:start+pz]
+                position = {post_id: i for i, post_id in enumerate(page_ids)}
+                posts = sorted(Post.objects.select_related('user__profile').filter(id__in=page_ids),
+                               key=lambda post: position[post.id])
+            else:
+                # 超出缓存的 ID 上限：直接分页查询（全文检索仍按相关度，LIMIT / OFFSET 在过滤后的匹配上执行）
+                qs, filtered = self.filter_posts(query, user, friend_ids)
+                if filtered is not None:
+                    page_ids = index.search_posts(kw, posts=filtered, limit=pz, offset=start)
+                    position = {post_id: i for i, post_id in enumerate(page_ids)}
+                    posts = sorted(qs.filter(id__in=page_ids), key=lambda post: position[post.id])
+                else:
+                    posts = qs.order_by('-created_at', '-id')[start:start+pz]
+
+        ser = PostSerializer(posts, many=True, context={
+            'request': request,
+            SEARCH_TERMS_KEY: index.query_terms(kw) if kw else None,
+        })
+
+        # 同时返回用户搜索结果，便于前端按用户名添加好友
+        position = {user_id: i for i, user_id in enumerate(user_ids)}
+        users_qs = sorted(User.objects.filter(id__in=user_ids), key=lambda u: position[u.id])
+        users = UserSerializer(users_qs, many=True, context={'request': request}).data
+
+        return Response({
+            'success': True,
+            'data': {
+                'results': ser.data,
+                'total': total,
+                'users': users,
+                'next_cursor': next_cursor
+            }
+        })
+
+    def filter_posts(self, query, user, friend_ids):
+        """
+        按查询条件与可见性过滤动态，返回 (QuerySet, 不含关键词条件的 QuerySet 或 None)
+        关键词走全文索引时第二项不为 None：按相关度排序时把它与 MATCH 组合成一条 SQL（见 index.search_posts）；
+        第一项以 MATCH 子查询过滤，用于按时间排序
+        """
+        kw = query['keyword']
+        qs = Post.objects.select_related('user__profile')
+        fts = kw and index.enabled() and index.query_terms(kw)
+        if kw and not fts:
             qs = qs.filter(Q(text__icontains=kw)|Q(user__username__icontains=kw))
         # 标签：兼容 tag 单值和 tags 多值(逗号分隔)
-        if tag:
-            qs = qs.filter(tags__name=tag)
-        if tags:
-            tag_list = [t.strip() for t in tags.split(',') if t.strip()]
-            if tag_list:
-                qs = qs.filter(tags__name__in=tag_list).distinct()
-        # 日期：单日或范围
-        if date:
-            try:
-                d = datetime.strptime(date,'%Y-%m-%d').date()
-                qs = qs.filter(created_at__date=d)
-            except ValueError:
-                pass
-        if date_from:
-            try:
-                df = datetime.strptime(date_from,'%Y-%m-%d').date()
-                qs = qs.filter(created_at__date__gte=df)
-            except ValueError:
-                pass
-        if date_to:
-            try:
-                dt = datetime.strptime(date_to,'%Y-%m-%d').date()
-                qs = qs.filter(created_at__date__lte=dt)
-            except ValueError:
-                pass
+        if query['tag']:
+            qs = qs.filter(tags__name=query['tag'])
+        if query['tags']:
+            qs = qs.filter(tags__name__in=query['tags']).distinct()
+        # 日期：单日或范围（非法日期已在归一化时忽略）
+        if query['date']:
+            qs = qs.filter(created_at__date=query['date'])
+        if query['date_from']:
+            qs = qs.filter(created_at__date__gte=query['date_from'])
+        if query['date_to']:
+            qs = qs.filter(created_at__date__lte=query['date_to'])
 
         # 可见性过滤
-        user = request.user if request.user.is_authenticated else None
         public_q = Q(visibility='public')
         if user:
-            friend_ids = set()
-            # accepted friendships
-            friendships = Friendship.objects.filter(
-                Q(status='accepted') & (Q(from_user=user) | Q(to_user=user))
-            )
-            for fr in friendships:
-                friend_ids.add(fr.to_user_id if fr.from_user_id == user.id else fr.from_user_id)
-            # mutual follow = intersection
-            following_ids = set(Follow.objects.filter(follower=user).values_list('following_id', flat=True))
-            follower_ids = set(Follow.objects.filter(following=user).values_list('follower_id', flat=True))
-            mutual_ids = following_ids.intersection(follower_ids)
-            friend_ids.update(mutual_ids)
             qs = qs.filter(
                 Q(user=user) |
                 public_q |
@@ -85,60 +124,53 @@ class SearchView(generics.GenericAPIView):
             )
         else:
             qs = qs.filter(public_q)
-
-
-        total = qs.count()
-        start = (page-1)*pz
-        posts = qs[start:start+pz]
-
-        ser = PostSerializer(posts, many=True, context={'request':request})
-
-        # 同时返回用户搜索结果，便于前端按用户名添加好友
+        if fts:
+            return qs.filter(id__in=index.post_match(kw)), qs
+        return qs, None
+
+    def collect(self, qs, filtered, kw):
+        """待缓存的结果：有序动态 ID（最多 SEARCH_CACHE_MAX_IDS 个）、总数与匹配的用户 ID"""
+        if filtered is not None:
+            # 过滤条件与 MATCH 同一条 SQL：按相关度取前 MAX_IDS 个，超出时再 COUNT
+            ids = index.search_posts(kw, posts=filtered, limit=results.MAX_IDS)
+            total = index.count_posts(kw, posts=filtered) if len(ids) == results.MAX_IDS else len(ids)
+        else:
+            ids = list(qs.order_by('-created_at', '-id').values_list('id', flat=True)[:results.MAX_IDS])
+            total = qs.count() if len(ids) == results.MAX_IDS else len(ids)
+        return {'ids': ids, 'total': total, 'user_ids': self.match_users(kw, filtered is not None)}
+
+    def match_users(self, kw, ranked):
+        """按用户名匹配的用户 ID（最多 10 个）"""
+        if ranked:
+            return index.search_users(kw)
         users_qs = User.objects.all()
         if kw:
             users_qs = users_qs.filter(Q(username__icontains=kw))
-        users = UserSerializer(users_qs[:10], many=True, context={'request': request}).data
+        return list(users_qs.order_by('id').values_list('id', flat=True)[:10])
 
-        return Response({
-            'success': True,
-            'data': {
-                'results': ser.data,
-                'total': total,
-                'users': users
-            }
-        })
 
 # --------------- 2.热门标签接口  ---------------
 class HotTagsView(generics.GenericAPIView):
     """
     GET /api/tags/hot
+    按时间衰减的使用量排序的前 20 个标签名（见 search/trending.py）
     """
     def get(self, request):
-        # 按 tag 出现次数倒序
-        tags = (Post.objects.values('tag')
-                            .annotate(c=Count('id'))
-                            .order_by('-c')[:20])
-        data = [t['tag'] for t in tags if t['tag']]
-        return Response({'success':True,'data':{'tags':data}})
+        # 读取预先计算并缓存的排行，缓存有效期内不访问数据库
+        return Response({'success':True,'data':{'tags':trending.hot_tags()}})
 
 # --------------- 3.搜索建议接口  ---------------
 class SearchSuggestionsView(generics.GenericAPIView):
     """
     GET /api/search/suggestions ?keyword=
+    按前缀匹配用户名、标签与热门搜索词
     """
     def get(self, request):
         kw = request.GET.get('keyword','').strip()
         if not kw:
             return Response({'success':True,'data':{'suggestions':[]}})
-        # 简单示范：从用户名、tag、历史关键词中模糊匹配
-        user_qs = User.objects.filter(username__icontains=kw)[:5]
-        tag_qs  = (Post.objects.filter(tag__icontains=kw)
-                               .values_list('tag',flat=True).distinct()[:5])
-        hist_qs = (SearchHistory.objects.filter(keyword__icontains=kw)
-                                        .values_list('keyword',flat=True)
-                                        .distinct()[:5])
-        sugs = list({u.username for u in user_qs}) + list(tag_qs) + list(hist_qs)
-        sugs = list(dict.fromkeys(sugs))[:10]   # 去重
+        # 进程内前缀索引（用户名、标签、热门搜索词，按热度排序），不访问数据库
+        sugs = suggest.suggest(kw, limit=10)
         return Response({'success':True,'data':{'suggestions':sugs}})
 
 
@@ -1,8 +1,14 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
 from django.contrib.auth.password_validation import validate_password
+from django.db import transaction
 from django.utils import timezone
+from . import tags as tag_registry
 from .models import Profile, Post, Like, Comment, Tag, Friendship
+from .loaders import (
+    POST_BATCH_KEY, COMMENT_PREVIEW_SIZE, get_batch, counter_value, media_variants,
+    UserListSerializer, CommentListSerializer, PostListSerializer,
+)
 
 
 class ProfileSerializer(serializers.ModelSerializer):
@@ -12,17 +18,15 @@ class ProfileSerializer(serializers.ModelSerializer):
 
 
 class UserSerializer(serializers.ModelSerializer):
+    # profile 由用户创建信号和数据迁移保证存在，读路径不再补建
     profile = ProfileSerializer(read_only=True, required=False)
 
     class Meta:
         model = User
         fields = ['id', 'username', 'email', 'first_name', 'last_name', 'date_joined', 'profile']
         read_only_fields = ['id', 'date_joined']
+        list_serializer_class = UserListSerializer
 
-    def to_representation(self, instance):
-        # 确保旧用户也有 profile 以避免序列化时报错
-        Profile.objects.get_or_create(user=instance)
-        return super().to_representation(instance)
 
 
 class UserUpdateSerializer(serializers.ModelSerializer):
@@ -88,6 +92,7 @@ class CommentSerializer(serializers.ModelSerializer):
         model = Comment
         fields = ['id', 'name', 'avatar', 'content', 'time']
         read_only_fields = ['id', 'name', 'avatar', 'time']
+        list_serializer_class = CommentListSerializer
 
     def get_time(self, obj):
         """格式化时间为友好显示"""
@@ -144,23 +149,45 @@ class PostSerializer(serializers.ModelSerializer):
     time = serializers.SerializerMethodField(read_only=True)
     tags = serializers.SerializerMethodField(read_only=True)
     visibility = serializers.CharField(read_only=True)
+    likes_count = serializers.SerializerMethodField(read_only=True)
+    comments_count = serializers.SerializerMethodField(read_only=True)
+    media_variants = serializers.SerializerMethodField(read_only=True)
 
     class Meta:
         model = Post
-        fields = ['id', 'user', 'text', 'type', 'media', 'visibility', 'created_at', 'likes_count', 'comments_count', 'comment', 'is_liked', 'time', 'tags']
-        read_only_fields = ['id', 'user', 'likes_count', 'comments_count', 'comment', 'is_liked', 'time', 'tags', 'visibility']
+        fields = ['id', 'user', 'text', 'type', 'media', 'media_variants', 'visibility', 'created_at', 'likes_count', 'comments_count', 'comment', 'is_liked', 'time', 'tags']
+        read_only_fields = ['id', 'user', 'likes_count', 'comments_count', 'comment', 'is_liked', 'time', 'tags', 'visibility', 'media_variants']
+        list_serializer_class = PostListSerializer
+
+    def get_likes_count(self, obj):
+        return counter_value(self, obj, 'likes_count')
+
+    def get_comments_count(self, obj):
+        return counter_value(self, obj, 'comments_count')
+
+    def get_media_variants(self, obj):
+        # 与 media 一一对应：各宽度的 JPEG / WebP 衍生图，处理中时回退为原图
+        return media_variants(self, obj)
 
     def get_comment(self, obj):
         """获取该动态的最新3条评论"""
-        comments = obj.comments.all().order_by('-created_at')[:3]
+        batch = get_batch(self, POST_BATCH_KEY, obj)
+        if batch is not None:
+            comments = batch.comment_previews.get(obj.id, [])
+        else:
+            comments = obj.comments.select_related('user__profile').order_by('-created_at')[:COMMENT_PREVIEW_SIZE]
         return CommentSerializer(comments, many=True).data
 
     def get_is_liked(self, obj):
         """检查当前用户是否已点赞该动态"""
-        user = self.context.get('request').user
-        if user.is_authenticated:
-            return obj.likes.filter(user=user).exists()
-        return False
+        request = self.context.get('request')
+        user = getattr(request, 'user', None)
+        if not user or not user.is_authenticated:
+            return False
+        batch = get_batch(self, POST_BATCH_KEY, obj)
+        if batch is not None:
+            return obj.id in batch.liked_post_ids
+        return obj.likes.filter(user=user).exists()
 
     def get_time(self, obj):
         """格式化时间为友好显示"""
@@ -182,6 +209,9 @@ class PostSerializer(serializers.ModelSerializer):
 
     def get_tags(self, obj):
         """获取动态的标签列表"""
+        batch = get_batch(self, POST_BATCH_KEY, obj)
+        if batch is not None:
+            return batch.tag_names.get(obj.id, [])
         return [tag.name for tag in obj.tags.all()]
 
 
@@ -196,16 +226,8 @@ class CreatePostSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         tags_data = validated_data.pop('tags', [])
         validated_data['user'] = self.context['request'].user
-        post = Post.objects.create(**validated_data)
-        # 处理标签：按名称获取或创建
-        if tags_data:
-            tag_objs = []
-            for name in tags_data:
-                name = name.strip()
-                if not name:
-                    continue
-                tag_obj, _ = Tag.objects.get_or_create(name=name)
-                tag_objs.append(tag_obj)
-            if tag_objs:
-                post.tags.set(tag_objs)
+        # 处理标签：按名称解析（不存在的批量创建），与动态在同一事务中一次写入关联
+        with transaction.atomic():
+            post = Post.objects.create(**validated_data)
+            tag_registry.attach(post, tags_data)
         return post
@@ -0,0 +1,99 @@
+"""
+社交关系图缓存
+
+按用户缓存好友 / 关注 / 粉丝 / 互关的 ID 集合，避免每次请求都遍历
+Friendship 并在 Python 中求两份 Follow 列表的交集。
+缓存条目由 Friendship / Follow 的保存与删除信号精确失效。
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Friendship, Follow
+
+CACHE_TIMEOUT = getattr(settings, 'SOCIAL_GRAPH_CACHE_TIMEOUT', 300)
+
+
+def _cache_key(user_id):
+    return f'social_graph:{user_id}'
+
+
+def _build_graph(user_id):
+    """从数据库构建某个用户的关系图（3 次查询）"""
+    friend_ids = set()
+    # status 写进 OR 的两侧，使两侧分别命中 (status, from_user) / (status, to_user) 索引
+    pairs = Friendship.objects.filter(
+        Q(status='accepted', from_user_id=user_id) | Q(status='accepted', to_user_id=user_id)
+    ).values_list('from_user_id', 'to_user_id')
+    for from_id, to_id in pairs:
+        friend_ids.add(to_id if from_id == user_id else from_id)
+
+    following_ids = frozenset(
+        Follow.objects.filter(follower_id=user_id).values_list('following_id', flat=True)
+    )
+    follower_ids = frozenset(
+        Follow.objects.filter(following_id=user_id).values_list('follower_id', flat=True)
+    )
+    mutual_ids = following_ids & follower_ids
+    # 互关也视作好友
+    friend_ids.update(mutual_ids)
+    return {
+        'friends': frozenset(friend_ids),
+        'following': following_ids,
+        'followers': follower_ids,
+        'mutual': mutual_ids,
+    }
+
+
+def get_graph(user_id):
+    """获取用户关系图，未命中缓存时构建并写入缓存"""
+    key = _cache_key(user_id)
+    graph = cache.get(key)
+    if graph is None:
+        graph = _build_graph(user_id)
+        cache.set(key, graph, CACHE_TIMEOUT)
+    return graph
+
+
+def get_friend_ids(user_id):
+    """好友 ID 集合（已同意的好友申请 + 互相关注）"""
+    return get_graph(user_id)['friends']
+
+
+def get_following_ids(user_id):
+    """我关注的用户 ID 集合"""
+    return get_graph(user_id)['following']
+
+
+def get_follower_ids(user_id):
+    """关注我的用户 ID 集合"""
+    return get_graph(user_id)['followers']
+
+
+def get_mutual_ids(user_id):
+    """互相关注的用户 ID 集合"""
+    return get_graph(user_id)['mutual']
+
+
+def invalidate(*user_ids):
+    """使若干用户的关系图缓存失效；事务提交后再失效一次，避免并发读回填旧数据"""
+    keys = [_cache_key(uid) for uid in user_ids if uid]
+    if not keys:
+        return
+    cache.delete_many(keys)
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+@receiver(post_save, sender=Friendship)
+@receiver(post_delete, sender=Friendship)
+def invalidate_friendship(sender, instance, **kwargs):
+    invalidate(instance.from_user_id, instance.to_user_id)
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def invalidate_follow(sender, instance, **kwargs):
+    invalidate(instance.follower_id, instance.following_id)
@@ -0,0 +1,118 @@
+"""
+标签注册表：名称 -> ID 的进程内缓存与批量挂载
+
+发布动态时按名称解析标签，命中缓存不查库；未知名称先查一次已有的，
+其余用一条 bulk_create(ignore_conflicts=True) 创建后再取回 ID。
+动态与标签的关联用一条 INSERT ... SELECT 写入中间表，并手动发出 m2m_changed，
+全文索引、搜索结果缓存、搜索建议与热门标签照常同步。查询数与标签个数无关。
+
+缓存由本进程的 Tag 保存/删除信号维护；其他进程删除标签后缓存中的 ID 可能失效，
+INSERT ... SELECT 只会挂载仍存在的标签，缺少的部分丢弃缓存后重新解析。
+"""
+import threading
+
+from django.db import connection
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Tag
+
+MAX_SIZE = 10000  # 缓存的标签数上限，超出时整体清空
+
+_ids = {}
+_lock = threading.Lock()
+
+
+def clean(names):
+    """去掉首尾空白、空名称与重复（保留顺序）"""
+    return list(dict.fromkeys(name.strip() for name in names if name and name.strip()))
+
+
+def clear():
+    with _lock:
+        _ids.clear()
+
+
+def _remember(pairs):
+    with _lock:
+        if len(_ids) + len(pairs) > MAX_SIZE:
+            _ids.clear()
+        _ids.update(pairs)
+
+
+def _forget(names):
+    with _lock:
+        for name in names:
+            _ids.pop(name, None)
+
+
+def resolve(names):
+    """名称 -> 标签 ID，不存在的标签批量创建（最多 3 次查询，全部命中缓存时不查询）"""
+    names = clean(names)
+    with _lock:
+        result = {name: _ids[name] for name in names if name in _ids}
+    missing = [name for name in names if name not in result]
+    if missing:
+        found = dict(Tag.objects.filter(name__in=missing).values_list('name', 'id'))
+        new = [name for name in missing if name not in found]
+        if new:
+            Tag.objects.bulk_create([Tag(name=name) for name in new], ignore_conflicts=True)
+            created = list(Tag.objects.filter(name__in=new))
+            found.update((tag.name, tag.id) for tag in created)
+            for tag in created:
+                # bulk_create 不发信号，补发 post_save 让搜索建议等收录新标签
+                post_save.send(Tag, instance=tag, created=True, update_fields=None, raw=False,
+                               using=tag._state.db)
+        _remember(found)
+        result.update(found)
+    return {name: result[name] for name in names if name in result}
+
+
+def _insert_links(post, tag_ids):
+    """一条语句写入中间表（只挂载仍存在的标签），返回写入的标签 ID 集合"""
+    through = Tag.posts.through._meta
+    placeholders = ', '.join(['%s'] * len(tag_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {through.db_table} (post_id, tag_id) '
+            f'SELECT %s, id FROM {Tag._meta.db_table} WHERE id IN ({placeholders})',
+            [post.pk, *tag_ids],
+        )
+        if cursor.rowcount == len(tag_ids):
+            return set(tag_ids)
+    return set(Tag.posts.through.objects.filter(post=post, tag_id__in=tag_ids).values_list('tag_id', flat=True))
+
+
+def attach(post, names):
+    """给新建的动态挂载标签，返回挂载的标签 ID；须在事务中调用，与创建动态一起提交"""
+    ids = resolve(names)
+    if not ids:
+        return set()
+    pk_set = set(ids.values())
+    signal_kwargs = dict(sender=Tag.posts.through, instance=post, reverse=True, model=Tag, using=post._state.db)
+    m2m_changed.send(action='pre_add', pk_set=pk_set, **signal_kwargs)
+    attached = _insert_links(post, sorted(pk_set))
+    stale = [name for name, tag_id in ids.items() if tag_id not in attached]
+    if stale:
+        # 缓存中的标签已被其他进程删除：丢弃后重新解析（会重新创建）并补挂
+        _forget(stale)
+        retry = set(resolve(stale).values()) - attached
+        if retry:
+            attached |= _insert_links(post, sorted(retry))
+    m2m_changed.send(action='post_add', pk_set=attached, **signal_kwargs)
+    return attached
+
+
+@receiver(post_save, sender=Tag)
+def remember_saved_tag(sender, instance, created, **kwargs):
+    if not created:
+        # 改名时旧名称不再指向该标签
+        with _lock:
+            for name in [name for name, tag_id in _ids.items() if tag_id == instance.pk and name != instance.name]:
+                del _ids[name]
+    _remember({instance.name: instance.pk})
+
+
+@receiver(post_delete, sender=Tag)
+def forget_deleted_tag(sender, instance, **kwargs):
+    _forget([instance.name])
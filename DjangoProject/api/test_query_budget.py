@@ -0,0 +1,201 @@
+"""
+各接口 SQL 查询预算
+
+在接近真实的数据（好友、关注、带标签的动态、点赞、评论、通知、搜索历史）上，
+以 pageSize = 1 / 20 / 100 调用每个公开的读接口，各测两遍：
+- 冷缓存：清空缓存（关系图、结果缓存、热门标签、标签注册表等）后的第一次请求，即最坏情况
+- 热缓存：紧接着的第二次请求
+两遍的查询数都不得超过该接口的预算，且不能随页大小增长（即没有 N+1）。
+所有支持 GET 的 /api/ 路由都必须列在 BUDGETS 或 UNBUDGETED 中，新增接口时同时补上预算。
+失败时按归一化后的 SQL 模式汇总，便于定位重复查询。
+"""
+import re
+from collections import Counter
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLResolver, get_resolver
+from rest_framework.test import APIClient
+
+from notifications import services as notification_services
+from notifications.models import Notification
+from publish.models import UploadSession
+from . import tags as tag_registry
+from .models import Post, Like, Comment, Tag, Friendship, Follow
+from .search.models import SearchHistory
+
+PAGE_SIZES = (1, 20, 100)
+
+# 接口 -> (冷缓存预算, 热缓存预算)（与页大小无关）
+BUDGETS = {
+    '/api/timeline/': (4, 4),
+    '/api/posts/{post_id}/comments/': (3, 3),
+    '/api/friends/': (1, 1),
+    '/api/friends/requests/': (1, 1),
+    '/api/following/': (1, 1),
+    '/api/followers/': (1, 1),
+    '/api/users/': (3, 3),
+    '/api/users/me/': (0, 0),
+    '/api/admin/users/': (3, 3),
+    '/api/admin/posts/': (5, 5),
+    '/api/user/posts/': (5, 5),
+    '/api/user/posts/{post_id}/comments/': (3, 3),
+    '/api/user/stats/': (1, 1),
+    '/api/publish/posts/': (4, 4),
+    '/api/publish/tags/common/': (0, 0),
+    '/api/publish/user/current/': (0, 0),
+    '/api/notifications/': (5, 5),
+    '/api/notifications/badge/': (1, 1),
+    '/api/search': (8, 3),  # 冷：关系图 3 次、动态与用户各一次 MATCH、本页批量数据；热：命中结果缓存，只取回本页
+    '/api/search/suggestions': (0, 0),  # 进程内前缀索引
+    '/api/search/history': (1, 1),
+    '/api/tags/hot': (2, 0),  # 冷：按分桶计算排行；热：读取缓存的排行
+    '/api/setting/me/': (0, 0),
+    '/api/': (0, 0),
+    '/api/health/': (0, 0),
+    '/api/info/': (0, 0),
+    '/api/users/register/': (0, 0),
+    '/api/users/{pk}/': (2, 2),
+    '/api/publish/uploads/{session_id}/': (1, 1),  # 分块上传会话的当前偏移
+}
+
+# 不做预算检查的 GET 接口及原因
+UNBUDGETED = {
+    '/api/notifications/stream/': 'SSE 长连接，由 NotificationStreamTests 检查共享轮询的查询数',
+}
+
+_LITERALS = re.compile(r"'[^']*'|\b\d+\b")
+_IN_LISTS = re.compile(r'IN \([^)]*\)')
+
+
+def normalize(sql):
+    """把 SQL 中的字面量与 IN 列表替换为占位符，便于按模式归并"""
+    sql = _LITERALS.sub('?', sql)
+    return _IN_LISTS.sub('IN (...)', sql)
+
+
+def reset_caches():
+    """清空跨请求的缓存，使下一次请求处于冷缓存状态"""
+    cache.clear()
+    tag_registry.clear()
+
+
+_CONVERTERS = re.compile(r'<(?:\w+:)?(\w+)>|\(\?P<(\w+)>[^)]*\)')
+
+
+def get_routes(patterns=None, prefix=''):
+    """支持 GET 的 /api/ 路由，路径参数写成 {name}（与 BUDGETS 的写法一致），忽略格式后缀"""
+    routes = []
+    for pattern in get_resolver().url_patterns if patterns is None else patterns:
+        route = prefix + str(pattern.pattern).lstrip('^').rstrip('$')
+        if isinstance(pattern, URLResolver):
+            routes += get_routes(pattern.url_patterns, route)
+            continue
+        if not route.startswith('api/') or 'format' in route:
+            continue
+        view = pattern.callback
+        actions = getattr(view, 'actions', None)
+        cls = getattr(view, 'cls', None) or getattr(view, 'view_class', None)
+        if actions is not None:
+            allowed = 'get' in actions
+        elif cls is not None:
+            allowed = hasattr(cls, 'get')
+        else:
+            allowed = True  # 普通视图函数：保守地视为支持 GET
+        if allowed:
+            routes.append('/' + _CONVERTERS.sub(lambda m: '{%s}' % (m.group(1) or m.group(2)), route))
+    return routes
+
+
+def describe(queries):
+    patterns = Counter(normalize(q['sql']) for q in queries)
+    return '\n'.join(f'  {count} x {pattern}' for pattern, count in patterns.most_common())
+
+
+class QueryBudgetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cache.clear()
+        cls.viewer = User.objects.create_user(username='viewer', password='password0', is_staff=True)
+        cls.users = [User.objects.create_user(username=f'user{i}', password='password') for i in range(12)]
+        tags = [Tag.objects.get_or_create(name=name)[0] for name in ('户外', '日常', '美食', '露营')]
+
+        for i, user in enumerate(cls.users):
+            if i % 2 == 0:
+                Friendship.objects.create(from_user=cls.viewer, to_user=user, status='accepted')
+            elif i % 3 == 0:
+                Friendship.objects.create(from_user=user, to_user=cls.viewer)
+            Follow.objects.create(follower=cls.viewer, following=user)
+            if i % 4 == 0:
+                Follow.objects.create(follower=user, following=cls.viewer)
+
+        authors = [cls.viewer] + cls.users
+        visibilities = ('public', 'friends', 'private')
+        posts = []
+        for i in range(120):
+            post = Post.objects.create(
+                user=authors[i % len(authors)],
+                text=f'周末去露营 {i}',
+                type='image' if i % 2 else 'text',
+                media=[f'/media/uploads/images/{i}.jpg'] if i % 2 else [],
+                visibility=visibilities[i % 3],
+            )
+            post.tags.add(*tags[:1 + i % len(tags)])
+            posts.append(post)
+
+        # 评论最多的动态属于 viewer，用于评论列表
+        cls.post = posts[0]
+        # 关闭通知聚合，让 viewer 有足够多的通知行用于分页
+        window, notification_services.COALESCE_WINDOW = notification_services.COALESCE_WINDOW, 0
+        try:
+            for i in range(110):
+                Comment.objects.create(user=cls.users[i % len(cls.users)], post=cls.post, content=f'评论 {i}')
+            for post in posts[:40]:
+                for user in cls.users[:5]:
+                    Like.objects.create(user=user, post=post)
+                Comment.objects.create(user=cls.users[0], post=post, content='不错')
+        finally:
+            notification_services.COALESCE_WINDOW = window
+        for i in range(30):
+            SearchHistory.objects.create(user=cls.viewer, keyword=f'露营{i}', date='2025-01-01')
+        assert Notification.objects.filter(user=cls.viewer).count() >= 100
+        cls.upload = UploadSession.objects.create(user=cls.viewer, kind='video', filename='clip.mp4', size=10)
+
+    def setUp(self):
+        reset_caches()
+        self.client = APIClient()
+        self.client.force_authenticate(self.viewer)
+
+    def _measure(self, url, page_size):
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.get(url, {'pageSize': page_size, 'keyword': '露营'})
+        self.assertEqual(resp.status_code, 200, f'{url} -> {resp.status_code}')
+        return ctx.captured_queries
+
+    def test_endpoints_within_budget(self):
+        for template, budgets in BUDGETS.items():
+            url = template.format(post_id=self.post.id, pk=self.users[0].id, session_id=self.upload.id)
+            with self.subTest(url=url):
+                counts = {'冷': {}, '热': {}}
+                for page_size in PAGE_SIZES:
+                    reset_caches()
+                    for (phase, phase_counts), budget in zip(counts.items(), budgets):
+                        queries = self._measure(url, page_size)
+                        phase_counts[page_size] = len(queries)
+                        if len(queries) > budget:
+                            self.fail(
+                                f'{url} pageSize={page_size}（{phase}缓存）执行了 {len(queries)} 次查询，'
+                                f'预算 {budget}：\n{describe(queries)}'
+                            )
+                for phase, phase_counts in counts.items():
+                    self.assertEqual(
+                        len(set(phase_counts.values())), 1,
+                        f'{url} 的查询数随页大小增长（{phase}缓存）：{phase_counts}',
+                    )
+
+    def test_every_get_route_has_a_budget(self):
+        missing = sorted(set(get_routes()) - set(BUDGETS) - set(UNBUDGETED))
+        self.assertEqual(missing, [], '以下 GET 接口没有查询预算')
@@ -1,3 +1,836 @@
-from django.test import TestCase
+import os
+import shutil
+import tempfile
+from concurrent.futures import Future
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.db import connection
+from django.http import HttpResponse
+from django.test import TestCase, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.contrib.auth.models import User
+from django.db.models import F, Sum
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from notifications.models import Notification
+
+from . import social, timeline, counters, timing, derivatives, imaging, tags as tag_registry
+from .management.commands.index_advisor import hot_querysets, diagnose
+from .middleware import ReadPathWriteGuardMiddleware, ReadPathWriteError
+from .models import (
+    Post, Like, Comment, Tag, Friendship, Follow, TimelineEntry, PostCounterShard, TagUsageBucket, ImageDerivative,
+)
+from .search import index as search_index, results as search_results, suggest, trending
+from .search.models import SearchHistory
+from .serializers import PostSerializer
+
+
+class SocialGraphTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user0 = User.objects.create_user(username="user0", password="password0")
+        self.user1 = User.objects.create_user(username="user1", password="password1")
+        self.user2 = User.objects.create_user(username="user2", password="password2")
+
+    def test_graph_is_cached(self):
+        Follow.objects.create(follower=self.user0, following=self.user1)
+        self.assertEqual(social.get_following_ids(self.user0.id), {self.user1.id})
+        with self.assertNumQueries(0):
+            social.get_following_ids(self.user0.id)
+            social.get_friend_ids(self.user0.id)
+
+    def test_friendship_invalidates_both_sides(self):
+        self.assertEqual(social.get_friend_ids(self.user0.id), set())
+        self.assertEqual(social.get_friend_ids(self.user1.id), set())
+        fr = Friendship.objects.create(from_user=self.user0, to_user=self.user1)
+        # 待确认的申请不算好友
+        self.assertEqual(social.get_friend_ids(self.user0.id), set())
+        fr.status = 'accepted'
+        fr.save()
+        self.assertEqual(social.get_friend_ids(self.user0.id), {self.user1.id})
+        self.assertEqual(social.get_friend_ids(self.user1.id), {self.user0.id})
+        fr.delete()
+        self.assertEqual(social.get_friend_ids(self.user1.id), set())
+
+    def test_mutual_follow_counts_as_friend(self):
+        Follow.objects.create(follower=self.user0, following=self.user2)
+        self.assertEqual(social.get_friend_ids(self.user0.id), set())
+        self.assertEqual(social.get_follower_ids(self.user2.id), {self.user0.id})
+        Follow.objects.create(follower=self.user2, following=self.user0)
+        self.assertEqual(social.get_mutual_ids(self.user0.id), {self.user2.id})
+        self.assertEqual(social.get_friend_ids(self.user2.id), {self.user0.id})
+        Follow.objects.filter(follower=self.user2).delete()
+        self.assertEqual(social.get_friend_ids(self.user0.id), set())
+
+
+class CursorPaginationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="user0", password="password0")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.post = Post.objects.create(user=self.user, text="p0")
+        self.comments = [
+            Comment.objects.create(user=self.user, post=self.post, content=f"c{i}") for i in range(5)
+        ]
+
+    def test_walks_all_comments_without_duplicates(self):
+        url = f"/api/posts/{self.post.id}/comments/"
+        seen = []
+        cursor = ""
+        while cursor is not None:
+            resp = self.client.get(url, {"cursor": cursor, "pageSize": 2})
+            self.assertEqual(resp.status_code, 200)
+            data = resp.json()["results"]["data"]
+            self.assertIsNone(data["total"])
+            seen.extend(c["id"] for c in data["comments"])
+            cursor = data["next_cursor"]
+        self.assertEqual(seen, [c.id for c in reversed(self.comments)])
+
+    def test_total_is_opt_in(self):
+        url = f"/api/posts/{self.post.id}/comments/"
+        resp = self.client.get(url, {"cursor": "", "withTotal": 1})
+        self.assertEqual(resp.json()["results"]["data"]["total"], 5)
+
+    def test_invalid_cursor(self):
+        resp = self.client.get(f"/api/posts/{self.post.id}/comments/", {"cursor": "bogus"})
+        self.assertEqual(resp.status_code, 404)
+
+    def test_page_mode_unchanged(self):
+        resp = self.client.get(f"/api/posts/{self.post.id}/comments/", {"page": 2, "pageSize": 2})
+        body = resp.json()
+        self.assertEqual(body["count"], 5)
+        self.assertEqual(body["results"]["data"]["total"], 5)
+        self.assertEqual(len(body["results"]["data"]["comments"]), 2)
+
+
+class TimelineTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username="author", password="password0")
+        self.friend = User.objects.create_user(username="friend", password="password1")
+        self.fan = User.objects.create_user(username="fan", password="password2")
+        self.stranger = User.objects.create_user(username="stranger", password="password3")
+        self.friendship = Friendship.objects.create(from_user=self.author, to_user=self.friend, status="accepted")
+        Follow.objects.create(follower=self.fan, following=self.author)
+
+    def _owners(self, post):
+        return set(TimelineEntry.objects.filter(post=post).values_list("owner_id", flat=True))
+
+    def test_fan_out_respects_visibility(self):
+        public = Post.objects.create(user=self.author, text="public", visibility="public")
+        friends = Post.objects.create(user=self.author, text="friends", visibility="friends")
+        private = Post.objects.create(user=self.author, text="private", visibility="private")
+        self.assertEqual(self._owners(public), {self.author.id, self.friend.id, self.fan.id})
+        self.assertEqual(self._owners(friends), {self.author.id, self.friend.id})
+        self.assertEqual(self._owners(private), {self.author.id})
+
+    def test_unfriend_and_unfollow_retract(self):
+        public = Post.objects.create(user=self.author, text="public", visibility="public")
+        friends = Post.objects.create(user=self.author, text="friends", visibility="friends")
+        self.friendship.delete()
+        self.assertEqual(self._owners(friends), {self.author.id})
+        self.assertEqual(self._owners(public), {self.author.id, self.fan.id})
+        Follow.objects.filter(follower=self.fan).delete()
+        self.assertEqual(self._owners(public), {self.author.id})
+
+    def test_new_follow_backfills(self):
+        public = Post.objects.create(user=self.author, text="public", visibility="public")
+        Follow.objects.create(follower=self.stranger, following=self.author)
+        self.assertIn(self.stranger.id, self._owners(public))
+
+    def test_fanout_cap(self):
+        post = Post(user=self.author, visibility="public")
+        original = timeline.FANOUT_CAP
+        timeline.FANOUT_CAP = 1
+        try:
+            # 好友优先
+            self.assertEqual(timeline.get_recipient_ids(post), [self.friend.id])
+        finally:
+            timeline.FANOUT_CAP = original
+
+    def test_timeline_endpoint(self):
+        posts = [Post.objects.create(user=self.author, text=f"p{i}") for i in range(3)]
+        Post.objects.create(user=self.stranger, text="unrelated")
+        client = APIClient()
+        client.force_authenticate(self.fan)
+        resp = client.get("/api/timeline/", {"pageSize": 2})
+        data = resp.json()["data"]
+        self.assertEqual([p["id"] for p in data["posts"]], [posts[2].id, posts[1].id])
+        resp = client.get("/api/timeline/", {"cursor": data["next_cursor"], "pageSize": 2})
+        data = resp.json()["data"]
+        self.assertEqual([p["id"] for p in data["posts"]], [posts[0].id])
+        self.assertIsNone(data["next_cursor"])
+
+
+class BatchLoadingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="user0", password="password0")
+        self.other = User.objects.create_user(username="user1", password="password1")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.tag = Tag.objects.create(name="露营")
+
+    def _add_posts(self, n):
+        for i in range(n):
+            post = Post.objects.create(user=self.user, text=f"p{i}")
+            self.tag.posts.add(post)
+            Like.objects.create(user=self.user, post=post)
+            for j in range(4):
+                Comment.objects.create(user=self.other, post=post, content=f"c{j}")
+
+    def _count_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.get("/api/user/posts/", {"pageSize": 20})
+        self.assertEqual(resp.status_code, 200)
+        return len(ctx.captured_queries), resp.json()["results"]["data"]["posts"]
+
+    def test_queries_do_not_grow_with_page(self):
+        self._add_posts(1)
+        small, _ = self._count_queries()
+        self._add_posts(9)
+        large, posts = self._count_queries()
+        self.assertEqual(small, large)
+        self.assertEqual(len(posts), 10)
+        first = posts[0]
+        self.assertTrue(first["is_liked"])
+        self.assertEqual(first["tags"], ["露营"])
+        self.assertEqual([c["content"] for c in first["comment"]], ["c3", "c2", "c1"])
+
+
+class ReadPathWriteGuardTests(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.middleware = ReadPathWriteGuardMiddleware(
+            lambda request: HttpResponse(Tag.objects.create(name="x").name)
+        )
+
+    @override_settings(READ_PATH_WRITE_GUARD="raise")
+    def test_rejects_write_on_get(self):
+        with self.assertRaises(ReadPathWriteError):
+            self.middleware(self.factory.get("/"))
+
+    @override_settings(READ_PATH_WRITE_GUARD="raise")
+    def test_allows_write_on_post(self):
+        self.middleware(self.factory.post("/"))
+        self.assertTrue(Tag.objects.filter(name="x").exists())
+
+    @override_settings(READ_PATH_WRITE_GUARD="log")
+    def test_log_mode_reports(self):
+        with self.assertLogs("api.middleware", level="WARNING"):
+            self.middleware(self.factory.get("/"))
+
+    def test_read_endpoints_do_not_write(self):
+        user = User.objects.create_user(username="user0", password="password0")
+        client = APIClient()
+        client.force_authenticate(user)
+        for url in ["/api/publish/tags/common/", "/api/users/me/", "/api/search", "/api/setting/me/"]:
+            self.assertEqual(client.get(url).status_code, 200, url)
+
+
+class CounterTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="user0", password="password0")
+        self.other = User.objects.create_user(username="user1", password="password1")
+        self.post = Post.objects.create(user=self.user, text="original")
+
+    def test_stale_instance_does_not_lose_updates(self):
+        stale_a = Post.objects.get(pk=self.post.pk)
+        stale_b = Post.objects.get(pk=self.post.pk)
+        Like.objects.create(user=self.user, post=stale_a)
+        Like.objects.create(user=self.other, post=stale_b)
+        Comment.objects.create(user=self.other, post=stale_b, content="c")
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 2)
+        self.assertEqual(self.post.comments_count, 1)
+
+    def test_only_counter_columns_are_written(self):
+        stale = Post.objects.get(pk=self.post.pk)
+        Post.objects.filter(pk=self.post.pk).update(text="edited")
+        Like.objects.create(user=self.user, post=stale)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.text, "edited")
+
+    def test_decrement_never_negative(self):
+        like = Like.objects.create(user=self.user, post=self.post)
+        Post.objects.filter(pk=self.post.pk).update(likes_count=0)
+        like.delete()
+        self.assertEqual(counters.current_counts(self.post.pk)["likes_count"], 0)
+
+    def test_sharded_counters_sum_on_read_and_fold(self):
+        Post.objects.filter(pk=self.post.pk).update(likes_count=5)
+        self.post.refresh_from_db()
+        originals = counters.SHARD_COUNT, counters.HOT_THRESHOLD
+        counters.SHARD_COUNT, counters.HOT_THRESHOLD = 4, 5
+        try:
+            Like.objects.create(user=self.user, post=self.post)
+            Like.objects.create(user=self.other, post=self.post)
+            self.assertTrue(PostCounterShard.objects.filter(post=self.post).exists())
+            self.assertEqual(Post.objects.get(pk=self.post.pk).likes_count, 5)
+            self.assertEqual(counters.current_counts(self.post.pk)["likes_count"], 7)
+            self.assertEqual(counters.fold_shards(), 1)
+            self.assertFalse(PostCounterShard.objects.exists())
+            self.assertEqual(Post.objects.get(pk=self.post.pk).likes_count, 7)
+        finally:
+            counters.SHARD_COUNT, counters.HOT_THRESHOLD = originals
+
+
+class CounterBufferTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="user0", password="password0")
+        self.other = User.objects.create_user(username="user1", password="password1")
+        self.post = Post.objects.create(user=self.user, text="p0")
+        self.originals = counters.WRITE_MODE, counters.buffer
+        counters.WRITE_MODE = "buffered"
+        counters.buffer = counters.CounterBuffer(autostart=False)
+
+    def tearDown(self):
+        counters.WRITE_MODE, counters.buffer = self.originals
+
+    def test_deltas_are_buffered_then_flushed_in_one_statement(self):
+        other_post = Post.objects.create(user=self.user, text="p1")
+        with self.captureOnCommitCallbacks(execute=True):
+            Like.objects.create(user=self.user, post=self.post)
+            Like.objects.create(user=self.other, post=self.post)
+            Comment.objects.create(user=self.other, post=other_post, content="c")
+        self.assertEqual(Post.objects.get(pk=self.post.pk).likes_count, 0)
+        self.assertEqual(counters.current_counts(self.post.pk)["likes_count"], 2)
+        stats = counters.buffer.stats()
+        self.assertEqual(stats["queue_depth"], 3)
+        self.assertEqual(stats["pending_posts"], 2)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(counters.buffer.flush(), 3)
+        self.assertEqual(Post.objects.get(pk=self.post.pk).likes_count, 2)
+        self.assertEqual(Post.objects.get(pk=other_post.pk).comments_count, 1)
+        self.assertEqual(counters.buffer.stats()["queue_depth"], 0)
+        self.assertEqual(counters.current_counts(self.post.pk)["likes_count"], 2)
+
+    def test_serializer_merges_pending(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Like.objects.create(user=self.other, post=self.post)
+        client = APIClient()
+        client.force_authenticate(self.user)
+        posts = client.get("/api/user/posts/").json()["results"]["data"]["posts"]
+        self.assertEqual(posts[0]["likes_count"], 1)
+
+    def test_rows_loaded_before_flush_do_not_lose_counts(self):
+        posts = list(Post.objects.filter(pk=self.post.pk))  # 刷新前加载，likes_count 为 0
+        with self.captureOnCommitCallbacks(execute=True):
+            Like.objects.create(user=self.other, post=self.post)
+        counters.buffer.flush()  # 增量已写回并清空
+        self.assertEqual(PostSerializer(posts, many=True).data[0]["likes_count"], 1)
+        self.assertEqual(PostSerializer(posts[0]).data["likes_count"], 1)
+
+
+class ServerTimingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        timing.install()
+        self.user = User.objects.create_user(username="u1", password="password1")
+        Post.objects.create(user=self.user, text="p0")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    @override_settings(SERVER_TIMING=True)
+    def test_header_reports_phases(self):
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.get("/api/user/posts/")
+        header = resp["Server-Timing"]
+        self.assertIn(f'desc="{len(ctx.captured_queries)} queries"', header)
+        durations = dict(part.split(";")[0:2] for part in header.split(", "))
+        for name in ("db", "ser", "render", "view", "total"):
+            self.assertIn(name, durations)
+        self.assertGreater(float(durations["ser"].split("=")[1]), 0)
+        self.assertGreater(float(durations["render"].split("=")[1]), 0)
+
+    @override_settings(SERVER_TIMING=True, SERVER_TIMING_LOG=True)
+    def test_log_line_has_url_name(self):
+        with self.assertLogs("api.timing", level="INFO") as logs:
+            self.client.get("/api/user/posts/")
+        self.assertIn('"url_name": "my-posts"', logs.output[0])
+
+    def test_disabled_is_passthrough(self):
+        resp = self.client.get("/api/user/posts/")
+        self.assertNotIn("Server-Timing", resp)
+        self.assertIsNone(timing.current())
+
+
+class IndexAdvisorTests(TestCase):
+    def test_hot_queries_use_indexes(self):
+        cache.clear()
+        user = User.objects.create_user(username="u1", password="password1")
+        Post.objects.create(user=user, text="p0")
+        for name, qs in hot_querysets(user).items():
+            scans, sorts = diagnose(qs.explain())
+            with self.subTest(query=name):
+                self.assertEqual(scans, [])
+                self.assertFalse(sorts)
+
+
+class SearchIndexTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.viewer = User.objects.create_user(username="viewer", password="password0")
+        self.alice = User.objects.create(username="alice")
+        self.camping = Post.objects.create(user=self.alice, text="周末去山里露营，看星星")
+        self.gear = Post.objects.create(user=self.alice, text="露营装备清单：帐篷、睡袋，露营必备")
+        self.work = Post.objects.create(user=self.alice, text="今天加班到很晚")
+        Post.objects.create(user=self.alice, text="私密的露营日记", visibility="private")
+        self.camping.tags.add(Tag.objects.get_or_create(name="户外")[0])
+        self.client = APIClient()
+        self.client.force_authenticate(self.viewer)
+
+    def search(self, **params):
+        data = self.client.get("/api/search", params).json()["data"]
+        return [item["id"] for item in data["results"]], data
+
+    def test_tokenizer_splits_chinese_into_bigrams(self):
+        self.assertEqual(search_index.tokenize("去露营 Camp2"), "去 露 营 去露 露营 camp2")
+        self.assertEqual(search_index.match_expression("露营 ca"), '"露营" "ca"*')
+        self.assertIsNone(search_index.match_expression("，。"))
+
+    def test_ranked_results_with_snippets_and_visibility(self):
+        ids, data = self.search(keyword="露营")
+        self.assertEqual(ids, [self.gear.id, self.camping.id])
+        self.assertEqual(data["total"], 2)
+        self.assertIn("<mark>露营</mark>装备清单", data["results"][0]["snippet"])
+        # 标签与作者用户名（前缀）同样可检索
+        self.assertEqual(self.search(keyword="户外")[0], [self.camping.id])
+        ids, data = self.search(keyword="ali")
+        self.assertEqual(len(ids), 3)
+        self.assertEqual([u["username"] for u in data["users"]], ["alice"])
+        # 原有的标签筛选照常生效
+        self.assertEqual(self.search(keyword="露营", tag="户外")[0], [self.camping.id])
+
+    def test_filters_run_inside_match_without_candidate_cap(self):
+        extra = [Post.objects.create(user=self.alice, text=f"露营第 {i} 天") for i in range(5)]
+        extra[-1].tags.add(Tag.objects.get_or_create(name="户外")[0])
+        with mock.patch.object(search_results, "MAX_IDS", 2):
+            pages = [self.search(keyword="露营", page=page, pageSize=2) for page in (1, 2, 3, 4)]
+        # 缓存只保存前 2 个 ID，总数来自过滤后的 COUNT，其余页按相关度直接分页
+        self.assertEqual({data["total"] for _, data in pages}, {7})
+        ids = [post_id for page_ids, _ in pages for post_id in page_ids]
+        self.assertEqual(sorted(ids), sorted([self.camping.id, self.gear.id] + [p.id for p in extra]))
+        self.assertEqual(sorted(self.search(keyword="露营", tag="户外")[0]), sorted([self.camping.id, extra[-1].id]))
+        # 游标分页按时间排序：最新的匹配动态在第一页
+        ids, data = self.search(keyword="露营", cursor="", pageSize=1, withTotal=1)
+        self.assertEqual((ids, data["total"]), ([extra[-1].id], 7))
+
+    def test_index_follows_writes(self):
+        self.work.text = "加班后去露营"
+        self.work.save()
+        self.camping.delete()
+        self.gear.tags.add(Tag.objects.get_or_create(name="徒步")[0])
+        self.assertEqual(sorted(self.search(keyword="露营")[0]), sorted([self.gear.id, self.work.id]))
+        self.assertEqual(self.search(keyword="徒步")[0], [self.gear.id])
+        self.alice.username = "bob"
+        self.alice.save()
+        self.assertEqual(len(self.search(keyword="bob")[0]), 2)
+
+    def test_rebuild_command(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {search_index.POST_TABLE}")
+        self.assertEqual(self.search(keyword="露营")[0], [])
+        out = StringIO()
+        call_command("rebuild_search_index", stdout=out)
+        self.assertIn("已索引 4 条动态", out.getvalue())
+        self.assertEqual(len(self.search(keyword="露营")[0]), 2)
+
+
+class SearchResultCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.viewer = User.objects.create_user(username="viewer", password="password0")
+        self.friend = User.objects.create(username="friend")
+        self.public = Post.objects.create(user=self.friend, text="海边露营")
+        self.friends_only = Post.objects.create(user=self.friend, text="好友可见的露营", visibility="friends")
+        self.client = APIClient()
+        self.client.force_authenticate(self.viewer)
+
+    def search(self, client=None, **params):
+        with CaptureQueriesContext(connection) as ctx:
+            data = (client or self.client).get("/api/search", {"keyword": "露营", **params}).json()["data"]
+        self.scanned = any("api_post_fts" in q["sql"] for q in ctx.captured_queries)
+        return [item["id"] for item in data["results"]]
+
+    def test_normalized_query_shares_entry(self):
+        self.assertEqual(search_results.normalize({"keyword": " 露营  海边 ", "tags": "b,a,b", "date": "bad"}),
+                         search_results.normalize({"keyword": "露营 海边", "tags": "a,b"}))
+        self.assertEqual(self.search(pageSize=1), [self.public.id])
+        self.assertTrue(self.scanned)
+        # 换页、换页大小都命中同一份缓存
+        self.assertEqual(self.search(pageSize=10, keyword=" 露营"), [self.public.id])
+        self.assertFalse(self.scanned)
+
+    def test_audiences_are_separated(self):
+        anonymous = APIClient()
+        self.assertEqual(self.search(anonymous), [self.public.id])
+        self.assertEqual(self.search(), [self.public.id])
+        # 成为好友后好友集合摘要变化，不会读到旧结果
+        Friendship.objects.create(from_user=self.viewer, to_user=self.friend, status="accepted")
+        self.assertEqual(sorted(self.search()), [self.public.id, self.friends_only.id])
+        self.assertTrue(self.scanned)
+        self.assertEqual(self.search(anonymous), [self.public.id])
+
+    def test_post_changes_invalidate(self):
+        self.search()
+        post = Post.objects.create(user=self.friend, text="露营新动态")
+        self.assertIn(post.id, self.search())
+        post.delete()
+        self.assertEqual(self.search(), [self.public.id])
+
+
+class SearchSuggestionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="luna", password="password0")
+        self.star = User.objects.create(username="lucy")
+        Follow.objects.create(follower=self.user, following=self.star)
+        Post.objects.create(user=self.star, text="p").tags.add(Tag.objects.get_or_create(name="lumen")[0])
+        for user in (self.user, self.star):
+            SearchHistory.objects.create(user=user, keyword="lunch", date="2025-01-01")
+        SearchHistory.objects.create(user=self.user, keyword="lucky", date="2025-01-01")
+        suggest.rebuild()
+        self.client = APIClient()
+
+    def suggestions(self, keyword):
+        with self.assertNumQueries(0):
+            return self.client.get("/api/search/suggestions", {"keyword": keyword}).json()["data"]["suggestions"]
+
+    def test_prefix_ranked_by_popularity(self):
+        # lucy 有 1 个粉丝、lunch 被搜索 2 次、lumen 有 1 条动态；只搜过 1 次的 lucky 不作为建议
+        self.assertEqual(self.suggestions("LU"), ["lunch", "lucy", "lumen", "luna"])
+        self.assertEqual(self.suggestions("lun"), ["lunch", "luna"])
+        self.assertEqual(self.suggestions("x"), [])
+
+    def test_signals_update_incrementally(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.star.username = "zoe"
+            self.star.save()
+            fan = User.objects.create(username="lunar")
+            Follow.objects.create(follower=fan, following=self.user)
+            Follow.objects.create(follower=self.star, following=self.user)
+            SearchHistory.objects.create(user=self.user, keyword="lucky", date="2025-01-02")
+        # 热度相同时按字母序
+        self.assertEqual(self.suggestions("lu"), ["lucky", "luna", "lunch", "lumen", "lunar"])
+        self.assertEqual(self.suggestions("zo"), ["zoe"])
+        with self.captureOnCommitCallbacks(execute=True):
+            SearchHistory.objects.filter(keyword="lunch").delete()
+        self.assertNotIn("lunch", self.suggestions("lu"))
+
+    def test_short_prefix_top_k_matches_full_scan(self):
+        index = suggest.PrefixIndex()
+        index.load({(suggest.USER, f"a{i:02d}"): i for i in range(50)}, {})
+        self.assertEqual(len(index.top["a"]), suggest.TOP_K)
+        index.add(suggest.USER, "a00", 100)  # 升高：原地合并
+        index.add(suggest.USER, "a49", -49)  # 降低：丢弃后重算
+        index.remove(suggest.USER, "a48")
+        index.add(suggest.KEYWORD, "ab", 1)  # 搜索次数不足，不作为建议
+        expected = [text for _, (_, _, text) in index._ranked("a", 10)]
+        self.assertEqual(index.suggest("a"), expected)
+        self.assertEqual(expected[:3], ["a00", "a47", "a46"])
+
+    def test_requests_never_build_and_rebuilds_are_single_flight(self):
+        suggest.index.load({}, {})
+        suggest.index.built_at = None
+        with mock.patch.object(suggest, "BACKGROUND", False), self.assertNumQueries(0):
+            self.assertEqual(suggest.suggest("lu"), [])
+        with suggest._build_lock, self.assertNumQueries(0):
+            self.assertFalse(suggest.rebuild())
+        self.assertTrue(suggest.rebuild())
+        self.assertEqual(suggest.suggest("lun"), ["lunch", "luna"])
+
+
+class TrendingTagsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="user0", password="password0")
+        self.camping, self.food, self.daily = (Tag.objects.get_or_create(name=name)[0] for name in ("露营", "美食", "日常"))
+        self.client = APIClient()
+
+    def post(self, hours_ago, *tags):
+        post = Post.objects.create(user=self.user, text="p")
+        Post.objects.filter(pk=post.pk).update(created_at=timezone.now() - timedelta(hours=hours_ago))
+        post.refresh_from_db()
+        post.tags.add(*tags)
+        return post
+
+    def counts(self, granularity):
+        return dict(TagUsageBucket.objects.filter(granularity=granularity, count__gt=0)
+                    .values_list("tag__name").annotate(n=Sum("count")))
+
+    def test_recent_usage_outranks_older_volume(self):
+        for _ in range(3):
+            self.post(96, self.camping)  # 4 个半衰期之前：3 / 16
+        self.post(1, self.food)
+        self.post(24 * 30, self.daily)  # 超出窗口，不计入
+        self.assertEqual(self.counts(TagUsageBucket.DAY), {"露营": 3, "美食": 1})
+        self.assertEqual(self.counts(TagUsageBucket.HOUR), {"美食": 1})
+        self.assertEqual(trending.ranking(), ["美食", "露营"])
+
+    def test_buckets_follow_tag_changes(self):
+        post = self.post(1, self.camping, self.food)
+        self.daily.posts.add(post)
+        post.tags.remove(self.food)
+        self.assertEqual(self.counts(TagUsageBucket.HOUR), {"露营": 1, "日常": 1})
+        self.daily.posts.clear()
+        post.delete()
+        self.assertEqual(self.counts(TagUsageBucket.HOUR), {})
+        self.assertEqual(self.counts(TagUsageBucket.DAY), {})
+
+    def test_hot_tags_endpoint_reads_cached_ranking(self):
+        self.post(1, self.camping)
+        self.assertEqual(self.client.get("/api/tags/hot").json()["data"]["tags"], ["露营"])
+        self.post(0, self.food)
+        self.post(0, self.food)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get("/api/tags/hot").json()["data"]["tags"], ["露营"])
+        trending.refresh()
+        self.assertEqual(self.client.get("/api/tags/hot").json()["data"]["tags"], ["美食", "露营"])
+
+    def test_command_prunes_and_rebuilds(self):
+        self.post(2, self.camping)
+        self.post(30, self.food)
+        expected = {g: self.counts(g) for g in (TagUsageBucket.HOUR, TagUsageBucket.DAY)}
+        stale = timezone.now() - timedelta(days=60)
+        TagUsageBucket.objects.create(tag=self.daily, granularity=TagUsageBucket.DAY,
+                                      start=trending.floor(stale, TagUsageBucket.DAY), count=5)
+        call_command("trending_tags", stdout=StringIO())
+        self.assertEqual({g: self.counts(g) for g in expected}, expected)
+        TagUsageBucket.objects.all().delete()
+        call_command("trending_tags", "--rebuild", stdout=StringIO())
+        self.assertEqual({g: self.counts(g) for g in expected}, expected)
+
+
+class TagRegistryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        tag_registry.clear()
+        self.user = User.objects.create_user(username="user0", password="password0")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def publish(self, tags):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post("/api/publish/posts/", {"content": "周末露营", "tags": tags}, format="json")
+        self.assertEqual(response.status_code, 201)
+        return Post.objects.get(pk=response.json()["data"]["id"]), len(ctx)
+
+    def tag_names(self, post):
+        return sorted(post.tags.values_list("name", flat=True))
+
+    def test_query_count_independent_of_tag_count(self):
+        self.publish([])  # 预热会话与关系图缓存
+        _, few = self.publish(["户外", "新标签0"])
+        names = ["日常", "美食"] + [f"新标签{i}" for i in range(1, 9)]
+        post, many = self.publish(names + [" 日常 "])
+        self.assertEqual(many, few)
+        self.assertEqual(self.tag_names(post), sorted(names))
+        # 全部命中缓存时不再查询标签表
+        post, cached = self.publish(names)
+        self.assertEqual(cached, many - 3)
+        self.assertEqual(self.tag_names(post), sorted(names))
+
+    def test_bulk_attachment_keeps_derived_data_in_sync(self):
+        post, _ = self.publish(["露营"])
+        self.assertEqual(search_index.search_posts("露营"), [post.id])
+        self.assertEqual(TagUsageBucket.objects.get(tag__name="露营", granularity=TagUsageBucket.DAY).count, 1)
+        suggest.rebuild()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.publish(["露营地"])
+        self.assertEqual(suggest.suggest("露营"), ["露营", "露营地"])
+
+    def test_stale_cached_id_is_resolved_again(self):
+        tag_registry.resolve(["露营"])
+        Tag.objects.filter(name="露营")._raw_delete("default")  # 模拟其他进程删除了标签
+        post, _ = self.publish(["露营", "户外"])
+        self.assertEqual(self.tag_names(post), ["户外", "露营"])
+
+
+class InlineExecutor:
+    """提交即在当前线程执行的执行器，完成回调同步运行"""
+
+    def submit(self, fn, *args):
+        future = Future()
+        try:
+            future.set_result(fn(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def shutdown(self, **kwargs):
+        pass
+
+
+class StalledExecutor(InlineExecutor):
+    """任务一直处于排队中"""
+
+    def submit(self, fn, *args):
+        return Future()
+
+
+def jpeg_bytes(size=(300, 200), orientation=None):
+    from PIL import Image
+
+    exif = Image.Exif()
+    if orientation:
+        exif[0x0112] = orientation
+    buffer = BytesIO()
+    Image.new("RGB", size, "red").save(buffer, "JPEG", exif=exif)
+    return buffer.getvalue()
+
+
+class ImageDerivativeTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        enabled = mock.patch.object(derivatives, "ENABLED", True)
+        enabled.start()
+        self.addCleanup(enabled.stop)
+        self.use_pipeline(InlineExecutor)
+        self.user = User.objects.create_user(username="user0", password="password0")
+        self.name = "uploads/images/a.jpg"
+        self.post = Post.objects.create(
+            user=self.user, text="配图", type="image", media=["/media/uploads/images/a.jpg", "/media/uploads/videos/b.mp4"],
+        )
+
+    def use_pipeline(self, executor, max_pending=4):
+        patcher = mock.patch.object(derivatives, "pipeline", derivatives.Pipeline(1, max_pending, executor))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def write(self, name, data):
+        path = os.path.join(self.media_root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+
+    def variants(self):
+        return PostSerializer(self.post).data["media_variants"]
+
+    def test_falls_back_to_original_until_ready(self):
+        ImageDerivative.objects.create(path=self.name)
+        image, video = self.variants()
+        self.assertFalse(image["ready"])
+        self.assertEqual(image["src"], {str(w): "/media/uploads/images/a.jpg" for w in derivatives.WIDTHS})
+        self.assertEqual((video["original"], video["webp"]), ("/media/uploads/videos/b.mp4", {}))
+
+    def test_ready_record_maps_widths_to_variants(self):
+        ImageDerivative.objects.create(path=self.name)
+        # 原图宽 600：只有 160、480 与原尺寸三份
+        derivatives.apply(self.name, {"width": 600, "height": 400, "variants": {
+            160: ("160.jpg", "160.webp"), 480: ("480.jpg", "480.webp"), 600: ("600.jpg", "600.webp"),
+        }})
+        image = self.variants()[0]
+        self.assertTrue(image["ready"])
+        self.assertEqual(image["src"]["160"], "/media/derived/uploads/images/a/160.jpg")
+        self.assertEqual(image["webp"]["480"], "/media/derived/uploads/images/a/480.webp")
+        self.assertEqual(image["src"]["1080"], "/media/derived/uploads/images/a/600.jpg")
+
+    def test_page_loads_records_in_one_query(self):
+        for i in range(3):
+            Post.objects.create(user=self.user, text=str(i), type="image", media=[f"/media/uploads/images/{i}.jpg"])
+        posts = list(Post.objects.all())
+        with CaptureQueriesContext(connection) as queries:
+            PostSerializer(posts, many=True).data
+        self.assertEqual(sum("api_imagederivative" in q["sql"] for q in queries.captured_queries), 1)
+
+    def test_disabled_pipeline_does_not_query(self):
+        with mock.patch.object(derivatives, "ENABLED", False), self.assertNumQueries(0):
+            self.assertEqual(derivatives.load(["/media/uploads/images/a.jpg"]), {})
+            self.assertIsNone(derivatives.schedule(self.name))
+
+    def test_media_name(self):
+        self.assertEqual(derivatives.media_name("http://testserver/media/uploads/images/a%20b.jpg"), "uploads/images/a b.jpg")
+        self.assertIsNone(derivatives.media_name("https://cdn.example.com/a.jpg"))
+        self.assertIsNone(derivatives.load(["/media/uploads/videos/b.mp4"]).get("uploads/videos/b.mp4"))
+
+    def test_upload_generates_variants_end_to_end(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        upload = SimpleUploadedFile("photo.jpg", jpeg_bytes((1200, 800), orientation=6), content_type="image/jpeg")
+        url = client.post("/api/publish/upload/image/", {"file": upload}).json()["data"]["url"]
+        record = ImageDerivative.objects.get(path=derivatives.media_name(url))
+        # 按 EXIF 方向摆正：1200x800 旋转为 800x1200，只缩小不放大
+        self.assertEqual((record.status, record.width, record.height), (ImageDerivative.READY, 800, 1200))
+        self.assertEqual(sorted(record.variants, key=int), ["160", "480", "800"])
+        self.assertEqual(derivatives.pipeline.pending, 0)
+
+        self.post.media = [url]
+        self.post.save()
+        image = PostSerializer(self.post, context={"request": RequestFactory().get("/")}).data["media_variants"][0]
+        self.assertTrue(image["ready"])
+        self.assertTrue(image["webp"]["480"].startswith("http://testserver/media/derived/uploads/images/"))
+        from PIL import Image
+
+        with Image.open(os.path.join(self.media_root, record.variants["160"]["jpeg"])) as thumb:
+            self.assertEqual(thumb.size, (160, 240))
+            self.assertFalse(thumb.getexif())
+
+    def test_queue_full_leaves_record_pending_for_command(self):
+        self.use_pipeline(StalledExecutor, max_pending=1)
+        self.write(self.name, jpeg_bytes())
+        self.write("uploads/images/b.jpg", jpeg_bytes())
+        derivatives.schedule(self.name)
+        derivatives.schedule("uploads/images/b.jpg")  # 队列已满：不提交，记录保持 pending
+        self.assertEqual(derivatives.pipeline.pending, 1)
+        self.assertEqual(set(ImageDerivative.objects.values_list("status", flat=True)), {ImageDerivative.PENDING})
+
+        # 补处理命令（同步）处理遗留的 pending 记录
+        out = StringIO()
+        call_command("generate_image_derivatives", stdout=out)
+        self.assertIn("已生成 2 张，失败 0 张", out.getvalue())
+        self.assertEqual(set(ImageDerivative.objects.values_list("status", flat=True)), {ImageDerivative.READY})
+
+    def test_failed_render_is_recorded_and_retried(self):
+        self.write(self.name, b"not an image")
+        with self.assertLogs("api.derivatives", level="ERROR"):
+            derivatives.schedule(self.name)
+        self.assertEqual(ImageDerivative.objects.get(path=self.name).status, ImageDerivative.FAILED)
+        self.write(self.name, jpeg_bytes())
+        call_command("generate_image_derivatives", stdout=StringIO())
+        self.assertEqual(ImageDerivative.objects.get(path=self.name).status, ImageDerivative.FAILED)
+        call_command("generate_image_derivatives", retry_failed=True, stdout=StringIO())
+        self.assertEqual(ImageDerivative.objects.get(path=self.name).status, ImageDerivative.READY)
+
+    def test_process_pool_renders_in_spawned_child(self):
+        self.write(self.name, jpeg_bytes())
+        pipeline = derivatives.Pipeline(1, 1)
+        self.addCleanup(pipeline.shutdown)
+        result = pipeline._executor().submit(
+            imaging.render, os.path.join(self.media_root, self.name), os.path.join(self.media_root, "out"), (160,),
+        ).result(timeout=60)
+        self.assertEqual(result, {"width": 300, "height": 200, "variants": {160: ("160.jpg", "160.webp"), 300: ("300.jpg", "300.webp")}})
+        self.assertTrue(os.path.exists(os.path.join(self.media_root, "out", "300.webp")))
+
+
+class SeedMomentsTests(TestCase):
+    def test_seeded_data_is_consistent(self):
+        call_command("seed_moments", users=30, scale=0.5, seed=1, timeline=True, stdout=StringIO())
+        users = User.objects.filter(username__startswith="seed_")
+        self.assertEqual(users.count(), 30)
+        self.assertEqual(users.filter(profile__isnull=False).count(), 30)
+        posts = Post.objects.filter(user__in=users)
+        self.assertEqual(posts.count(), 150)
+        # 计数与实际点赞/评论一致
+        for post in posts:
+            self.assertEqual(post.likes_count, post.likes.count())
+            self.assertEqual(post.comments_count, post.comments.count())
+        self.assertFalse(Like.objects.filter(user_id=F("post__user_id")).exists())
+        # 点赞通知按目标聚合，触发人数之和等于点赞数
+        self.assertEqual(
+            Notification.objects.filter(type="like").aggregate(n=Sum("actor_count"))["n"], Like.objects.count()
+        )
+        self.assertLess(Notification.objects.filter(type="like").count(), Like.objects.count())
+        self.assertEqual(TimelineEntry.objects.filter(owner_id=F("author_id")).count(), 150)
+        self.assertFalse(posts.filter(created_at__gt=timezone.now()).exists())
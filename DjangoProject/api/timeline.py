@@ -0,0 +1,116 @@
+"""
+首页时间线（写扩散）
+
+发布动态时按可见性把动态 ID 推送到作者好友/粉丝的时间线行中，
+读取时只需对 TimelineEntry 做一次 (owner, created_at) 索引范围扫描。
+
+- private：仅作者本人
+- friends：作者 + 好友
+- public：作者 + 好友 + 粉丝
+单条动态写入的接收者数量受 TIMELINE_FANOUT_CAP 限制，好友优先，
+超出上限的粉丝不再写入（仍可通过发现页/搜索看到该动态）。
+删除动态时时间线行随外键级联删除；解除好友或取关时撤回对应行。
+"""
+from django.conf import settings
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from . import social
+from .models import Post, Friendship, Follow, TimelineEntry
+
+FANOUT_CAP = getattr(settings, 'TIMELINE_FANOUT_CAP', 5000)
+BACKFILL_POSTS = getattr(settings, 'TIMELINE_BACKFILL_POSTS', 20)
+BATCH_SIZE = 500
+
+
+def get_recipient_ids(post):
+    """计算动态的接收者（不含作者本人），好友优先并受上限约束"""
+    if post.visibility == 'private':
+        return []
+    friend_ids = social.get_friend_ids(post.user_id)
+    recipients = sorted(friend_ids)
+    if post.visibility == 'public':
+        follower_ids = social.get_follower_ids(post.user_id) - friend_ids
+        recipients.extend(sorted(follower_ids))
+    return [uid for uid in recipients if uid != post.user_id][:FANOUT_CAP]
+
+
+def _entry(owner_id, post):
+    return TimelineEntry(
+        owner_id=owner_id,
+        post_id=post.id,
+        author_id=post.user_id,
+        visibility=post.visibility,
+        created_at=post.created_at,
+    )
+
+
+def fan_out(post):
+    """把动态写入作者及所有接收者的时间线"""
+    owner_ids = [post.user_id] + get_recipient_ids(post)
+    TimelineEntry.objects.bulk_create(
+        [_entry(owner_id, post) for owner_id in owner_ids],
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def _visible_levels(viewer_id, author_id):
+    """viewer 能在时间线上看到 author 哪些可见性的动态"""
+    if author_id in social.get_friend_ids(viewer_id):
+        return ('public', 'friends')
+    if author_id in social.get_following_ids(viewer_id):
+        return ('public',)
+    return ()
+
+
+def _sync_direction(viewer_id, author_id, backfill):
+    levels = _visible_levels(viewer_id, author_id)
+    # 撤回已不可见的行
+    TimelineEntry.objects.filter(owner_id=viewer_id, author_id=author_id).exclude(
+        visibility__in=levels
+    ).delete()
+    if not levels or not backfill:
+        return
+    # 补齐作者最近的若干条动态
+    recent = Post.objects.filter(user_id=author_id, visibility__in=levels).order_by('-created_at')[:BACKFILL_POSTS]
+    TimelineEntry.objects.bulk_create(
+        [_entry(viewer_id, post) for post in recent],
+        ignore_conflicts=True,
+    )
+
+
+def sync_pair(user_a_id, user_b_id, backfill=True):
+    """两人关系变化后，双向重算时间线可见性；backfill=False 时只撤回不补齐"""
+    if not user_a_id or not user_b_id or user_a_id == user_b_id:
+        return
+    _sync_direction(user_a_id, user_b_id, backfill)
+    _sync_direction(user_b_id, user_a_id, backfill)
+
+
+@receiver(post_save, sender=Post)
+def fan_out_new_post(sender, instance, created, **kwargs):
+    if created:
+        fan_out(instance)
+
+
+# 注意：这些接收器需在 social 的缓存失效接收器之后注册（见 ApiConfig.ready）
+# 删除关系只会缩小可见范围，因此删除时只撤回（也避免级联删除用户时回填）
+@receiver(post_save, sender=Friendship)
+def sync_friendship(sender, instance, **kwargs):
+    sync_pair(instance.from_user_id, instance.to_user_id)
+
+
+@receiver(post_delete, sender=Friendship)
+def retract_friendship(sender, instance, **kwargs):
+    sync_pair(instance.from_user_id, instance.to_user_id, backfill=False)
+
+
+@receiver(post_save, sender=Follow)
+def sync_follow(sender, instance, **kwargs):
+    sync_pair(instance.follower_id, instance.following_id)
+
+
+@receiver(post_delete, sender=Follow)
+def retract_follow(sender, instance, **kwargs):
+    sync_pair(instance.follower_id, instance.following_id, backfill=False)
@@ -0,0 +1,120 @@
+"""
+请求热路径计时（Server-Timing）
+
+ServerTimingMiddleware 为每个请求创建一个 RequestTiming，并通过 contextvar 暴露给：
+- SQL：connection.execute_wrapper 统计次数与耗时
+- 序列化：BaseSerializer.data（to_representation，含其中触发的懒查询）
+- 渲染：DRF Response.rendered_content（JSON 编码）
+后两者需要 install() 替换对应属性，仅在 SERVER_TIMING 开启时由 ApiConfig.ready 调用；
+没有进行中的计时时替换后的属性只多一次 contextvar 读取。
+"""
+import time
+from contextvars import ContextVar
+
+_current = ContextVar('request_timing', default=None)
+_installed = False
+
+
+class RequestTiming:
+    """单个请求内各阶段的累计耗时（毫秒）"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_ms = 0.0
+        self.serializer_ms = 0.0
+        self.render_ms = 0.0
+        self.total_ms = 0.0
+        # 序列化可能嵌套调用 .data，只统计最外层
+        self._serializer_depth = 0
+
+    def finish(self):
+        self.total_ms = (time.perf_counter() - self.started) * 1000
+
+    @property
+    def view_ms(self):
+        """视图耗时（不含响应渲染）"""
+        return max(self.total_ms - self.render_ms, 0.0)
+
+    def record_query(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_ms += (time.perf_counter() - started) * 1000
+
+    def as_dict(self):
+        return {
+            'queries': self.queries,
+            'db_ms': round(self.db_ms, 2),
+            'serializer_ms': round(self.serializer_ms, 2),
+            'render_ms': round(self.render_ms, 2),
+            'view_ms': round(self.view_ms, 2),
+            'total_ms': round(self.total_ms, 2),
+        }
+
+    def header(self):
+        """Server-Timing 响应头"""
+        return ', '.join([
+            f'db;dur={self.db_ms:.2f};desc="{self.queries} queries"',
+            f'ser;dur={self.serializer_ms:.2f};desc="serializer"',
+            f'render;dur={self.render_ms:.2f};desc="render"',
+            f'view;dur={self.view_ms:.2f};desc="view"',
+            f'total;dur={self.total_ms:.2f}',
+        ])
+
+
+def current():
+    """当前请求的 RequestTiming，未在计时中时为 None"""
+    return _current.get()
+
+
+def start():
+    timing = RequestTiming()
+    return timing, _current.set(timing)
+
+
+def stop(token):
+    _current.reset(token)
+
+
+def _timed_serializer_data(original):
+    def data(self):
+        timing = _current.get()
+        if timing is None or timing._serializer_depth:
+            return original.fget(self)
+        timing._serializer_depth += 1
+        started = time.perf_counter()
+        try:
+            return original.fget(self)
+        finally:
+            timing._serializer_depth -= 1
+            timing.serializer_ms += (time.perf_counter() - started) * 1000
+    return property(data)
+
+
+def _timed_rendered_content(original):
+    def rendered_content(self):
+        timing = _current.get()
+        if timing is None:
+            return original.fget(self)
+        started = time.perf_counter()
+        try:
+            return original.fget(self)
+        finally:
+            timing.render_ms += (time.perf_counter() - started) * 1000
+    return property(rendered_content)
+
+
+def install():
+    """替换 DRF 序列化与渲染入口以便计时（可重复调用）"""
+    global _installed
+    if _installed:
+        return
+    from rest_framework.response import Response
+    from rest_framework.serializers import BaseSerializer
+
+    BaseSerializer.data = _timed_serializer_data(BaseSerializer.data)
+    Response.rendered_content = _timed_rendered_content(Response.rendered_content)
+    _installed = True
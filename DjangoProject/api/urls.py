@@ -6,6 +6,7 @@ from .views import (
     logout_view,
     toggle_like,
     post_comments,
+    home_timeline,
     delete_post,
     send_friend_request,
     respond_friend_request,
@@ -35,6 +36,8 @@ urlpatterns = [
     # 注册搜索模块
     path('', include('api.search.urls')),
   
+    # 首页时间线
+    path('timeline/', home_timeline, name='home-timeline'),
     # 帖子相关接口（与发现页共享）
     path('posts/<int:post_id>/like/', toggle_like, name='toggle-like'),
     path('posts/<int:post_id>/comments/', post_comments, name='post-comments'),
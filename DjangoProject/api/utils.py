@@ -3,6 +3,7 @@ from rest_framework.response import Response
 from rest_framework.permissions import AllowAny
 from django.utils import timezone
 from rest_framework.decorators import permission_classes
+from . import counters
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
@@ -11,7 +12,9 @@ def health_check(request):
     return Response({
         'status': 'healthy',
         'timestamp': timezone.now(),
-        'message': 'Django API Backend is running'
+        'message': 'Django API Backend is running',
+        # 计数写后缓冲的队列深度与写回延迟
+        'counters': counters.buffer.stats()
     })
 
 @api_view(['GET'])
@@ -1,9 +1,10 @@
-from rest_framework import viewsets, status, pagination
+from rest_framework import viewsets, status
 from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.authtoken.models import Token
 from django.contrib.auth import authenticate
+from django.db import transaction
 from django.db.models import Q
 from django.contrib.auth.models import User
 from django.utils import timezone
@@ -12,7 +13,9 @@ from .serializers import (
     PostSerializer, CommentSerializer, CreateCommentSerializer,
     FriendshipSerializer
 )
-from .models import Post, Like, Comment, Friendship, Follow
+from .models import Post, Like, Comment, Friendship, Follow, TimelineEntry
+from . import counters
+from .pagination import StandardResultsSetPagination, CreatedAtCursorPagination, get_paginator
 
 # 简单的 staff 判断工具
 def require_staff(user):
@@ -140,16 +143,16 @@ def admin_list_posts(request):
     if not require_staff(request.user):
         return Response({'detail': 'Forbidden'}, status=status.HTTP_403_FORBIDDEN)
     keyword = request.query_params.get('keyword', '')
-    qs = Post.objects.all().order_by('-created_at')
+    qs = Post.objects.select_related('user__profile').order_by('-created_at')
     if keyword:
         qs = qs.filter(
             Q(text__icontains=keyword) |
             Q(user__username__icontains=keyword) |
-            Q(tags__icontains=keyword)
-        )
-    paginator = StandardResultsSetPagination()
+            Q(tags__name__icontains=keyword)
+        ).distinct()
+    paginator = get_paginator(request)
     result = paginator.paginate_queryset(qs, request)
-    data = PostSerializer(result, many=True).data
+    data = PostSerializer(result, many=True, context={'request': request}).data
     return paginator.get_paginated_response(data)
 
 
@@ -181,12 +184,6 @@ def logout_view(request):
             'message': 'No active session found'
         }, status=status.HTTP_400_BAD_REQUEST)
 
-# 自定义分页类
-class StandardResultsSetPagination(pagination.PageNumberPagination):
-    page_size = 10
-    page_size_query_param = 'pageSize'
-    max_page_size = 100
-
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def toggle_like(request, post_id):
@@ -215,14 +212,14 @@ def toggle_like(request, post_id):
                     'message': '未点赞过该动态'
                 }, status=status.HTTP_400_BAD_REQUEST)
         
-        # 更新点赞数
-        post.refresh_from_db()
+        # 读取最新点赞数（只取计数列并合并分片增量）
+        counts = counters.current_counts(post.id)
         
         return Response({
             'success': True,
             'message': '操作成功',
             'data': {
-                'likes': post.likes_count
+                'likes': counts['likes_count']
             }
         })
     except Post.DoesNotExist:
@@ -239,16 +236,11 @@ def post_comments(request, post_id):
         post = Post.objects.get(id=post_id)
         
         if request.method == 'GET':
-            # 获取评论列表
-            page = request.query_params.get('page', 1)
-            page_size = request.query_params.get('pageSize', 10)
-            
             # 按时间倒序获取评论
-            comments = Comment.objects.filter(post=post).order_by('-created_at')
+            comments = Comment.objects.filter(post=post).select_related('user__profile').order_by('-created_at')
             
-            # 分页
-            paginator = StandardResultsSetPagination()
-            paginator.page_size = page_size
+            # 分页：默认页码分页，传 cursor 参数时使用游标分页
+            paginator = get_paginator(request)
             result_page = paginator.paginate_queryset(comments, request)
             
             # 序列化
@@ -258,7 +250,8 @@ def post_comments(request, post_id):
                 'success': True,
                 'data': {
                     'comments': serializer.data,
-                    'total': comments.count()
+                    'total': paginator.get_total(),
+                    'next_cursor': paginator.get_next_cursor()
                 }
             })
         elif request.method == 'POST':
@@ -266,7 +259,9 @@ def post_comments(request, post_id):
             serializer = CreateCommentSerializer(data=request.data)
             
             if serializer.is_valid():
-                comment = serializer.save(user=request.user, post=post)
+                # 评论、计数与通知事件在同一事务内写入
+                with transaction.atomic():
+                    comment = serializer.save(user=request.user, post=post)
                 
                 # 序列化返回的评论
                 comment_serializer = CommentSerializer(comment, context={'request': request})
@@ -288,6 +283,23 @@ def post_comments(request, post_id):
             'message': '动态不存在'
         }, status=status.HTTP_404_NOT_FOUND)
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def home_timeline(request):
+    """首页时间线（写扩散），始终使用游标分页"""
+    entries = TimelineEntry.objects.filter(owner=request.user).select_related('post__user__profile')
+    paginator = CreatedAtCursorPagination()
+    page = paginator.paginate_queryset(entries, request)
+    posts = [entry.post for entry in page]
+    serializer = PostSerializer(posts, many=True, context={'request': request})
+    return Response({
+        'success': True,
+        'data': {
+            'posts': serializer.data,
+            'next_cursor': paginator.get_next_cursor()
+        }
+    })
+
 @api_view(['DELETE'])
 @permission_classes([IsAuthenticated])
 def delete_post(request, post_id):
@@ -378,10 +390,8 @@ def list_friend_requests(request):
 def list_friends(request):
     """我的好友列表（已同意）"""
     qs = Friendship.objects.filter(
-        status='accepted'
-    ).filter(
-        Q(from_user=request.user) | Q(to_user=request.user)
-    )
+        Q(status='accepted', from_user=request.user) | Q(status='accepted', to_user=request.user)
+    ).select_related('from_user__profile', 'to_user__profile')
     friends = []
     for fr in qs:
         friend = fr.to_user if fr.from_user_id == request.user.id else fr.from_user
@@ -426,7 +436,7 @@ def unfollow_user(request, pk):
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def list_following(request):
-    qs = Follow.objects.filter(follower=request.user).select_related('following')
+    qs = Follow.objects.filter(follower=request.user).select_related('following__profile')
     data = [{'id': f.following.id, 'username': f.following.username, 'avatar': getattr(f.following.profile, 'avatar', '')} for f in qs]
     return Response({'success': True, 'data': {'following': data, 'total': len(data)}})
 
@@ -434,6 +444,6 @@ def list_following(request):
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def list_followers(request):
-    qs = Follow.objects.filter(following=request.user).select_related('follower')
+    qs = Follow.objects.filter(following=request.user).select_related('follower__profile')
     data = [{'id': f.follower.id, 'username': f.follower.username, 'avatar': getattr(f.follower.profile, 'avatar', '')} for f in qs]
     return Response({'success': True, 'data': {'followers': data, 'total': len(data)}})
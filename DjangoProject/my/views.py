@@ -1,31 +1,23 @@
-from rest_framework import viewsets, status, pagination
+from django.db import transaction
+from rest_framework import viewsets, status
 from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from api.models import Post, Like, Comment
+from api import counters
+from api.pagination import get_paginator
 from my.serializers import PostSerializer, CommentSerializer, CreateCommentSerializer
 
 
-# 自定义分页类
-class StandardResultsSetPagination(pagination.PageNumberPagination):
-    page_size = 10
-    page_size_query_param = 'pageSize'
-    max_page_size = 100
-
-
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_my_posts(request):
     """获取我的动态列表接口"""
-    page = request.query_params.get('page', 1)
-    page_size = request.query_params.get('pageSize', 10)
-    
     # 按时间倒序获取当前用户的动态
-    posts = Post.objects.filter(user=request.user).order_by('-created_at')
+    posts = Post.objects.filter(user=request.user).select_related('user__profile').order_by('-created_at')
     
-    # 分页
-    paginator = StandardResultsSetPagination()
-    paginator.page_size = page_size
+    # 分页：默认页码分页，传 cursor 参数时使用游标分页
+    paginator = get_paginator(request)
     result_page = paginator.paginate_queryset(posts, request)
     
     # 序列化
@@ -35,7 +27,8 @@ def get_my_posts(request):
         'success': True,
         'data': {
             'posts': serializer.data,
-            'total': posts.count()
+            'total': paginator.get_total(),
+            'next_cursor': paginator.get_next_cursor()
         }
     })
 
@@ -103,14 +96,14 @@ def toggle_like(request, post_id):
                     'message': '未点赞过该动态'
                 }, status=status.HTTP_400_BAD_REQUEST)
         
-        # 更新点赞数
-        post.refresh_from_db()
+        # 读取最新点赞数（只取计数列并合并分片增量）
+        counts = counters.current_counts(post.id)
         
         return Response({
             'success': True,
             'message': '操作成功',
             'data': {
-                'likes': post.likes_count
+                'likes': counts['likes_count']
             }
         })
     except Post.DoesNotExist:
@@ -128,16 +121,11 @@ def post_comments(request, post_id):
         post = Post.objects.get(id=post_id)
         
         if request.method == 'GET':
-            # 获取评论列表
-            page = request.query_params.get('page', 1)
-            page_size = request.query_params.get('pageSize', 10)
-            
             # 按时间倒序获取评论
-            comments = Comment.objects.filter(post=post).order_by('-created_at')
+            comments = Comment.objects.filter(post=post).select_related('user__profile').order_by('-created_at')
             
-            # 分页
-            paginator = StandardResultsSetPagination()
-            paginator.page_size = page_size
+            # 分页：默认页码分页，传 cursor 参数时使用游标分页
+            paginator = get_paginator(request)
             result_page = paginator.paginate_queryset(comments, request)
             
             # 序列化
@@ -147,7 +135,8 @@ def post_comments(request, post_id):
                 'success': True,
                 'data': {
                     'comments': serializer.data,
-                    'total': comments.count()
+                    'total': paginator.get_total(),
+                    'next_cursor': paginator.get_next_cursor()
                 }
             })
         elif request.method == 'POST':
@@ -155,7 +144,9 @@ def post_comments(request, post_id):
             serializer = CreateCommentSerializer(data=request.data)
             
             if serializer.is_valid():
-                comment = serializer.save(user=request.user, post=post)
+                # 评论、计数与通知事件在同一事务内写入
+                with transaction.atomic():
+                    comment = serializer.save(user=request.user, post=post)
                 
                 # 序列化返回的评论
                 comment_serializer = CommentSerializer(comment, context={'request': request})
@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class NotificationsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "notifications"
+
+    def ready(self):
+        # 注册通知生成（聚合）与计数信号
+        from . import services  # noqa: F401
+        from . import counters  # noqa: F401
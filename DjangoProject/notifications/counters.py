@@ -0,0 +1,82 @@
+"""
+通知计数（每用户一行：未读数 / 总数）
+
+- 新建通知：post_save 信号 +1
+- 标记已读、删除：这些路径使用 QuerySet.update()/delete()，不会触发信号，
+  由视图按实际影响的行数调用 adjust() 显式调整
+- 用户被删除时，其作为触发者的通知随外键级联删除，事务提交后重算受影响的接收者
+- 计数变化提交后唤醒本进程的实时推送轮询（stream.broker）
+计数行缺失时（历史数据、批量导入）adjust 会按通知表重算补建；读取时只查询不写入。
+"""
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Count, F, Q, Value
+from django.db.models.functions import Greatest, Now
+from django.db.models.signals import post_save, pre_delete
+from django.dispatch import receiver
+
+from . import stream
+from .models import Notification, NotificationCounter
+
+REBUILD_BATCH = 500
+
+
+def _aggregate(user_ids):
+    """user_id -> {'total', 'unread'}（按通知表统计）"""
+    rows = (Notification.objects.filter(user_id__in=user_ids)
+            .order_by()
+            .values('user_id')
+            .annotate(total=Count('id'), unread=Count('id', filter=Q(is_read=False))))
+    return {row['user_id']: {'total': row['total'], 'unread': row['unread']} for row in rows}
+
+
+def rebuild(user_ids):
+    """按通知表重算并写入计数（幂等），用于补建缺失行与修正漂移"""
+    user_ids = list(user_ids)
+    for start in range(0, len(user_ids), REBUILD_BATCH):
+        batch = user_ids[start:start + REBUILD_BATCH]
+        counts = _aggregate(batch)
+        NotificationCounter.objects.bulk_create(
+            [NotificationCounter(user_id=uid, **counts.get(uid, {'total': 0, 'unread': 0})) for uid in batch],
+            update_conflicts=True,
+            unique_fields=['user'],
+            update_fields=['unread', 'total', 'updated_at'],
+        )
+
+
+def adjust(user_id, unread=0, total=0):
+    """原子地调整某用户的计数；计数行不存在时按通知表重算"""
+    if not unread and not total:
+        return
+    updated = NotificationCounter.objects.filter(user_id=user_id).update(
+        unread=Greatest(F('unread') + unread, Value(0)),
+        total=Greatest(F('total') + total, Value(0)),
+        updated_at=Now(),
+    )
+    if not updated:
+        rebuild([user_id])
+    transaction.on_commit(stream.broker.wake)
+
+
+def get_counts(user_id):
+    """{'unread', 'total'}：读取计数行（1 次查询），缺失时临时统计，不写入"""
+    row = NotificationCounter.objects.filter(user_id=user_id).values('unread', 'total').first()
+    if row is None:
+        row = _aggregate([user_id]).get(user_id, {'total': 0, 'unread': 0})
+    return {'unread': row['unread'], 'total': row['total']}
+
+
+@receiver(post_save, sender=Notification)
+def count_new_notification(sender, instance, created, **kwargs):
+    if created:
+        adjust(instance.user_id, unread=0 if instance.is_read else 1, total=1)
+
+
+@receiver(pre_delete, sender=User)
+def recount_after_actor_deleted(sender, instance, **kwargs):
+    """被删除用户触发的通知会级联删除，提交后重算这些接收者的计数"""
+    recipient_ids = set(
+        Notification.objects.filter(actor=instance).exclude(user=instance).values_list('user_id', flat=True).distinct()
+    )
+    if recipient_ids:
+        transaction.on_commit(lambda: rebuild(recipient_ids))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from notifications import retention
+
+
+class Command(BaseCommand):
+    help = '按保留策略清理通知：删除过期的已读通知与每个用户超出上限的旧通知（按主键分块删除）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=retention.RETENTION_DAYS, help='已读通知保留天数')
+        parser.add_argument('--max-per-user', type=int, default=retention.MAX_PER_USER, help='每个用户最多保留的通知数')
+        parser.add_argument('--chunk-size', type=int, default=retention.CHUNK_SIZE, help='每个删除事务的行数')
+        parser.add_argument('--pause', type=float, default=retention.PAUSE, help='两块之间暂停的秒数')
+        parser.add_argument('--dry-run', action='store_true', help='只统计将被删除的行数')
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            expired = retention.expired(options['days']).count()
+            over_limit = sum(qs.count() for _, qs in retention.over_limit(options['max_per_user']))
+            self.stdout.write(f'将删除 {expired} 条过期已读通知、{over_limit} 条超出上限的通知')
+            return
+        result = retention.compact(
+            days=options['days'],
+            max_per_user=options['max_per_user'],
+            chunk_size=options['chunk_size'],
+            pause=options['pause'],
+        )
+        self.stdout.write(f"已删除 {result['expired']} 条过期已读通知、{result['over_limit']} 条超出上限的通知")
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from notifications import services
+
+
+class Command(BaseCommand):
+    help = '从通知发件箱批量取出事件，去重、聚合后写入通知（NOTIFICATION_DELIVERY=outbox 时需常驻运行）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='每批处理的事件数')
+        parser.add_argument('--interval', type=float, default=1.0, help='发件箱为空时的轮询间隔秒数')
+        parser.add_argument('--once', action='store_true', help='清空发件箱后退出')
+
+    def handle(self, *args, **options):
+        while True:
+            processed = services.drain(batch_size=options['batch_size'])
+            if processed:
+                self.stdout.write(f'已投递 {processed} 个通知事件')
+                continue
+            if options['once']:
+                break
+            close_old_connections()
+            time.sleep(options['interval'])
@@ -0,0 +1,40 @@
+# Generated by Django 4.2.30 on 2026-10-18 17:53
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, Q
+
+
+def backfill(apps, schema_editor):
+    """按现有通知为每个接收者建立计数行"""
+    Notification = apps.get_model('notifications', 'Notification')
+    NotificationCounter = apps.get_model('notifications', 'NotificationCounter')
+    rows = (Notification.objects.order_by()
+            .values('user_id')
+            .annotate(total=Count('id'), unread=Count('id', filter=Q(is_read=False))))
+    NotificationCounter.objects.bulk_create(
+        [NotificationCounter(user_id=row['user_id'], unread=row['unread'], total=row['total']) for row in rows],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('notifications', '0002_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationCounter',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='notification_counter', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('unread', models.IntegerField(default=0)),
+                ('total', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
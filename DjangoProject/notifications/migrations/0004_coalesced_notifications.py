@@ -0,0 +1,27 @@
+# Generated by Django 4.2.30 on 2026-10-18 17:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0003_notificationcounter'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='actor_count',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='recent_actor_ids',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['object_id', 'content_type', 'type'], name='notif_target_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.30 on 2026-10-18 18:01
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0004_coalesced_notifications'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('recipient_id', models.IntegerField()),
+                ('actor_id', models.IntegerField()),
+                ('kind', models.CharField(max_length=20)),
+                ('content_type_id', models.IntegerField()),
+                ('object_id', models.PositiveIntegerField()),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='notification',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -3,8 +3,6 @@ from django.contrib.contenttypes.fields import GenericForeignKey, GenericRelatio
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.auth.models import User
 from django.utils import timezone
-from django.db.models.signals import post_save
-from django.dispatch import receiver
 
 
 class Notification(models.Model):
@@ -31,41 +29,50 @@ class Notification(models.Model):
     message = models.CharField(max_length=255)
     # 是否已读
     is_read = models.BooleanField(default=False)
-    # 创建时间
-    created_at = models.DateTimeField(auto_now_add=True)
+    # 创建时间（聚合通知为最近一次互动的时间；异步投递时取事件发生的时间）
+    created_at = models.DateTimeField(default=timezone.now)
+    # 聚合通知：时间窗口内同一目标的点赞/评论合并为一条，actor 为最近的触发者
+    actor_count = models.PositiveIntegerField(default=1)
+    recent_actor_ids = models.JSONField(default=list, blank=True)  # 最近的若干触发者，新的在前
+    # 最近一次写入（新建或聚合更新）的时间，实时推送据此发现变化
+    updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # 通知列表：按接收者取最新
+            models.Index(fields=['user', '-created_at', '-id'], name='notif_user_time_idx'),
+            # 未读数 / 全部已读
+            models.Index(fields=['user', 'is_read', '-created_at'], name='notif_user_read_time_idx'),
+            # 聚合时查找同一目标的已有通知
+            models.Index(fields=['object_id', 'content_type', 'type'], name='notif_target_idx'),
+            # 实时推送：按在线用户查找最近变化的通知
+            models.Index(fields=['user', 'updated_at'], name='notif_user_updated_idx'),
+        ]
     
     def __str__(self):
         return f'Notification to {self.user.username} from {self.actor.username}: {self.message}'
 
 
-@receiver(post_save, sender='api.Like')
-def create_like_notification(sender, instance, created, **kwargs):
-    """创建点赞通知"""
-    if created:
-        # 不通知自己
-        if instance.user != instance.post.user:
-            Notification.objects.create(
-                user=instance.post.user,
-                type='like',
-                actor=instance.user,
-                content_object=instance.post,
-                message=f'{instance.user.username} 点赞了你的动态'
-            )
+class NotificationCounter(models.Model):
+    """每个用户的通知计数（反范式）：角标和列表只读这一行，不再 COUNT 通知表"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='notification_counter')
+    unread = models.IntegerField(default=0)
+    total = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'NotificationCounter({self.user_id}: {self.unread}/{self.total})'
 
 
-@receiver(post_save, sender='api.Comment')
-def create_comment_notification(sender, instance, created, **kwargs):
-    """创建评论通知"""
-    if created:
-        # 不通知自己
-        if instance.user != instance.post.user:
-            Notification.objects.create(
-                user=instance.post.user,
-                type='comment',
-                actor=instance.user,
-                content_object=instance.post,
-                message=f'{instance.user.username} 评论了你的动态'
-            )
+class NotificationEvent(models.Model):
+    """通知发件箱：点赞/评论在同一事务内写入一条事件，由 notification_worker 批量投递为通知"""
+    recipient_id = models.IntegerField()
+    actor_id = models.IntegerField()
+    kind = models.CharField(max_length=20)
+    content_type_id = models.IntegerField()
+    object_id = models.PositiveIntegerField()
+    created_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f'NotificationEvent({self.kind} {self.actor_id} -> {self.recipient_id})'
@@ -0,0 +1,87 @@
+"""
+通知保留策略与分块删除
+
+- 已读通知保留 NOTIFICATION_RETENTION_DAYS 天
+- 每个用户最多保留 NOTIFICATION_MAX_PER_USER 条（超出部分删除最旧的）
+由 manage.py compact_notifications 定期执行。
+
+所有批量删除都按主键顺序分块进行：每块一个短事务（删除并调整计数），块之间暂停
+NOTIFICATION_DELETE_PAUSE 秒，避免一条大 DELETE 长时间持有 SQLite 写锁阻塞其他写入。
+用户的“删除全部通知”走同一路径。
+"""
+import time
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import counters
+from .models import Notification, NotificationCounter
+
+RETENTION_DAYS = getattr(settings, 'NOTIFICATION_RETENTION_DAYS', 90)
+MAX_PER_USER = getattr(settings, 'NOTIFICATION_MAX_PER_USER', 1000)
+CHUNK_SIZE = getattr(settings, 'NOTIFICATION_DELETE_CHUNK', 500)
+PAUSE = getattr(settings, 'NOTIFICATION_DELETE_PAUSE', 0.05)
+
+
+def _delete_chunk(ids):
+    """删除一块通知并按接收者调整计数，返回删除的行数"""
+    with transaction.atomic():
+        rows = list(Notification.objects.select_for_update().filter(pk__in=ids).values_list('pk', 'user_id', 'is_read'))
+        if not rows:
+            return 0
+        Notification.objects.filter(pk__in=[pk for pk, _, _ in rows]).delete()
+        total = Counter(user_id for _, user_id, _ in rows)
+        unread = Counter(user_id for _, user_id, is_read in rows if not is_read)
+        for user_id, count in total.items():
+            counters.adjust(user_id, unread=-unread[user_id], total=-count)
+    return len(rows)
+
+
+def delete_in_chunks(queryset, chunk_size=None, pause=None):
+    """按主键顺序分块删除 queryset 中的通知，返回删除的总行数"""
+    chunk_size = chunk_size or CHUNK_SIZE
+    pause = PAUSE if pause is None else pause
+    deleted, last_pk = 0, 0
+    while True:
+        ids = list(queryset.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:chunk_size])
+        if not ids:
+            return deleted
+        last_pk = ids[-1]
+        deleted += _delete_chunk(ids)
+        if len(ids) < chunk_size:
+            return deleted
+        if pause:
+            time.sleep(pause)
+
+
+def expired(days=None):
+    """超过保留期的已读通知"""
+    days = RETENTION_DAYS if days is None else days
+    return Notification.objects.filter(is_read=True, created_at__lt=timezone.now() - timedelta(days=days))
+
+
+def over_limit(max_per_user=None):
+    """(user_id, 超出上限的旧通知 QuerySet)；按计数行找出超限的用户，不扫描通知表"""
+    max_per_user = MAX_PER_USER if max_per_user is None else max_per_user
+    user_ids = list(NotificationCounter.objects.filter(total__gt=max_per_user).values_list('user_id', flat=True))
+    for user_id in user_ids:
+        newest = Notification.objects.filter(user_id=user_id).order_by('-created_at', '-id')
+        # 保留的最后一条（第 max_per_user 新），比它更旧的都删除
+        boundary = newest.values('created_at', 'id')[max_per_user - 1:max_per_user].first()
+        if boundary is None:
+            continue
+        yield user_id, Notification.objects.filter(user_id=user_id).filter(
+            Q(created_at__lt=boundary['created_at']) | Q(created_at=boundary['created_at'], id__lt=boundary['id'])
+        )
+
+
+def compact(days=None, max_per_user=None, chunk_size=None, pause=None):
+    """执行保留策略，返回 {'expired': 删除的过期已读数, 'over_limit': 删除的超限数}"""
+    result = {'expired': delete_in_chunks(expired(days), chunk_size, pause), 'over_limit': 0}
+    for _, queryset in over_limit(max_per_user):
+        result['over_limit'] += delete_in_chunks(queryset, chunk_size, pause)
+    return result
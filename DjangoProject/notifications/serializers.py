@@ -1,8 +1,17 @@
 from rest_framework import serializers
+from api.loaders import NotificationListSerializer, NOTIFICATION_ACTORS_KEY, load_users
 from .models import Notification
 from datetime import datetime
 
 
+def _avatar(user):
+    # 优先使用资料中的头像（列表已 select_related 资料）
+    profile = getattr(user, 'profile', None)
+    if profile is not None and profile.avatar:
+        return profile.avatar
+    return f"https://picsum.photos/200?{user.id}"
+
+
 class NotificationSerializer(serializers.ModelSerializer):
     name = serializers.ReadOnlyField(source='actor.username')
     avatar = serializers.SerializerMethodField()
@@ -11,14 +20,30 @@ class NotificationSerializer(serializers.ModelSerializer):
     postId = serializers.SerializerMethodField()
     # 文档要求的postText（动态内容）
     postText = serializers.SerializerMethodField()
+    # 聚合通知：触发人数与最近的触发者（“A 等 42 人点赞了你的动态”）
+    message = serializers.ReadOnlyField()
+    actorCount = serializers.ReadOnlyField(source='actor_count')
+    actors = serializers.SerializerMethodField()
 
     class Meta:
         model = Notification
         # 匹配文档的通知响应字段
-        fields = ['id', 'type', 'name', 'avatar', 'time', 'is_read', 'postId', 'postText']
+        fields = ['id', 'type', 'name', 'avatar', 'time', 'is_read', 'postId', 'postText',
+                  'message', 'actorCount', 'actors']
+        list_serializer_class = NotificationListSerializer
 
     def get_avatar(self, obj):
-        return f"https://picsum.photos/200?{obj.actor.id}"
+        return _avatar(obj.actor)
+
+    def get_actors(self, obj):
+        ids = obj.recent_actor_ids or [obj.actor_id]
+        users = self.context.get(NOTIFICATION_ACTORS_KEY)
+        if users is None:
+            users = load_users(ids)
+        return [
+            {'id': uid, 'name': users[uid].username, 'avatar': _avatar(users[uid])}
+            for uid in ids if uid in users
+        ]
 
     def get_time(self, obj):
         now = datetime.now()
@@ -0,0 +1,174 @@
+"""
+通知生成：发件箱 + 聚合
+
+点赞/评论的信号只记录一条精简的 NotificationEvent：
+- NOTIFICATION_DELIVERY = 'outbox'：事件与点赞/评论在同一事务写入发件箱，
+  由 manage.py notification_worker 批量取出、去重、聚合后 bulk_create，点赞/评论请求不再等待通知写入
+- NOTIFICATION_DELIVERY = 'sync'：在当前请求内立即投递（测试环境默认）
+
+聚合规则：同一接收者、同一目标、同一类型（点赞/评论）的互动，若距上一条通知不超过
+NOTIFICATION_COALESCE_WINDOW 秒，则合并进该通知：actor 更新为最新的触发者，actor_count 累加，
+recent_actor_ids 保留最近 NOTIFICATION_RECENT_ACTORS 个，时间更新为最新并重新置为未读。
+NOTIFICATION_COALESCE_WINDOW = 0 时关闭聚合，每次互动一条通知。
+"""
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import counters, stream
+from .models import Notification, NotificationEvent
+
+DELIVERY = getattr(settings, 'NOTIFICATION_DELIVERY', 'outbox')
+COALESCE_WINDOW = getattr(settings, 'NOTIFICATION_COALESCE_WINDOW', 3600)
+RECENT_ACTORS = getattr(settings, 'NOTIFICATION_RECENT_ACTORS', 3)
+
+ACTIONS = {
+    'like': '点赞了你的动态',
+    'comment': '评论了你的动态',
+}
+
+
+def build_message(actor_name, actor_count, kind):
+    """A 点赞了你的动态 / A 等 42 人点赞了你的动态"""
+    if actor_count > 1:
+        return f'{actor_name} 等 {actor_count} 人{ACTIONS[kind]}'
+    return f'{actor_name} {ACTIONS[kind]}'
+
+
+def notify(recipient_id, kind, actor_id, target):
+    """记录一次点赞/评论：写入发件箱，或在 sync 模式下立即投递"""
+    event = NotificationEvent(
+        recipient_id=recipient_id,
+        actor_id=actor_id,
+        kind=kind,
+        content_type_id=ContentType.objects.get_for_model(target).id,
+        object_id=target.pk,
+        created_at=timezone.now(),
+    )
+    if DELIVERY == 'sync':
+        deliver([event])
+    else:
+        event.save()
+
+
+def _target_key(event):
+    return event.recipient_id, event.kind, event.content_type_id, event.object_id
+
+
+def deliver(events):
+    """
+    把一批事件写成通知：去重、按目标聚合（并入窗口内已有的通知），新通知 bulk_create、
+    已有通知 bulk_update，计数按接收者一次性调整。返回新建的通知数。
+    """
+    # 同一人对同一目标的同类互动只保留最早一次（如取消后再次点赞）
+    unique = {}
+    for event in sorted(events, key=lambda e: (e.created_at, e.pk or 0)):
+        unique.setdefault(_target_key(event) + (event.actor_id,), event)
+    # 接收者或触发者已被删除的事件直接丢弃
+    user_ids = {e.actor_id for e in unique.values()} | {e.recipient_id for e in unique.values()}
+    names = dict(User.objects.filter(id__in=user_ids).values_list('id', 'username'))
+    events = [e for e in unique.values() if e.actor_id in names and e.recipient_id in names]
+    if not events:
+        return 0
+
+    window = timedelta(seconds=COALESCE_WINDOW)
+    with transaction.atomic():
+        latest = {}  # 目标 -> 窗口内最新的通知（已有或本批新建）
+        if COALESCE_WINDOW:
+            keys = {_target_key(e) for e in events}
+            candidates = (Notification.objects.select_for_update()
+                          .filter(object_id__in={e.object_id for e in events},
+                                  user_id__in={e.recipient_id for e in events},
+                                  type__in={e.kind for e in events},
+                                  created_at__gte=min(e.created_at for e in events) - window)
+                          .order_by('created_at', 'id'))
+            for notification in candidates:
+                key = (notification.user_id, notification.type, notification.content_type_id, notification.object_id)
+                if key in keys:
+                    latest[key] = notification
+
+        created, updated = [], {}
+        reopened = Counter()
+        for event in events:
+            key = _target_key(event)
+            current = latest.get(key)
+            if current is None or not COALESCE_WINDOW or event.created_at - current.created_at > window:
+                current = Notification(
+                    user_id=event.recipient_id,
+                    type=event.kind,
+                    actor_id=event.actor_id,
+                    content_type_id=event.content_type_id,
+                    object_id=event.object_id,
+                    message=build_message(names[event.actor_id], 1, event.kind),
+                    created_at=event.created_at,
+                    recent_actor_ids=[event.actor_id],
+                )
+                created.append(current)
+                latest[key] = current
+                continue
+
+            recent = current.recent_actor_ids or [current.actor_id]
+            # 最近列表中已有的人再次互动不重复计数（更早的触发者无法判重，按新的计入）
+            if event.actor_id not in recent:
+                current.actor_count += 1
+            current.recent_actor_ids = ([event.actor_id] + [uid for uid in recent if uid != event.actor_id])[:RECENT_ACTORS]
+            current.actor_id = event.actor_id
+            current.created_at = max(current.created_at, event.created_at)
+            current.message = build_message(names[event.actor_id], current.actor_count, event.kind)
+            if current.pk is not None:
+                if current.is_read:
+                    reopened[current.user_id] += 1
+                    current.is_read = False
+                updated[current.pk] = current
+
+        Notification.objects.bulk_create(created)
+        # bulk_update 不会触发 auto_now，显式更新以便实时推送发现聚合变化
+        now = timezone.now()
+        for notification in updated.values():
+            notification.updated_at = now
+        Notification.objects.bulk_update(
+            updated.values(),
+            ['actor', 'actor_count', 'recent_actor_ids', 'created_at', 'message', 'is_read', 'updated_at'],
+        )
+        added = Counter(n.user_id for n in created)
+        for user_id in added.keys() | reopened.keys():
+            counters.adjust(user_id, unread=added[user_id] + reopened[user_id], total=added[user_id])
+        if updated:
+            transaction.on_commit(stream.broker.wake)
+    return len(created)
+
+
+def drain(batch_size=500):
+    """从发件箱取出一批事件投递并删除，返回处理的事件数"""
+    with transaction.atomic():
+        events = list(NotificationEvent.objects.select_for_update(skip_locked=True).order_by('id')[:batch_size])
+        if not events:
+            return 0
+        deliver(events)
+        NotificationEvent.objects.filter(pk__in=[e.pk for e in events]).delete()
+    return len(events)
+
+
+@receiver(post_save, sender='api.Like')
+def create_like_notification(sender, instance, created, **kwargs):
+    """记录点赞通知事件"""
+    if created:
+        # 不通知自己
+        if instance.user_id != instance.post.user_id:
+            notify(instance.post.user_id, 'like', instance.user_id, instance.post)
+
+
+@receiver(post_save, sender='api.Comment')
+def create_comment_notification(sender, instance, created, **kwargs):
+    """记录评论通知事件"""
+    if created:
+        # 不通知自己
+        if instance.user_id != instance.post.user_id:
+            notify(instance.post.user_id, 'comment', instance.user_id, instance.post)
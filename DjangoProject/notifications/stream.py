@@ -0,0 +1,218 @@
+"""
+通知实时推送（SSE）：进程内发布/订阅
+
+每个 ASGI 进程只有一个轮询协程（Broker），每 NOTIFICATION_STREAM_POLL_INTERVAL 秒
+为本进程所有在线用户合并查询一次，再分发到各连接的 asyncio.Queue，查询次数与连接数无关：
+- 通知表 updated_at 有变化（新通知、聚合更新）-> notification 事件
+- 计数行 updated_at 有变化（新通知、已读、删除）-> unread 事件
+本进程内提交的计数变化（同步投递、已读、删除）会调用 wake() 立即触发一次轮询；
+notification_worker 等其他进程写入的变化由定时轮询发现。
+
+事件 id 为"updated_at 的微秒时间戳-主键"（整数运算，无浮点误差；同一微秒内按主键区分）。
+断线重连时客户端带上 Last-Event-ID，按 (updated_at, id) 补发此后变化的通知
+（最多 NOTIFICATION_STREAM_MAX_REPLAY 条）与当前未读数。
+Django 4.2 的 ASGIHandler 不感知客户端断开，连接在 NOTIFICATION_STREAM_MAX_AGE 秒后由服务端结束，
+客户端按 retry 间隔带 Last-Event-ID 自动重连，避免已断开的连接一直占用订阅。
+"""
+import asyncio
+import json
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from . import counters
+from .models import Notification, NotificationCounter
+from .serializers import NotificationSerializer
+
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL = getattr(settings, 'NOTIFICATION_STREAM_POLL_INTERVAL', 1.0)
+HEARTBEAT = getattr(settings, 'NOTIFICATION_STREAM_HEARTBEAT', 15)
+RETRY_MS = getattr(settings, 'NOTIFICATION_STREAM_RETRY_MS', 3000)
+MAX_REPLAY = getattr(settings, 'NOTIFICATION_STREAM_MAX_REPLAY', 50)
+MAX_AGE = getattr(settings, 'NOTIFICATION_STREAM_MAX_AGE', 300)
+
+QUEUE_SIZE = 100  # 单个连接积压的事件上限，消费过慢时丢弃最旧的
+POLL_BATCH = 500  # 每次 IN 查询的用户数
+# 晚提交的事务可能带有稍早的 updated_at：每次轮询向前多看一段，按已推送记录去重
+SLACK = timedelta(seconds=2)
+
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+
+
+def event_key(moment, pk=0):
+    """(微秒时间戳, 主键)，用于事件排序；未读数事件的主键为 0"""
+    return (moment - EPOCH) // MICROSECOND, pk
+
+
+def event_id(moment, pk=0):
+    return '%d-%d' % event_key(moment, pk)
+
+
+def parse_event_id(value):
+    """
+    Last-Event-ID -> (aware datetime, 主键)，无效时为 None；
+    旧格式（只有时间戳）的主键为 None，只按时间比较
+    """
+    try:
+        stamp, _, pk = str(value).partition('-')
+        return EPOCH + int(stamp) * MICROSECOND, int(pk) if pk else None
+    except (TypeError, ValueError, OverflowError):
+        return None
+
+
+def format_event(name, data, id=None):
+    lines = [f'id: {id}'] if id is not None else []
+    lines += [f'event: {name}', f'data: {json.dumps(data, ensure_ascii=False, default=str)}']
+    return '\n'.join(lines) + '\n\n'
+
+
+def _notification_events(notifications):
+    """[(user_id, 排序键, 事件文本)]，整批一次序列化（批量解析目标与触发者）"""
+    items = NotificationSerializer(notifications, many=True).data
+    return [
+        (n.user_id, event_key(n.updated_at, n.pk), format_event('notification', item, event_id(n.updated_at, n.pk)))
+        for n, item in zip(notifications, items)
+    ]
+
+
+def _unread_event(unread, total, moment=None):
+    # 未读数事件的主键取 0：以它重连时，同一微秒内的通知宁可重复补发也不遗漏
+    id = event_id(moment) if moment else None
+    return format_event('unread', {'unread': unread, 'total': total}, id)
+
+
+def replay(user_id, since):
+    """重连时补发：since = (updated_at, 主键) 之后变化的通知 + 当前未读数"""
+    events = []
+    if since is not None:
+        moment, pk = since
+        after = Q(updated_at__gt=moment)
+        if pk is not None:
+            after |= Q(updated_at=moment, id__gt=pk)
+        recent = list(Notification.objects.filter(after, user_id=user_id)
+                      .select_related('actor__profile').order_by('-updated_at', '-id')[:MAX_REPLAY])
+        events = [text for _, _, text in _notification_events(recent[::-1])]
+    counts = counters.get_counts(user_id)
+    events.append(_unread_event(counts['unread'], counts['total']))
+    return events
+
+
+class Broker:
+    """进程内的订阅表与共享轮询协程"""
+
+    def __init__(self):
+        self.queues = defaultdict(set)  # user_id -> {asyncio.Queue}
+        self.loop = None
+        self.task = None
+        self.wakeup = None
+        self.cursor = None
+        self.sent = {}  # (类型, 主键) -> 已推送的 updated_at，仅保留 SLACK 区间内的
+
+    def subscribe(self, user_id):
+        loop = asyncio.get_running_loop()
+        if self.loop is not loop:
+            self.loop, self.task, self.wakeup = loop, None, asyncio.Event()
+        queue = asyncio.Queue(QUEUE_SIZE)
+        self.queues[user_id].add(queue)
+        if self.task is None or self.task.done():
+            self.cursor = timezone.now()
+            self.task = loop.create_task(self.run())
+        return queue
+
+    def unsubscribe(self, user_id, queue):
+        subscribers = self.queues.get(user_id)
+        if subscribers is not None:
+            subscribers.discard(queue)
+            if not subscribers:
+                del self.queues[user_id]
+        if not self.queues and self.wakeup is not None:
+            self.wakeup.set()  # 让轮询协程退出
+
+    def wake(self):
+        """请求立即轮询；可在任意线程调用（同步视图、事务提交回调）"""
+        loop = self.loop
+        if loop is not None and not loop.is_closed() and self.queues:
+            loop.call_soon_threadsafe(self.wakeup.set)
+
+    def publish(self, user_id, text):
+        for queue in self.queues.get(user_id, ()):
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(text)
+
+    async def run(self):
+        while self.queues:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            if not self.queues:
+                break
+            try:
+                events = await sync_to_async(self.poll)(list(self.queues))
+            except Exception:
+                logger.exception('通知推送轮询失败')
+                continue
+            for user_id, text in events:
+                self.publish(user_id, text)
+
+    def poll(self, user_ids):
+        """查询在线用户自上次轮询以来的变化，返回按时间排序的 [(user_id, 事件文本)]"""
+        since = self.cursor - SLACK
+        notifications, counts = [], []
+        for start in range(0, len(user_ids), POLL_BATCH):
+            batch = user_ids[start:start + POLL_BATCH]
+            notifications += (Notification.objects.filter(user_id__in=batch, updated_at__gt=since)
+                              .select_related('actor__profile').order_by('updated_at', 'id'))
+            counts += NotificationCounter.objects.filter(user_id__in=batch, updated_at__gt=since)
+
+        notifications = [n for n in notifications if self._fresh(('notification', n.pk), n.updated_at)]
+        counts = [c for c in counts if self._fresh(('unread', c.pk), c.updated_at)]
+        events = _notification_events(notifications) if notifications else []
+        events += [(c.user_id, event_key(c.updated_at), _unread_event(c.unread, c.total, c.updated_at))
+                   for c in counts]
+
+        moments = [n.updated_at for n in notifications] + [c.updated_at for c in counts]
+        if moments:
+            self.cursor = max(self.cursor, max(moments))
+        floor = self.cursor - SLACK
+        self.sent = {key: moment for key, moment in self.sent.items() if moment > floor}
+        return [(user_id, text) for user_id, _, text in sorted(events, key=lambda e: e[1])]
+
+    def _fresh(self, key, moment):
+        if self.sent.get(key) == moment:
+            return False
+        self.sent[key] = moment
+        return True
+
+
+broker = Broker()
+
+
+async def events(user_id, last_event_id=None):
+    """单个 SSE 连接的事件流：重试间隔、补发、实时事件与心跳，MAX_AGE 秒后结束"""
+    queue = broker.subscribe(user_id)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + MAX_AGE
+    try:
+        yield f'retry: {RETRY_MS}\n\n'
+        for text in await sync_to_async(replay)(user_id, parse_event_id(last_event_id)):
+            yield text
+        while (remaining := deadline - loop.time()) > 0:
+            try:
+                text = await asyncio.wait_for(queue.get(), min(HEARTBEAT, remaining))
+            except asyncio.TimeoutError:
+                yield ': ping\n\n'  # 注释行作为心跳，防止代理断开空闲连接
+                continue
+            yield text
+    finally:
+        broker.unsubscribe(user_id, queue)
@@ -1,3 +1,327 @@
+import asyncio
+from datetime import datetime, timedelta, timezone as dt_timezone
+from io import StringIO
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from api.models import Post, Like, Comment
+from . import counters, retention, services, stream
+from .models import Notification, NotificationCounter, NotificationEvent
+
+
+class NotificationCounterTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="owner", password="password1")
+        self.others = [User.objects.create(username=f"fan{i}") for i in range(3)]
+        self.post = Post.objects.create(user=self.user, text="p0")
+        for other in self.others:
+            Like.objects.create(user=other, post=self.post)
+        Comment.objects.create(user=self.others[0], post=self.post, content="c")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def badge(self, queries=1):
+        with self.assertNumQueries(queries):
+            return self.client.get("/api/notifications/badge/").json()["data"]
+
+    def assertCountsMatchTable(self):
+        self.assertEqual(self.badge(), {
+            "unread": Notification.objects.filter(user=self.user, is_read=False).count(),
+            "total": Notification.objects.filter(user=self.user).count(),
+        })
+
+    def test_signals_count_new_notifications(self):
+        # 三个点赞聚合为一条，另有一条评论
+        self.assertEqual(self.badge(), {"unread": 2, "total": 2})
+        data = self.client.get("/api/notifications/").json()["data"]
+        self.assertEqual((data["total"], data["total_unread"]), (2, 2))
+
+    def test_bulk_paths_adjust_counts(self):
+        first = Notification.objects.filter(user=self.user).first()
+        self.client.put(f"/api/notifications/{first.id}/read/")
+        self.client.put(f"/api/notifications/{first.id}/read/")
+        self.assertEqual(self.badge(), {"unread": 1, "total": 2})
+        self.client.delete(f"/api/notifications/{first.id}/delete/")
+        self.assertCountsMatchTable()
+        self.client.put("/api/notifications/read-all/")
+        self.assertCountsMatchTable()
+        Like.objects.create(user=self.others[0], post=Post.objects.create(user=self.user, text="p1"))
+        self.client.delete("/api/notifications/delete-all/")
+        self.assertEqual(self.badge(), {"unread": 0, "total": 0})
+
+    def test_missing_row_is_rebuilt_and_actor_deletion_recounted(self):
+        NotificationCounter.objects.all().delete()
+        # 缺少计数行时临时统计，GET 不写入
+        self.assertEqual(self.badge(queries=2), {"unread": 2, "total": 2})
+        self.assertFalse(NotificationCounter.objects.exists())
+        counters.adjust(self.user.id, unread=-1)
+        self.assertEqual(self.badge(), {"unread": 2, "total": 2})  # 按表重算，已包含本次变化
+        with self.captureOnCommitCallbacks(execute=True):
+            self.others[0].delete()
+        self.assertCountsMatchTable()
+
+
+class NotificationCoalesceTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="owner", password="password1")
+        self.post = Post.objects.create(user=self.user, text="p0")
+        self.fans = [User.objects.create(username=f"fan{i}") for i in range(42)]
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_likes_within_window_update_one_notification(self):
+        for fan in self.fans:
+            Like.objects.create(user=fan, post=self.post)
+        notification = Notification.objects.get(user=self.user)
+        self.assertEqual(notification.actor_count, 42)
+        self.assertEqual(notification.actor, self.fans[-1])
+        self.assertEqual(notification.recent_actor_ids, [f.id for f in reversed(self.fans[-3:])])
+        self.assertEqual(notification.message, "fan41 等 42 人点赞了你的动态")
+
+        item = self.client.get("/api/notifications/").json()["data"]["notifications"][0]
+        self.assertEqual((item["actorCount"], item["name"]), (42, "fan41"))
+        self.assertEqual([a["name"] for a in item["actors"]], ["fan41", "fan40", "fan39"])
+
+    def test_new_activity_reopens_read_notification(self):
+        Like.objects.create(user=self.fans[0], post=self.post)
+        self.client.put("/api/notifications/read-all/")
+        Comment.objects.create(user=self.fans[1], post=self.post, content="c1")
+        Comment.objects.create(user=self.fans[1], post=self.post, content="c2")
+        Like.objects.create(user=self.fans[1], post=self.post)
+        comment = Notification.objects.get(type="comment")
+        self.assertEqual(comment.actor_count, 1)  # 同一人多次评论只计一次
+        self.assertFalse(Notification.objects.get(type="like").is_read)
+        self.assertEqual(counters.get_counts(self.user.id), {"unread": 2, "total": 2})
+
+    def test_window_expiry_starts_new_notification(self):
+        Like.objects.create(user=self.fans[0], post=self.post)
+        Notification.objects.update(created_at=timezone.now() - timedelta(seconds=services.COALESCE_WINDOW + 1))
+        Like.objects.create(user=self.fans[1], post=self.post)
+        self.assertEqual(Notification.objects.filter(type="like").count(), 2)
+        self.assertEqual(counters.get_counts(self.user.id), {"unread": 2, "total": 2})
+
+
+class NotificationListQueryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="owner", password="password1")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def add(self, count):
+        for i in range(count):
+            fan = User.objects.create(username=f"fan{Notification.objects.count()}")
+            post = Post.objects.create(user=self.user, text=f"p{i}")
+            Like.objects.create(user=fan, post=post)
+            Comment.objects.create(user=fan, post=post, content="c")
+
+    def fetch(self):
+        with CaptureQueriesContext(connection) as ctx:
+            data = self.client.get("/api/notifications/", {"pageSize": 100}).json()["data"]
+        return data["notifications"], len(ctx.captured_queries)
+
+    def test_constant_queries_and_deleted_targets(self):
+        self.add(2)
+        _, few = self.fetch()
+        self.add(40)
+        # 目标已删除的通知：postId/postText 为 None，且不额外查询
+        Post.objects.filter(text="p0").delete()
+        notifications, many = self.fetch()
+        self.assertEqual(few, many)
+        self.assertEqual(len(notifications), 84)
+        by_text = {n["postText"] for n in notifications}
+        self.assertIn("p1", by_text)
+        self.assertIn(None, by_text)
+
+
+class NotificationOutboxTests(TestCase):
+    def setUp(self):
+        self.original = services.DELIVERY
+        services.DELIVERY = "outbox"
+        self.user = User.objects.create_user(username="owner", password="password1")
+        self.post = Post.objects.create(user=self.user, text="p0")
+        self.fans = [User.objects.create(username=f"fan{i}") for i in range(5)]
+
+    def tearDown(self):
+        services.DELIVERY = self.original
+
+    def test_events_are_drained_in_batches(self):
+        for fan in self.fans:
+            Like.objects.create(user=fan, post=self.post)
+        Comment.objects.create(user=self.fans[0], post=self.post, content="c")
+        self.assertFalse(Notification.objects.exists())
+        self.assertEqual(NotificationEvent.objects.count(), 6)
+
+        self.assertEqual(services.drain(batch_size=4), 4)
+        self.assertEqual(services.drain(batch_size=4), 2)
+        self.assertEqual(services.drain(), 0)
+        like = Notification.objects.get(type="like")
+        self.assertEqual(like.actor_count, 5)
+        self.assertEqual(like.actor, self.fans[-1])
+        self.assertEqual(counters.get_counts(self.user.id), {"unread": 2, "total": 2})
+
+    def test_duplicates_and_deleted_users_are_dropped(self):
+        like = Like.objects.create(user=self.fans[0], post=self.post)
+        like.delete()
+        Like.objects.create(user=self.fans[0], post=self.post)
+        Like.objects.create(user=self.fans[1], post=self.post)
+        self.fans[1].delete()
+        call_command("notification_worker", once=True, stdout=StringIO())
+        like = Notification.objects.get()
+        self.assertEqual((like.actor_count, like.actor), (1, self.fans[0]))
+        self.assertFalse(NotificationEvent.objects.exists())
+
+
+class NotificationRetentionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="owner", password="password1")
+        self.fan = User.objects.create(username="fan")
+        post = Post.objects.create(user=self.user, text="p0")
+        now = timezone.now()
+        # 第 i 条为 i 天前的通知，6 天及更早的已读
+        self.notifications = [
+            Notification.objects.create(user=self.user, actor=self.fan, type="like", content_object=post,
+                                        message="m", created_at=now - timedelta(days=i), is_read=i >= 6)
+            for i in range(8)
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def assertCounts(self, unread, total):
+        self.assertEqual(counters.get_counts(self.user.id), {"unread": unread, "total": total})
+        self.assertEqual(Notification.objects.filter(user=self.user).count(), total)
+
+    def test_compact_deletes_expired_read_and_over_limit(self):
+        out = StringIO()
+        call_command("compact_notifications", days=5, max_per_user=4, chunk_size=2, pause=0, dry_run=True, stdout=out)
+        self.assertIn("将删除 2 条过期已读通知", out.getvalue())
+        self.assertCounts(unread=6, total=8)
+
+        result = retention.compact(days=5, max_per_user=4, chunk_size=2, pause=0)
+        self.assertEqual(result, {"expired": 2, "over_limit": 2})
+        self.assertEqual(
+            list(Notification.objects.filter(user=self.user).order_by("-created_at")),
+            self.notifications[:4],
+        )
+        self.assertCounts(unread=4, total=4)
+
+    def test_delete_all_runs_in_chunks(self):
+        original = retention.CHUNK_SIZE, retention.PAUSE
+        retention.CHUNK_SIZE, retention.PAUSE = 3, 5
+        try:
+            with CaptureQueriesContext(connection) as ctx, mock.patch.object(retention.time, "sleep") as sleep:
+                self.client.delete("/api/notifications/delete-all/")
+        finally:
+            retention.CHUNK_SIZE, retention.PAUSE = original
+        deletes = [q for q in ctx.captured_queries if q["sql"].startswith("DELETE")]
+        self.assertEqual(len(deletes), 3)
+        sleep.assert_not_called()  # 请求线程内不停顿
+        self.assertCounts(unread=0, total=0)
+
+
+class NotificationStreamTests(TestCase):
+    def setUp(self):
+        self.original = stream.POLL_INTERVAL, stream.HEARTBEAT, stream.MAX_AGE
+        stream.POLL_INTERVAL, stream.HEARTBEAT, stream.MAX_AGE = 0.05, 0.2, 0.5
+        self.user = User.objects.create_user(username="owner", password="password1")
+        self.fan = User.objects.create(username="fan")
+        self.post = Post.objects.create(user=self.user, text="p0")
+        self.token = Token.objects.create(user=self.user).key
+
+    def tearDown(self):
+        stream.POLL_INTERVAL, stream.HEARTBEAT, stream.MAX_AGE = self.original
+
+    async def open(self, authorization=None, last_event_id=None):
+        headers = {"Authorization": authorization or f"Token {self.token}"}
+        if last_event_id is not None:
+            headers["Last-Event-ID"] = str(last_event_id)
+        response = await self.async_client.get("/api/notifications/stream/", headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        return aiter(response.streaming_content)
+
+    async def next_event(self, events, name):
+        while True:
+            chunk = await asyncio.wait_for(anext(events), 2)
+            text = chunk.decode()
+            if f"event: {name}" in text:
+                return text
+
+    async def close(self, events):
+        # 连接到期后服务端结束事件流并退订，最后一个订阅者离开后轮询协程退出
+        async for _ in events:
+            pass
+        await asyncio.wait_for(stream.broker.task, 2)
+
+    async def test_requires_token_or_jwt(self):
+        response = await self.async_client.get("/api/notifications/stream/")
+        self.assertEqual(response.status_code, 401)
+        response = await self.async_client.get("/api/notifications/stream/", {"token": "bad"})
+        self.assertEqual(response.status_code, 401)
+        access = str(RefreshToken.for_user(self.user).access_token)
+        events = await self.open(f"Bearer {access}")
+        self.assertIn('"unread": 0', await self.next_event(events, "unread"))
+        await self.close(events)
+
+    async def test_pushes_new_notifications_and_counts(self):
+        events = await self.open()
+        self.assertEqual(await anext(events), f"retry: {stream.RETRY_MS}\n\n".encode())
+        self.assertIn('"unread": 0', await self.next_event(events, "unread"))
+
+        await sync_to_async(Like.objects.create)(user=self.fan, post=self.post)
+        text = await self.next_event(events, "notification")
+        self.assertIn("fan 点赞了你的动态", text)
+        self.assertIn('"unread": 1', await self.next_event(events, "unread"))
+        # 空闲时发送心跳注释
+        self.assertEqual(await asyncio.wait_for(anext(events), 2), b": ping\n\n")
+        await self.close(events)
+        self.assertFalse(stream.broker.queues)
+
+    async def test_reconnect_replays_after_last_event_id(self):
+        await sync_to_async(Like.objects.create)(user=self.fan, post=self.post)
+        notification = await Notification.objects.aget(user=self.user)
+        since = stream.event_id(notification.updated_at - timedelta(seconds=1))
+        events = await self.open(last_event_id=since)
+        self.assertIn(f"id: {stream.event_id(notification.updated_at, notification.pk)}",
+                      await self.next_event(events, "notification"))
+        self.assertIn('"unread": 1', await self.next_event(events, "unread"))
+        await self.close(events)
+
+        # 已收到的事件不再补发
+        events = await self.open(last_event_id=stream.event_id(notification.updated_at, notification.pk))
+        self.assertNotIn("event: notification", await self.next_event(events, "unread"))
+        await self.close(events)
+
+    def test_event_ids_are_exact_and_break_ties_by_pk(self):
+        moment = datetime(2025, 3, 1, 12, 0, 0, 999_999, tzinfo=dt_timezone.utc)
+        self.assertEqual(stream.event_id(moment, 7), "1740830400999999-7")
+        self.assertEqual(stream.parse_event_id(stream.event_id(moment, 7)), (moment, 7))
+        self.assertIsNone(stream.parse_event_id("bad"))
+        # 同一 updated_at 的两条通知：以第一条重连只补发第二条
+        Like.objects.create(user=self.fan, post=self.post)
+        Like.objects.create(user=self.fan, post=Post.objects.create(user=self.user, text="p1"))
+        first, second = Notification.objects.filter(user=self.user).order_by("id")
+        Notification.objects.filter(user=self.user).update(updated_at=moment)
+        events = stream.replay(self.user.id, stream.parse_event_id(stream.event_id(moment, first.pk)))
+        self.assertEqual(len(events), 2)
+        self.assertIn(f"id: {stream.event_id(moment, second.pk)}", events[0])
 
-# Create your tests here.
+    def test_shared_poll_queries_do_not_grow_with_connections(self):
+        users = [self.user] + [User.objects.create(username=f"u{i}") for i in range(20)]
+        broker = stream.Broker()
+        broker.cursor = timezone.now() - timedelta(minutes=1)
+        Like.objects.create(user=self.fan, post=self.post)
+        with self.assertNumQueries(4):
+            events = broker.poll([u.id for u in users])
+        self.assertEqual([user_id for user_id, _ in events], [self.user.id, self.user.id])
+        # 下一次轮询不重复推送
+        self.assertEqual(broker.poll([u.id for u in users]), [])
@@ -1,6 +1,8 @@
 from django.urls import path
 from .views import (
     get_notifications,
+    notification_badge,
+    notification_stream,
     mark_notification_read,
     mark_all_notifications_read,
     delete_notification,
@@ -12,6 +14,10 @@ app_name = 'notifications'
 urlpatterns = [
     # 获取通知列表
     path('', get_notifications, name='get_notifications'),  # 对应 /api/notifications/
+    # 通知角标（未读数 / 总数）
+    path('badge/', notification_badge, name='notification_badge'),  # 对应 /api/notifications/badge/
+    # 实时推送（SSE）
+    path('stream/', notification_stream, name='notification_stream'),  # 对应 /api/notifications/stream/
     # 标记单个通知为已读
     path('<int:notification_id>/read/', mark_notification_read, name='mark_notification_read'),  # 对应 /api/notifications/<id>/read/
     # 标记所有通知为已读
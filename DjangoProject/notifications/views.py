@@ -1,54 +1,112 @@
 from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
-from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
+from api.pagination import get_paginator
+from . import counters, retention, stream
 from .models import Notification
 from .serializers import NotificationSerializer
 
 
-# 自定义分页类（与其他应用保持一致）
-class StandardResultsSetPagination(PageNumberPagination):
-    page_size = 10
-    page_size_query_param = 'pageSize'
-    max_page_size = 100
-
-
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_notifications(request):
     """获取当前用户的通知列表"""
     # 获取通知列表，按时间倒序
-    notifications = Notification.objects.filter(user=request.user).order_by('-created_at')
+    notifications = Notification.objects.filter(user=request.user).select_related('actor__profile').order_by('-created_at')
     
-    # 应用分页
-    paginator = StandardResultsSetPagination()
+    # 应用分页：默认页码分页，传 cursor 参数时使用游标分页
+    paginator = get_paginator(request)
     paginated_notifications = paginator.paginate_queryset(notifications, request)
     
     # 序列化
     serializer = NotificationSerializer(paginated_notifications, many=True, context={'request': request})
     
-    # 统计未读通知数量
-    total_unread = notifications.filter(is_read=False).count()
+    # 总数与未读数读取计数行，不再 COUNT 通知表
+    counts = counters.get_counts(request.user.id)
     
     return Response({
         'success': True,
         'data': {
             'notifications': serializer.data,
-            'total': notifications.count(),
-            'total_unread': total_unread  # 保持与文档一致的字段名
+            'total': counts['total'],
+            'total_unread': counts['unread'],  # 保持与文档一致的字段名
+            'next_cursor': paginator.get_next_cursor()
         }
     })
 
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def notification_badge(request):
+    """通知角标：只读取计数行（供客户端高频轮询）"""
+    counts = counters.get_counts(request.user.id)
+    return Response({
+        'success': True,
+        'data': {
+            'unread': counts['unread'],
+            'total': counts['total']
+        }
+    })
+
+
+def _authenticate(request):
+    """
+    使用 DRF 已配置的认证方式（Session / Token / JWT）认证。
+    浏览器 EventSource 无法设置请求头，允许以 ?token= 传递 Token 或 JWT access token。
+    """
+    token = request.GET.get('token')
+    if token and 'HTTP_AUTHORIZATION' not in request.META:
+        request.META['HTTP_AUTHORIZATION'] = f"{'Bearer' if '.' in token else 'Token'} {token}"
+    drf_request = Request(request)
+    for authentication_class in api_settings.DEFAULT_AUTHENTICATION_CLASSES:
+        try:
+            result = authentication_class().authenticate(drf_request)
+        except AuthenticationFailed:
+            return None
+        if result is not None:
+            return result[0]
+    return None
+
+
+async def notification_stream(request):
+    """
+    通知实时推送（SSE，需在 ASGI 下运行）：notification / unread 事件与心跳，
+    断线重连时按 Last-Event-ID 补发
+    """
+    if request.method != 'GET':
+        return JsonResponse({'success': False, 'message': '仅支持 GET'}, status=405)
+    if not isinstance(request, ASGIRequest):
+        # WSGI 会把整个事件流读完才返回
+        return JsonResponse({'success': False, 'message': '实时推送需要以 ASGI 方式部署'}, status=501)
+    user = await sync_to_async(_authenticate)(request)
+    if user is None or not user.is_active:
+        return JsonResponse({'success': False, 'message': '身份认证信息未提供或无效'}, status=401)
+
+    last_event_id = request.headers.get('Last-Event-ID') or request.GET.get('lastEventId')
+    response = StreamingHttpResponse(stream.events(user.id, last_event_id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # 关闭 nginx 缓冲
+    return response
+
+
 @api_view(['PUT'])
 @permission_classes([IsAuthenticated])
 def mark_notification_read(request, notification_id):
     """标记单个通知为已读"""
     try:
         notification = Notification.objects.get(id=notification_id, user=request.user)
-        notification.is_read = True
-        notification.save()
+        if not notification.is_read:
+            # 条件更新：并发重复标记时只扣减一次
+            updated = Notification.objects.filter(id=notification.id, is_read=False).update(is_read=True)
+            counters.adjust(request.user.id, unread=-updated)
         
         return Response({
             'success': True,
@@ -66,7 +124,8 @@ def mark_notification_read(request, notification_id):
 def mark_all_notifications_read(request):
     """标记所有通知为已读"""
     # 更新当前用户的所有未读通知
-    Notification.objects.filter(user=request.user, is_read=False).update(is_read=True)
+    updated = Notification.objects.filter(user=request.user, is_read=False).update(is_read=True)
+    counters.adjust(request.user.id, unread=-updated)
     
     return Response({
         'success': True,
@@ -80,7 +139,7 @@ def delete_notification(request, notification_id):
     """删除单个通知"""
     try:
         notification = Notification.objects.get(id=notification_id, user=request.user)
-        notification.delete()
+        _delete_and_count(request.user.id, Notification.objects.filter(id=notification.id))
         
         return Response({
             'success': True,
@@ -97,8 +156,8 @@ def delete_notification(request, notification_id):
 @permission_classes([IsAuthenticated])
 def delete_all_notifications(request):
     """删除所有通知"""
-    # 删除当前用户的所有通知
-    Notification.objects.filter(user=request.user).delete()
+    # 分块删除，避免一条大 DELETE 长时间持有写锁；请求线程内不在块间停顿（停顿只用于 compact_notifications）
+    retention.delete_in_chunks(Notification.objects.filter(user=request.user), pause=0)
     
     return Response({
         'success': True,
@@ -115,17 +174,26 @@ def mark_as_read(request):
 
     if notification_ids:
         # 标记指定ID的通知为已读（仅更新未读的）
-        Notification.objects.filter(
+        updated = Notification.objects.filter(
             id__in=notification_ids,
             user=user,
             is_read=False  # 优化：只更新未读的，避免重复操作
         ).update(is_read=True)
     else:
         # 标记全部已读（仅更新未读的，效率更高）
-        Notification.objects.filter(user=user, is_read=False).update(is_read=True)
+        updated = Notification.objects.filter(user=user, is_read=False).update(is_read=True)
+    counters.adjust(user.id, unread=-updated)
 
     # 响应格式已符合文档
     return Response({
         'success': True,
         'message': '操作成功'
     })
+
+
+def _delete_and_count(user_id, queryset):
+    """删除通知并按实际删除的行数调整计数（先删未读，以便分别计数）"""
+    with transaction.atomic():
+        unread, _ = queryset.filter(is_read=False).delete()
+        read, _ = queryset.delete()
+        counters.adjust(user_id, unread=-unread, total=-(unread + read))
@@ -4,7 +4,7 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from django.db.models import F
 from .models import Post, Comment, Like
-from api.models import Friendship, Follow
+from api import social
 
 from .serializers import PostSerializer, CommentSerializer, LikeResponseSerializer
 from notifications.models import Notification
@@ -24,21 +24,8 @@ class PostListView(generics.ListAPIView):
         public_q = Q(visibility='public')
         qs = Post.objects.filter(public_q).order_by('-created_time')
         if user and user.is_authenticated:
-            # 好友 id 集合
-            friendships = Friendship.objects.filter(
-                Q(status='accepted') & (Q(from_user=user) | Q(to_user=user))
-            )
-            friend_ids = set()
-            for fr in friendships:
-                if fr.from_user_id == user.id:
-                    friend_ids.add(fr.to_user_id)
-                else:
-                    friend_ids.add(fr.from_user_id)
-            # 互关也视作好友
-            following_ids = set(Follow.objects.filter(follower=user).values_list('following_id', flat=True))
-            follower_ids = set(Follow.objects.filter(following=user).values_list('follower_id', flat=True))
-            mutual_ids = following_ids.intersection(follower_ids)
-            friend_ids.update(mutual_ids)
+            # 好友 id 集合（含互关），走关系图缓存
+            friend_ids = social.get_friend_ids(user.id)
 
             return Post.objects.filter(
                 Q(user=user) |
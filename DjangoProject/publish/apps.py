@@ -1,6 +1,22 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+# 常用标签，发布页直接展示
+COMMON_TAGS = ['户外', '日常', '美食', '旅行', '运动', '摄影', '读书', '音乐', '电影', '宠物', '工作', '学习']
+
+
+def ensure_common_tags(sender, using, **kwargs):
+    """迁移后确保常用标签存在，读接口无需再 get_or_create"""
+    from api.models import Tag
+    Tag.objects.using(using).bulk_create(
+        [Tag(name=name) for name in COMMON_TAGS],
+        ignore_conflicts=True,
+    )
 
 
 class PublishConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'publish'
+
+    def ready(self):
+        post_migrate.connect(ensure_common_tags, sender=self)
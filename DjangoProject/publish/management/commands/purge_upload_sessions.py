@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from publish import uploads
+
+
+class Command(BaseCommand):
+    help = '清理过期的分块上传会话（未完成的连同临时文件）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ttl', type=int, default=uploads.SESSION_TTL, help='会话多少秒未活动即视为过期')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"已清理 {uploads.purge(options['ttl'])} 个上传会话")
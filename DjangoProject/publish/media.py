@@ -0,0 +1,202 @@
+"""
+媒体文件的范围请求（Range）服务
+
+- 打开文件后用 fstat 取大小与修改时间（每次请求一次系统调用），不整体读入内存：
+  整文件与单个范围都交给 FileResponse 按块输出（WSGI 服务器提供 wsgi.file_wrapper 时可走 sendfile，
+  单个范围的包装对象从范围起点开始，Content-Length 为范围长度）；多个范围以 multipart/byteranges 流式输出
+- 支持 bytes=a-b / a- / -n（后缀）及多个范围，重叠或相邻的范围合并；无法满足时返回 416
+- ETag（修改时间 + 大小）/ Last-Modified，If-None-Match / If-Modified-Since 返回 304，
+  If-Range 不匹配时忽略 Range 返回整个文件
+- 文件名为 UUID（上传时生成，内容不会再变）时使用一年的 immutable 缓存，其余每次重新验证
+"""
+import io
+import mimetypes
+import os
+import re
+import uuid
+
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+
+BLOCK = 64 * 1024
+MAX_RANGES = 16  # 合并后仍超过该数量的多范围请求按整文件返回，避免大量小范围放大开销
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'public, no-cache'
+
+_RANGE = re.compile(r'^\s*(\d*)\s*-\s*(\d*)\s*$')
+
+
+class RangeFile(io.RawIOBase):
+    """文件中 [start, end] 区间的只读视图；位置相对区间起点，底层文件位置始终同步（便于 sendfile）"""
+
+    def __init__(self, file, start, end):
+        self.file, self.start, self.length = file, start, end - start + 1
+        self.name = file.name
+        self.position = 0
+        file.seek(start)
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self.position, io.SEEK_END: self.length}[whence]
+        self.position = min(max(base + offset, 0), self.length)
+        self.file.seek(self.start + self.position)
+        return self.position
+
+    def read(self, size=-1):
+        remaining = self.length - self.position
+        size = remaining if size is None or size < 0 else min(size, remaining)
+        data = self.file.read(size) if size else b''
+        self.position += len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+        super().close()
+
+
+def parse_ranges(header, size):
+    """Range 头 -> 合并后的 [(start, end)]；语法不合法或不是字节范围时为 None，全部无法满足时为 []"""
+    unit, _, specs = header.partition('=')
+    if unit.strip().lower() != 'bytes' or not specs.strip():
+        return None
+    ranges = []
+    for spec in specs.split(','):
+        match = _RANGE.match(spec)
+        if not match or not (match.group(1) or match.group(2)):
+            return None
+        first, last = match.groups()
+        if not first:
+            # 后缀范围：最后 n 个字节；空文件没有可满足的后缀范围
+            length = int(last)
+            if length and size:
+                ranges.append((max(size - length, 0), size - 1))
+            continue
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+        if last and int(last) < start:
+            return None
+        if start < size:
+            ranges.append((start, end))
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _is_uuid_name(filename):
+    try:
+        uuid.UUID(os.path.splitext(filename)[0])
+    except ValueError:
+        return False
+    return True
+
+
+def _if_range_passes(request, etag, last_modified):
+    """If-Range：强 ETag 完全一致，或日期与 Last-Modified 完全一致"""
+    value = request.META.get('HTTP_IF_RANGE')
+    if not value:
+        return True
+    value = value.strip()
+    if value.startswith('"'):
+        return value == etag
+    return parse_http_date_safe(value) == last_modified
+
+
+def _multipart(file, ranges, size, content_type, boundary):
+    """multipart/byteranges 的 (Content-Length, 输出生成器)"""
+    heads = [
+        (f'--{boundary}\r\nContent-Type: {content_type}\r\n'
+         f'Content-Range: bytes {start}-{end}/{size}\r\n\r\n').encode()
+        for start, end in ranges
+    ]
+    # 第一段分隔符前没有 CRLF，其余每段前有
+    tail = f'\r\n--{boundary}--\r\n'.encode()
+    length = sum(len(h) for h in heads) + 2 * (len(ranges) - 1) + sum(e - s + 1 for s, e in ranges) + len(tail)
+
+    def stream():
+        try:
+            for i, (head, (start, end)) in enumerate(zip(heads, ranges)):
+                yield (b'\r\n' if i else b'') + head
+                file.seek(start)
+                remaining = end - start + 1
+                while remaining > 0:
+                    data = file.read(min(BLOCK, remaining))
+                    if not data:
+                        return
+                    remaining -= len(data)
+                    yield data
+            yield tail
+        finally:
+            file.close()
+
+    return length, stream()
+
+
+def serve(request, path, filename=None):
+    """按 Range / 条件请求头输出 path 指向的文件"""
+    try:
+        file = open(path, 'rb')
+    except (FileNotFoundError, IsADirectoryError, NotADirectoryError):
+        raise Http404('File not found.')
+    stat = os.fstat(file.fileno())
+    size, last_modified = stat.st_size, int(stat.st_mtime)
+    filename = filename or os.path.basename(path)
+    content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    etag = f'"{stat.st_mtime_ns:x}-{size:x}"'
+    headers = {
+        'ETag': etag,
+        'Last-Modified': http_date(last_modified),
+        'Cache-Control': IMMUTABLE if _is_uuid_name(filename) else REVALIDATE,
+        'Accept-Ranges': 'bytes',
+    }
+
+    prototype = HttpResponse()
+    for name, value in headers.items():
+        prototype[name] = value
+    conditional = get_conditional_response(request, etag, last_modified, prototype)
+    if conditional is not prototype:
+        file.close()
+        return conditional
+
+    ranges = None
+    if request.META.get('HTTP_RANGE') and _if_range_passes(request, etag, last_modified):
+        ranges = parse_ranges(request.META['HTTP_RANGE'], size)
+    if ranges == []:
+        file.close()
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        response['Accept-Ranges'] = 'bytes'
+        return response
+
+    if not ranges or len(ranges) > MAX_RANGES:
+        response = FileResponse(file, content_type=content_type)
+        response.block_size = BLOCK
+    elif len(ranges) == 1:
+        start, end = ranges[0]
+        response = FileResponse(RangeFile(file, start, end), status=206, content_type=content_type)
+        response.block_size = BLOCK
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    else:
+        boundary = uuid.uuid4().hex
+        length, body = _multipart(file, ranges, size, content_type, boundary)
+        response = StreamingHttpResponse(body, status=206,
+                                         content_type=f'multipart/byteranges; boundary={boundary}')
+        response['Content-Length'] = str(length)
+    for name, value in headers.items():
+        response[name] = value
+    return response
@@ -1,3 +1,34 @@
+import uuid
+
+from django.contrib.auth.models import User
 from django.db import models
 
-# Create your models here.
+
+class UploadSession(models.Model):
+    """分块上传会话：分块按偏移依次追加到 MEDIA_ROOT 下的临时文件，全部收到后转存，见 publish/uploads.py"""
+    KIND_CHOICES = (
+        ('image', '图片'),
+        ('video', '视频'),
+        ('avatar', '头像'),
+    )
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='upload_sessions')
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    filename = models.CharField(max_length=255, blank=True, default='')  # 客户端的原始文件名
+    size = models.BigIntegerField()  # 声明的总字节数
+    received = models.BigIntegerField(default=0)  # 已连续写入的字节数，即下一个分块的偏移
+    path = models.CharField(max_length=255, blank=True, default='')  # 完成后在存储中的路径
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # 统计进行中的会话 / 清理过期会话
+            models.Index(fields=['user', 'completed_at'], name='publish_upload_user_idx'),
+            models.Index(fields=['completed_at', 'updated_at'], name='publish_upload_stale_idx'),
+        ]
+
+    def __str__(self):
+        return f'UploadSession({self.id}) {self.kind} {self.received}/{self.size}'
@@ -1,3 +1,202 @@
-from django.test import TestCase
+import io
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from . import media, uploads
+from .models import UploadSession
+
+
+class ChunkedUploadTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.user = User.objects.create_user(username="user0", password="password0")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def start(self, kind="video", filename="clip.MP4", size=10):
+        response = self.client.post("/api/publish/uploads/", {"kind": kind, "filename": filename, "size": size}, format="json")
+        return response, response.json().get("data")
+
+    def put(self, session_id, offset, body):
+        return self.client.put(f"/api/publish/uploads/{session_id}/", body,
+                               content_type="application/octet-stream", HTTP_UPLOAD_OFFSET=str(offset))
+
+    def test_resumable_upload(self):
+        response, data = self.start()
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(data["offset"], 0)
+        session_id = data["id"]
+
+        self.assertEqual(self.put(session_id, 0, b"0123").json()["data"]["offset"], 4)
+        # 重复发送已收到的分块：返回当前偏移，客户端据此继续
+        response = self.put(session_id, 0, b"0123")
+        self.assertEqual((response.status_code, response.json()["data"]["offset"]), (409, 4))
+        self.assertEqual(self.client.get(f"/api/publish/uploads/{session_id}/").json()["data"]["offset"], 4)
+        self.assertEqual(self.client.post(f"/api/publish/uploads/{session_id}/complete/").status_code, 409)
+
+        self.put(session_id, 4, b"456789")
+        part_inode = os.stat(uploads.temp_path(UploadSession.objects.get(pk=session_id))).st_ino
+        data = self.client.post(f"/api/publish/uploads/{session_id}/complete/").json()["data"]
+        self.assertRegex(data["url"], r"/media/uploads/videos/[0-9a-f-]+\.mp4$")
+        self.assertEqual(data["poster"], "")
+        path = UploadSession.objects.get(pk=session_id).path
+        with open(os.path.join(self.media_root, path), "rb") as f:
+            self.assertEqual(f.read(), b"0123456789")
+        self.assertEqual(os.listdir(os.path.join(self.media_root, uploads.TEMP_DIR)), [])
+        self.assertEqual(os.stat(os.path.join(self.media_root, path)).st_ino, part_inode)  # 改名移入，未复制
+        # 重复完成返回同一地址
+        self.assertEqual(self.client.post(f"/api/publish/uploads/{session_id}/complete/").json()["data"]["url"], data["url"])
+
+    def test_interrupted_chunk_keeps_received_bytes(self):
+        _, data = self.start(size=6)
+        session = UploadSession.objects.get(pk=data["id"])
+        with self.assertRaises(uploads.UploadError):
+            uploads.write_chunk(session, 0, 6, BytesIO(b"abc"))  # 连接在 3 字节后中断
+        self.assertEqual(UploadSession.objects.get(pk=session.pk).received, 3)
+        self.assertEqual(uploads.write_chunk(session, 3, 3, BytesIO(b"def")), 6)
+        with open(os.path.join(self.media_root, uploads.finalize(session)), "rb") as f:
+            self.assertEqual(f.read(), b"abcdef")
+
+    def test_finalize_copies_when_storage_has_no_local_path(self):
+        _, data = self.start(size=3)
+        session = UploadSession.objects.get(pk=data["id"])
+        uploads.write_chunk(session, 0, 3, BytesIO(b"abc"))
+        with mock.patch.object(uploads, "local_storage", return_value=False):
+            name = uploads.finalize(session)
+        with open(os.path.join(self.media_root, name), "rb") as f:
+            self.assertEqual(f.read(), b"abc")
+        self.assertFalse(os.path.exists(uploads.temp_path(session)))
+
+    def test_limits_checked_before_reading_body(self):
+        with mock.patch.dict(uploads.MAX_SIZES, {"image": 8}), mock.patch.object(uploads, "CHUNK_MAX", 4):
+            self.assertEqual(self.start(kind="image", size=9)[0].status_code, 413)
+            _, data = self.start(kind="image", size=8)
+            self.assertEqual(self.put(data["id"], 0, b"01234").status_code, 413)
+            session = UploadSession.objects.get(pk=data["id"])
+            self.assertEqual(session.received, 0)
+            self.assertEqual(os.path.getsize(uploads.temp_path(session)), 0)
+            self.assertEqual(self.start(kind="document")[0].status_code, 400)
+        other = APIClient()
+        other.force_authenticate(User.objects.create(username="user1"))
+        self.assertEqual(other.get(f"/api/publish/uploads/{data['id']}/").status_code, 404)
+
+    def test_avatar_upload_updates_profile(self):
+        _, data = self.start(kind="avatar", filename="me.png", size=3)
+        self.put(data["id"], 0, b"png")
+        avatar = self.client.post(f"/api/publish/uploads/{data['id']}/complete/").json()["data"]["avatar"]
+        self.assertIn(f"/media/avatars/{self.user.id}/", avatar)
+        self.user.profile.refresh_from_db()
+        self.assertEqual(self.user.profile.avatar, avatar)
+
+    def test_form_uploads_stream_to_storage_with_size_limit(self):
+        response = self.client.post("/api/publish/upload/image/", {"file": SimpleUploadedFile("a.jpg", b"jpeg")})
+        url = response.json()["data"]["url"]
+        self.assertRegex(url, r"/media/uploads/images/[0-9a-f-]+\.jpg$")
+        with open(os.path.join(self.media_root, url.split("/media/", 1)[1]), "rb") as f:
+            self.assertEqual(f.read(), b"jpeg")
+        with mock.patch.dict(uploads.MAX_SIZES, {"image": 10}), mock.patch.object(uploads, "MULTIPART_OVERHEAD", 0):
+            response = self.client.post("/api/publish/upload/image/", {"file": SimpleUploadedFile("a.jpg", b"x" * 11)})
+        self.assertEqual(response.status_code, 413)
+
+    def test_purge_removes_stale_sessions(self):
+        _, data = self.start()
+        _, fresh = self.start()
+        UploadSession.objects.filter(pk=data["id"]).update(updated_at=timezone.now() - timedelta(days=2))
+        path = uploads.temp_path(UploadSession.objects.get(pk=data["id"]))
+        out = StringIO()
+        call_command("purge_upload_sessions", stdout=out)
+        self.assertIn("已清理 1 个", out.getvalue())
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual([str(pk) for pk in UploadSession.objects.values_list("id", flat=True)], [fresh["id"]])
+
+
+class VideoRangeTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.data = bytes(range(256)) * 4
+        self.name = "0b7e4c1e-7d8a-4a55-9d33-2f6f0c4e8b1a.mp4"
+        os.makedirs(os.path.join(self.media_root, "uploads", "videos"))
+        for name in (self.name, "legacy.mp4"):
+            with open(os.path.join(self.media_root, "uploads", "videos", name), "wb") as f:
+                f.write(self.data)
+
+    def get(self, name=None, **headers):
+        response = self.client.get(f"/media/uploads/videos/{name or self.name}", headers=headers)
+        body = b"".join(response.streaming_content) if response.streaming else response.content
+        response.close()
+        return response, body
+
+    def test_full_file_with_validators(self):
+        response, body = self.get()
+        self.assertEqual((response.status_code, body), (200, self.data))
+        self.assertEqual(response["Content-Type"], "video/mp4")
+        self.assertEqual(response["Content-Length"], "1024")
+        self.assertEqual(response["Cache-Control"], "public, max-age=31536000, immutable")
+        self.assertEqual(self.get("legacy.mp4")[0]["Cache-Control"], "public, no-cache")
+        self.assertEqual(self.get(**{"If-None-Match": response["ETag"]})[0].status_code, 304)
+        self.assertEqual(self.get(**{"If-Modified-Since": response["Last-Modified"]})[0].status_code, 304)
+
+    def test_single_and_suffix_ranges_stream_from_offset(self):
+        response, body = self.get(Range="bytes=10-19")
+        self.assertEqual((response.status_code, body), (206, self.data[10:20]))
+        self.assertEqual(response["Content-Range"], "bytes 10-19/1024")
+        self.assertEqual(response["Content-Length"], "10")
+        self.assertEqual(self.get(Range="bytes=-5")[1], self.data[-5:])
+        self.assertEqual(self.get(Range="bytes=1000-5000")[1], self.data[1000:])
+
+    def test_range_file_keeps_descriptor_at_range_offset(self):
+        # sendfile 从底层文件的当前位置发送 Content-Length 个字节
+        with media.RangeFile(open(os.path.join(self.media_root, "uploads", "videos", self.name), "rb"), 10, 19) as f:
+            self.assertEqual(f.seek(0, io.SEEK_END), 10)
+            f.seek(0)
+            self.assertEqual(os.lseek(f.fileno(), 0, os.SEEK_CUR), 10)
+            self.assertEqual(f.read(4) + f.read(), self.data[10:20])
+            self.assertEqual(f.read(), b"")
+
+    def test_multiple_ranges(self):
+        response, body = self.get(Range="bytes=0-1, 5-6, 2-3")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(int(response["Content-Length"]), len(body))
+        boundary = response["Content-Type"].split("boundary=")[1]
+        parts = body.split(f"--{boundary}".encode())[1:-1]
+        self.assertEqual(len(parts), 2)  # 0-1 与 2-3 相邻，合并
+        self.assertIn(b"Content-Range: bytes 0-3/1024\r\n\r\n" + self.data[0:4] + b"\r\n", parts[0])
+        self.assertTrue(parts[1].endswith(b"Content-Range: bytes 5-6/1024\r\n\r\n" + self.data[5:7] + b"\r\n"))
+
+    def test_invalid_unsatisfiable_and_if_range(self):
+        response, _ = self.get(Range="bytes=2000-")
+        self.assertEqual((response.status_code, response["Content-Range"]), (416, "bytes */1024"))
+        self.assertEqual(self.get(Range="bytes=9-3")[0].status_code, 200)  # 语法不合法：忽略 Range
+        etag = self.get()[0]["ETag"]
+        self.assertEqual(self.get(Range="bytes=0-9", **{"If-Range": etag})[0].status_code, 206)
+        self.assertEqual(self.get(Range="bytes=0-9", **{"If-Range": '"stale"'})[1], self.data)
+
+    def test_suffix_range_on_empty_file_is_unsatisfiable(self):
+        open(os.path.join(self.media_root, "uploads", "videos", "empty.mp4"), "wb").close()
+        self.assertEqual(media.parse_ranges("bytes=-5", 0), [])
+        response, _ = self.get("empty.mp4", Range="bytes=-5")
+        self.assertEqual((response.status_code, response["Content-Range"]), (416, "bytes */0"))
+
+    def test_rejects_traversal_and_unsafe_methods(self):
+        self.assertEqual(self.client.get("/media/uploads/videos/..").status_code, 404)
+        self.assertEqual(self.client.get("/media/uploads/videos/missing.mp4").status_code, 404)
+        self.assertEqual(self.client.post(f"/media/uploads/videos/{self.name}").status_code, 405)
@@ -0,0 +1,214 @@
+"""
+文件上传：大小限制、流式保存与可续传的分块上传
+
+分块上传协议（/api/publish/uploads/）：
+1. POST   uploads/                     {kind, filename, size} -> 会话 id 与 offset = 0
+2. PUT    uploads/<id>/  (Upload-Offset: n)  请求体为从偏移 n 开始的一段原始字节
+3. GET    uploads/<id>/                查询已收到的偏移，断线后从该偏移继续
+4. POST   uploads/<id>/complete/       全部收到后转存到正式目录，返回访问地址
+
+分块按固定大小的块从请求流直接写入 MEDIA_ROOT/uploads/tmp/<id>.part，内存占用与文件大小无关，
+完成时改名移入正式目录（本地存储，不复制）；
+总大小与分块大小在读取请求体之前按声明值 / Content-Length 检查。连接中断时已写入的部分照样计入偏移。
+未完成的会话超过 UPLOAD_SESSION_TTL 秒未活动即视为过期，由 manage.py purge_upload_sessions 清理。
+"""
+import os
+import re
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.utils import timezone
+
+from api.derivatives import local_storage
+
+from .models import UploadSession
+
+MB = 1024 * 1024
+MAX_SIZES = {
+    'image': getattr(settings, 'UPLOAD_MAX_IMAGE_SIZE', 20 * MB),
+    'video': getattr(settings, 'UPLOAD_MAX_VIDEO_SIZE', 500 * MB),
+    'avatar': getattr(settings, 'UPLOAD_MAX_AVATAR_SIZE', 5 * MB),
+}
+CHUNK_MAX = getattr(settings, 'UPLOAD_CHUNK_MAX_SIZE', 8 * MB)
+SESSION_TTL = getattr(settings, 'UPLOAD_SESSION_TTL', 24 * 3600)
+MAX_ACTIVE = getattr(settings, 'UPLOAD_MAX_ACTIVE_SESSIONS', 10)
+
+BLOCK = 64 * 1024  # 每次从请求流读取 / 写入的字节数
+MULTIPART_OVERHEAD = 64 * 1024  # 表单上传时 Content-Length 中除文件外的部分
+TEMP_DIR = os.path.join('uploads', 'tmp')
+DIRS = {
+    'image': os.path.join('uploads', 'images'),
+    'video': os.path.join('uploads', 'videos'),
+    'avatar': 'avatars',
+}
+_EXTENSION = re.compile(r'\.[a-z0-9]{1,10}')
+
+
+class UploadError(Exception):
+    """上传请求不合法；status 为返回的 HTTP 状态码"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def check_size(kind, size):
+    limit = MAX_SIZES[kind]
+    if size > limit:
+        raise UploadError(f'文件过大，上限为 {limit // MB} MB', 413)
+
+
+def check_request_size(request, kind):
+    """表单上传：按 Content-Length 在解析请求体之前拒绝过大的文件"""
+    try:
+        length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        length = 0
+    check_size(kind, max(length - MULTIPART_OVERHEAD, 0))
+
+
+def storage_name(kind, user_id, filename):
+    """正式目录中的存储路径：随机文件名 + 原扩展名（头像按用户分目录）"""
+    extension = os.path.splitext(filename or '')[1].lower()
+    if not _EXTENSION.fullmatch(extension):
+        extension = ''
+    directory = os.path.join(DIRS[kind], str(user_id)) if kind == 'avatar' else DIRS[kind]
+    return os.path.join(directory, f'{uuid.uuid4()}{extension}')
+
+
+def save_file(kind, user_id, uploaded_file):
+    """保存表单上传的文件（按块写入存储，不整体读入内存），返回存储路径"""
+    return default_storage.save(storage_name(kind, user_id, uploaded_file.name), uploaded_file)
+
+
+# --------------- 分块上传 ---------------
+
+def temp_path(session):
+    return os.path.join(settings.MEDIA_ROOT, TEMP_DIR, f'{session.pk}.part')
+
+
+def active_sessions(user):
+    since = timezone.now() - timedelta(seconds=SESSION_TTL)
+    return UploadSession.objects.filter(user=user, completed_at__isnull=True, updated_at__gte=since)
+
+
+def create_session(user, kind, filename, size):
+    if kind not in MAX_SIZES:
+        raise UploadError('不支持的上传类型')
+    try:
+        size = int(size)
+    except (TypeError, ValueError):
+        raise UploadError('请提供文件大小')
+    if size <= 0:
+        raise UploadError('请提供文件大小')
+    check_size(kind, size)
+    if active_sessions(user).count() >= MAX_ACTIVE:
+        raise UploadError('进行中的上传过多，请稍后再试', 429)
+    session = UploadSession.objects.create(user=user, kind=kind, filename=(filename or '')[:255], size=size)
+    path = temp_path(session)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open(path, 'wb').close()
+    return session
+
+
+def write_chunk(session, offset, length, stream):
+    """把请求流中从 offset 开始的 length 字节写入临时文件，返回新的偏移"""
+    if session.completed_at is not None:
+        raise UploadError('上传已完成', 409)
+    if offset != session.received:
+        raise UploadError('偏移不一致，请先查询当前偏移', 409)
+    if length is None:
+        raise UploadError('请提供 Content-Length', 411)
+    if length > CHUNK_MAX:
+        raise UploadError(f'分块过大，上限为 {CHUNK_MAX // MB} MB', 413)
+    if offset + length > session.size:
+        raise UploadError('分块超出声明的文件大小', 413)
+    try:
+        file = open(temp_path(session), 'r+b')
+    except FileNotFoundError:
+        raise UploadError('上传会话已过期', 410)
+
+    written = 0
+    with file:
+        file.seek(offset)
+        while written < length:
+            block = stream.read(min(BLOCK, length - written)) if stream is not None else b''
+            if not block:
+                break  # 连接中断：已写入的部分照样计入偏移
+            file.write(block)
+            written += len(block)
+        file.flush()
+        os.fsync(file.fileno())
+
+    # 按旧偏移条件更新，同一会话的并发写入只有一个生效
+    updated = UploadSession.objects.filter(pk=session.pk, received=offset, completed_at__isnull=True).update(
+        received=offset + written, updated_at=timezone.now(),
+    )
+    if not updated:
+        session.refresh_from_db(fields=['received', 'completed_at'])
+        raise UploadError('分块与其他请求冲突，请先查询当前偏移', 409)
+    session.received = offset + written
+    if written < length:
+        raise UploadError('分块不完整，请从当前偏移继续', 400)
+    return session.received
+
+
+def finalize(session):
+    """全部收到后把临时文件转存到正式目录，返回存储路径（重复调用返回同一路径）"""
+    if session.completed_at is not None:
+        return session.path
+    if session.received != session.size:
+        raise UploadError('文件尚未上传完整', 409)
+    now = timezone.now()
+    # 先占用会话，避免并发的完成请求重复转存
+    if not UploadSession.objects.filter(pk=session.pk, completed_at__isnull=True).update(completed_at=now):
+        session.refresh_from_db()
+        if not session.path:
+            raise UploadError('上传正在完成，请稍后查询', 409)
+        return session.path
+    try:
+        name = _move_to_storage(temp_path(session), storage_name(session.kind, session.user_id, session.filename))
+    except Exception:
+        UploadSession.objects.filter(pk=session.pk).update(completed_at=None)
+        raise
+    UploadSession.objects.filter(pk=session.pk).update(path=name)
+    session.path, session.completed_at = name, now
+    return name
+
+
+def _move_to_storage(path, name):
+    """
+    把临时文件转存为 name，返回实际的存储路径。
+    本地文件存储时临时文件与正式目录同在 MEDIA_ROOT 下：os.replace 原子改名，不再复制一遍；
+    其他存储（对象存储等）退回按块复制后删除临时文件
+    """
+    if not local_storage():
+        with open(path, 'rb') as file:
+            name = default_storage.save(name, File(file))
+        os.remove(path)
+        return name
+    # 文件名含随机 UUID，get_available_name 只在极少数冲突时改名
+    name = default_storage.get_available_name(name)
+    target = default_storage.path(name)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    os.replace(path, target)
+    if settings.FILE_UPLOAD_PERMISSIONS is not None:
+        os.chmod(target, settings.FILE_UPLOAD_PERMISSIONS)
+    return name
+
+
+def purge(ttl=None):
+    """删除超过 ttl 秒未活动的会话（未完成的连同临时文件），返回删除的会话数"""
+    ttl = SESSION_TTL if ttl is None else ttl
+    stale = UploadSession.objects.filter(updated_at__lt=timezone.now() - timedelta(seconds=ttl))
+    for session in stale.filter(completed_at__isnull=True).only('id'):
+        try:
+            os.remove(temp_path(session))
+        except FileNotFoundError:
+            pass
+    deleted, _ = stale.delete()
+    return deleted
@@ -3,6 +3,9 @@ from .views import (
     create_post,
     upload_image,
     upload_video,
+    create_upload,
+    upload_chunk,
+    complete_upload,
     get_common_tags,
     create_tag,
     get_current_user,
@@ -14,6 +17,10 @@ urlpatterns = [
     # 文件上传接口
     path('upload/image/', upload_image, name='upload-image'),
     path('upload/video/', upload_video, name='upload-video'),
+    # 分块上传（可续传）
+    path('uploads/', create_upload, name='create-upload'),
+    path('uploads/<uuid:session_id>/', upload_chunk, name='upload-chunk'),
+    path('uploads/<uuid:session_id>/complete/', complete_upload, name='complete-upload'),
     # 标签相关接口
     path('tags/common/', get_common_tags, name='get-common-tags'),
     path('tags/', create_tag, name='create-tag'),
@@ -1,26 +1,31 @@
-import os
-import uuid
 import json
 import re
 from django.conf import settings
-from django.http import JsonResponse, FileResponse, Http404, HttpResponse
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import Http404
+from django.utils._os import safe_join
+from django.views.decorators.http import require_safe
 from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from django.contrib.auth.models import User
 from django.core.files.storage import default_storage
-from django.core.files.base import ContentFile
+from django.db import transaction
+from api import derivatives, tags as tag_registry
 from api.models import Post, Tag
 from api.serializers import PostSerializer
 from .serializers import CreatePostSerializer, CreateTagSerializer, CurrentUserSerializer
+from . import media, uploads
+from .apps import COMMON_TAGS
+from .models import UploadSession
 
 @api_view(['GET', 'POST'])
 @permission_classes([IsAuthenticated])
 def create_post(request):
     """发布动态接口，GET 返回当前用户自己的帖子列表"""
     if request.method == 'GET':
-        posts = Post.objects.filter(user=request.user).order_by('-created_at')
+        posts = Post.objects.filter(user=request.user).select_related('user__profile').order_by('-created_at')
         # 清理历史数据中的伪 poster，防止 404，并去重 media
         cleaned = []
         def dedupe(seq):
@@ -88,20 +93,16 @@ def create_post(request):
             if video_poster:
                 media.append(video_poster)
         
-        # 创建动态
-        post = Post.objects.create(
-            user=user,
-            text=validated_data.get('text', ''),
-            type=post_type,
-            media=media,
-            visibility=visibility
-        )
-        
-        # 处理标签
-        tags = validated_data.get('tags', [])
-        for tag_name in tags:
-            tag, created = Tag.objects.get_or_create(name=tag_name.strip())
-            post.tags.add(tag)
+        # 创建动态并批量挂载标签（同一事务，查询数与标签个数无关）
+        with transaction.atomic():
+            post = Post.objects.create(
+                user=user,
+                text=validated_data.get('text', ''),
+                type=post_type,
+                media=media,
+                visibility=visibility
+            )
+            tag_registry.attach(post, validated_data.get('tags', []))
         
         # 序列化返回结果（统一使用 api.Post）
         post_serializer = PostSerializer(post, context={'request': request})
@@ -119,73 +120,35 @@ def create_post(request):
     }, status=status.HTTP_400_BAD_REQUEST)
 
 
+@require_safe
 def serve_video_file(request, filename):
-    """开发环境下的视频文件 Range 支持，手动处理 206 Partial Content"""
-    file_path = os.path.join(settings.MEDIA_ROOT, 'uploads', 'videos', filename)
-    print(f"[serve_video_file] 尝试访问: {file_path}")
-    
-    if not os.path.exists(file_path):
-        raise Http404("Video file not found.")
-    
-    # 获取文件大小
-    file_size = os.path.getsize(file_path)
-    
-    # 处理 Range 请求
-    range_header = request.META.get('HTTP_RANGE', '')
-    if range_header:
-        # 解析 Range 头: "bytes=start-end"
-        range_match = re.match(r'bytes=(\d+)-(\d*)', range_header)
-        if range_match:
-            start = int(range_match.group(1))
-            end = range_match.group(2)
-            end = int(end) if end else file_size - 1
-            
-            # 验证范围
-            if start >= file_size or end >= file_size or start > end:
-                return JsonResponse({'error': 'Invalid Range'}, status=416)
-            
-            # 读取指定范围的内容
-            content_length = end - start + 1
-            file = open(file_path, 'rb')
-            file.seek(start)
-            content = file.read(content_length)
-            file.close()
-            
-            # 返回 206 Partial Content 响应
-            response = HttpResponse(content, status=206, content_type='video/mp4')
-            response['Content-Range'] = f'bytes {start}-{end}/{file_size}'
-            response['Content-Length'] = str(content_length)
-            response['Accept-Ranges'] = 'bytes'
-            print(f"[serve_video_file] 返回 206 Partial Content: {start}-{end}/{file_size}")
-            return response
-    
-    # 没有 Range 请求或格式错误，返回整个文件
-    response = FileResponse(open(file_path, 'rb'), content_type='video/mp4')
-    response['Content-Length'] = str(file_size)
-    response['Accept-Ranges'] = 'bytes'
-    print(f"[serve_video_file] 返回 200 OK，文件大小: {file_size}")
-    return response
+    """视频文件的范围请求服务（拖动进度条时按需读取，见 publish/media.py）"""
+    try:
+        path = safe_join(settings.MEDIA_ROOT, 'uploads', 'videos', filename)
+    except SuspiciousFileOperation:
+        raise Http404('Video file not found.')
+    return media.serve(request, path)
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def upload_image(request):
-    """图片上传接口"""
+    """图片上传接口（大文件请使用分块上传 /api/publish/uploads/）"""
+    try:
+        # 在解析请求体之前按 Content-Length 拒绝过大的文件
+        uploads.check_request_size(request, 'image')
+    except uploads.UploadError as e:
+        return Response({'success': False, 'message': e.message}, status=e.status)
+
     if 'file' not in request.FILES:
         return Response({
             'success': False,
             'message': '请提供图片文件'
         }, status=status.HTTP_400_BAD_REQUEST)
     
-    file = request.FILES['file']
-    
-    # 生成唯一文件名
-    file_extension = os.path.splitext(file.name)[1]
-    filename = f"{uuid.uuid4()}{file_extension}"
-    
-    # 保存文件并构建绝对 URL
-    file_content = ContentFile(file.read())
-    default_storage.save(os.path.join('uploads', 'images', filename), file_content)
-    file_url = request.build_absolute_uri(f"/media/uploads/images/{filename}")
+    # 以随机文件名按块写入存储，不整体读入内存
+    name = uploads.save_file('image', request.user.id, request.FILES['file'])
+    derivatives.schedule(name)  # 后台生成缩略图 / WebP，不等待
+    file_url = request.build_absolute_uri(default_storage.url(name))
     
     return Response({
         'success': True,
@@ -197,23 +160,20 @@ def upload_image(request):
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def upload_video(request):
-    """视频上传接口"""
+    """视频上传接口（大文件请使用分块上传 /api/publish/uploads/）"""
+    try:
+        uploads.check_request_size(request, 'video')
+    except uploads.UploadError as e:
+        return Response({'success': False, 'message': e.message}, status=e.status)
+
     if 'file' not in request.FILES:
         return Response({
             'success': False,
             'message': '请提供视频文件'
         }, status=status.HTTP_400_BAD_REQUEST)
     
-    file = request.FILES['file']
-    
-    # 生成唯一文件名
-    file_extension = os.path.splitext(file.name)[1]
-    filename = f"{uuid.uuid4()}{file_extension}"
-    
-    # 保存文件并构建绝对 URL
-    file_content = ContentFile(file.read())
-    default_storage.save(os.path.join('uploads', 'videos', filename), file_content)
-    file_url = request.build_absolute_uri(f"/media/uploads/videos/{filename}")
+    name = uploads.save_file('video', request.user.id, request.FILES['file'])
+    file_url = request.build_absolute_uri(default_storage.url(name))
     
     # 视频封面URL：当前未生成实际封面，返回空字符串避免404
     video_poster_url = ''
@@ -226,20 +186,93 @@ def upload_video(request):
         }
     }, status=status.HTTP_201_CREATED)
 
+def _upload_error(e, session=None):
+    body = {'success': False, 'message': e.message}
+    if session is not None:
+        body['data'] = {'offset': session.received}
+    return Response(body, status=e.status)
+
+
+def _upload_state(session):
+    return {
+        'id': str(session.id),
+        'kind': session.kind,
+        'size': session.size,
+        'offset': session.received,
+        'completed': session.completed_at is not None,
+        'chunkSize': uploads.CHUNK_MAX,
+    }
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def create_upload(request):
+    """创建分块上传会话：{kind: image/video/avatar, filename, size}"""
+    try:
+        session = uploads.create_session(
+            request.user, request.data.get('kind'), request.data.get('filename', ''), request.data.get('size'),
+        )
+    except uploads.UploadError as e:
+        return _upload_error(e)
+    return Response({'success': True, 'data': _upload_state(session)}, status=status.HTTP_201_CREATED)
+
+
+@api_view(['GET', 'PUT'])
+@permission_classes([IsAuthenticated])
+def upload_chunk(request, session_id):
+    """GET 查询当前偏移；PUT 写入从 Upload-Offset 开始的一段原始字节（不经过解析器，按块流式写盘）"""
+    session = UploadSession.objects.filter(pk=session_id, user=request.user).first()
+    if session is None:
+        raise Http404('上传会话不存在')
+    if request.method == 'GET':
+        return Response({'success': True, 'data': _upload_state(session)})
+
+    offset = request.META.get('HTTP_UPLOAD_OFFSET', request.query_params.get('offset', ''))
+    length = request.META.get('CONTENT_LENGTH')
+    if not str(offset).isdigit() or (length and not length.isdigit()):
+        return _upload_error(uploads.UploadError('请提供合法的 Upload-Offset 与 Content-Length'), session)
+    try:
+        # 大小与偏移在读取请求体之前检查
+        uploads.write_chunk(session, int(offset), int(length) if length else None, request.stream)
+    except uploads.UploadError as e:
+        return _upload_error(e, session)
+    return Response({'success': True, 'data': _upload_state(session)})
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def complete_upload(request, session_id):
+    """全部分块收到后完成上传，返回与表单上传接口相同的数据（头像同时更新到个人资料）"""
+    session = UploadSession.objects.filter(pk=session_id, user=request.user).first()
+    if session is None:
+        raise Http404('上传会话不存在')
+    try:
+        name = uploads.finalize(session)
+    except uploads.UploadError as e:
+        return _upload_error(e, session)
+
+    if session.kind in ('image', 'avatar'):
+        derivatives.schedule(name)
+    file_url = request.build_absolute_uri(default_storage.url(name))
+    data = {'url': file_url}
+    if session.kind == 'video':
+        data['poster'] = ''  # 当前未生成实际封面
+    elif session.kind == 'avatar':
+        profile = getattr(request.user, 'profile', None)
+        if profile:
+            profile.avatar = file_url
+            profile.save()
+        data['avatar'] = file_url
+    return Response({'success': True, 'data': data})
+
+
 @api_view(['GET'])
 def get_common_tags(request):
-    """获取常用标签接口"""
-    # 定义一些常用标签
-    common_tags = ['户外', '日常', '美食', '旅行', '运动', '摄影', '读书', '音乐', '电影', '宠物', '工作', '学习']
-    
-    # 确保这些标签存在于数据库中
-    for tag_name in common_tags:
-        Tag.objects.get_or_create(name=tag_name)
-    
+    """获取常用标签接口（标签由数据迁移/post_migrate 预先创建，这里只读）"""
     return Response({
         'success': True,
         'data': {
-            'tags': common_tags
+            'tags': COMMON_TAGS
         }
     })
 
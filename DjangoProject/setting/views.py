@@ -6,10 +6,9 @@ from rest_framework.authtoken.models import Token
 from django.contrib.auth import authenticate
 from django.contrib.auth.models import User
 from django.core.files.storage import default_storage
-from django.core.files.base import ContentFile
-from django.conf import settings
-import os
 
+from publish import uploads
+from api import derivatives
 from api.serializers import UserSerializer, UserUpdateSerializer, PasswordChangeSerializer
 
 
@@ -42,15 +41,20 @@ def me(request):
 @permission_classes([IsAuthenticated])
 def upload_avatar(request):
     """上传头像并返回可访问URL"""
+    try:
+        # 在解析请求体之前按 Content-Length 拒绝过大的文件
+        uploads.check_request_size(request, "avatar")
+    except uploads.UploadError as e:
+        return Response({"error": e.message}, status=e.status)
+
     file_obj = request.FILES.get("file")
     if not file_obj:
         return Response({"error": "未收到文件"}, status=status.HTTP_400_BAD_REQUEST)
 
-    # 统一存储到 media/avatars/<user_id>/filename
-    user_id = request.user.id
-    avatars_dir = os.path.join("avatars", str(user_id))
-    filename = default_storage.save(os.path.join(avatars_dir, file_obj.name), ContentFile(file_obj.read()))
-    avatar_url = request.build_absolute_uri(settings.MEDIA_URL + filename)
+    # 统一存储到 media/avatars/<user_id>/<随机文件名>，按块写入，不整体读入内存
+    filename = uploads.save_file("avatar", request.user.id, file_obj)
+    derivatives.schedule(filename)  # 后台生成缩略图 / WebP，不等待
+    avatar_url = request.build_absolute_uri(default_storage.url(filename))
 
     # 保存到用户资料
     profile = getattr(request.user, "profile", None)